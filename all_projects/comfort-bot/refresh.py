@@ -0,0 +1,269 @@
+"""
+Headless replacement for auto_refresh.py
+
+auto_refresh.py (and yn_bot/yn.py for all sites) drives Chrome through the
+dashboard, clicking every refresh button in turn and sleeping 20-25 seconds
+between devices. This script does the same work without a browser:
+
+  http    log in like the browser does, read the refresh buttons from
+          site_details2.php and call the refresh backend for every site,
+          a few at a time
+  poller  skip the dashboard and poll the DVRs directly with hikvisionapi,
+          writing the rows the refresh backend writes (dvr_activity)
+
+Examples:
+  python refresh.py http --refresh-url "http://192.168.100.38:8080/dvr/refresh.php?atmid={atmid}"
+  python refresh.py http --type all_sites --refresh-url "..." --concurrency 8
+  python refresh.py poller devices.csv --dsn "host=192.168.100.23 dbname=esurv user=postgres"
+"""
+import argparse
+import asyncio
+import collections
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+
+import requests
+
+# Configuration
+BASE_URL = "http://192.168.100.38:8080/dvr/"
+LOGIN_URL = BASE_URL + "login.php"
+TARGET_URL = BASE_URL + "site_details2.php?type={type}"
+USERNAME = "aniruddh"
+PASSWORD = "root"
+CONCURRENCY = 8  # Refreshes running at once
+PER_SITE = 1  # Refreshes running at once against the same site
+SITE_INTERVAL = 20  # Minimum seconds between two refreshes of the same site
+REFRESH_TIMEOUT = 60  # Max seconds to wait for one refresh to complete
+POLL_TIMEOUT = 5  # Seconds per ISAPI request in poller mode, as hikvisionapi.poller
+PROGRESS_EVERY = 5  # Seconds between progress lines
+
+
+class RefreshButtons(HTMLParser):
+    """Collect the data-* attributes of every refresh_btn on the page"""
+
+    def __init__(self):
+        super().__init__()
+        self.buttons = []
+        self.has_table = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if attrs.get('id') == 'atmTable':
+            self.has_table = True
+        if 'refresh_btn' in (attrs.get('class') or '').split():
+            self.buttons.append({
+                name[5:]: value or '' for name, value in attrs.items() if name.startswith('data-')
+            })
+
+
+class SiteLimiter:
+    """At most ``per_site`` refreshes per site, started ``interval`` seconds apart"""
+
+    def __init__(self, per_site=PER_SITE, interval=SITE_INTERVAL):
+        self.per_site = per_site
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.next_start = {}
+
+    def acquire(self, site):
+        with self.lock:
+            slot = self.slots.setdefault(site, threading.Semaphore(self.per_site))
+        slot.acquire()
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start.get(site, now))
+            self.next_start[site] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self, site):
+        self.slots[site].release()
+
+
+class Progress:
+    """Print done/total, failures, rate and ETA every ``every`` seconds"""
+
+    def __init__(self, total, every=PROGRESS_EVERY, stream=sys.stderr):
+        self.total = total
+        self.every = every
+        self.stream = stream
+        self.done = self.failed = 0
+        self.started = self.last = time.monotonic()
+
+    def update(self, ok):
+        self.done += 1
+        self.failed += not ok
+        now = time.monotonic()
+        if now - self.last >= self.every or self.done == self.total:
+            self.last = now
+            self.report(now)
+
+    def report(self, now=None):
+        elapsed = (now or time.monotonic()) - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        eta = (self.total - self.done) / rate if rate else 0.0
+        print(f"[{self.done:>{len(str(self.total))}}/{self.total}] "
+              f"{100.0 * self.done / max(self.total, 1):5.1f}%  ok {self.done - self.failed}  "
+              f"failed {self.failed}  {rate:.2f}/s  elapsed {format_seconds(elapsed)}  "
+              f"ETA {format_seconds(eta)}", file=self.stream, flush=True)
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def interleave(buttons, site_of):
+    """Order buttons round-robin by site so workers do not queue behind one site"""
+    by_site = collections.OrderedDict()
+    for button in buttons:
+        by_site.setdefault(site_of(button), []).append(button)
+    queues = list(by_site.values())
+    ordered = []
+    while queues:
+        ordered.extend(queue.pop(0) for queue in queues)
+        queues = [queue for queue in queues if queue]
+    return ordered
+
+
+def login(session, username, password, target_url):
+    """Log in and return the refresh buttons on the target page"""
+    response = session.post(LOGIN_URL, data={'username': username, 'password': password},
+                            timeout=REFRESH_TIMEOUT)
+    response.raise_for_status()
+    response = session.get(target_url, timeout=REFRESH_TIMEOUT)
+    response.raise_for_status()
+    page = RefreshButtons()
+    page.feed(response.text)
+    if not page.has_table:
+        raise RuntimeError(f"Login failed, {target_url} has no atmTable")
+    return page.buttons
+
+
+def refresh_one(session, args, button):
+    """Call the refresh backend for one button, return (ok, detail)"""
+    url = args.refresh_url.format(**button)
+    if args.method == 'POST':
+        response = session.post(url, data=button, timeout=args.timeout)
+    else:
+        response = session.get(url, timeout=args.timeout)
+    if response.status_code != 200:
+        return False, f"HTTP {response.status_code}"
+    try:
+        body = response.json()
+    except ValueError:
+        return True, response.text.strip()[:80]
+    if isinstance(body, dict) and (body.get('success') is False or body.get('status') == 'error'):
+        return False, str(body.get('message') or body.get('error') or body)[:80]
+    return True, str(body.get('status', 'ok') if isinstance(body, dict) else body)[:80]
+
+
+def run_http(args):
+    session = requests.Session()
+    print("Logging in...", file=sys.stderr)
+    buttons = login(session, args.username, args.password, TARGET_URL.format(type=args.type))
+    buttons = [button for button in buttons if button.get(args.site_key)]
+    print(f"Found {len(buttons)} devices to refresh", file=sys.stderr)
+
+    limiter = SiteLimiter(args.per_site, args.site_interval)
+    progress = Progress(len(buttons), args.progress_every)
+    local = threading.local()
+
+    def task(button):
+        # requests.Session is not thread-safe, every worker gets its own with the login cookies
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            local.session.cookies.update(session.cookies)
+        site = button[args.site_key]
+        limiter.acquire(site)
+        try:
+            return refresh_one(local.session, args, button)
+        except requests.RequestException as e:
+            return False, str(e) or type(e).__name__
+        finally:
+            limiter.release(site)
+
+    failed = 0
+    ordered = interleave(buttons, lambda button: button[args.site_key])
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = {executor.submit(task, button): button for button in ordered}
+        for future in as_completed(futures):
+            ok, detail = future.result()
+            button = futures[future]
+            failed += not ok
+            progress.update(ok)
+            print(json.dumps({**button, 'ok': ok, 'detail': detail}), flush=True)
+    return 1 if failed == len(buttons) and buttons else 0
+
+
+def run_poller(args):
+    from hikvisionapi.poller import load_devices, poll_fleet
+
+    devices = load_devices(args.devices)
+    progress = Progress(len(devices), args.progress_every)
+    sink = None
+    if args.dsn:
+        from hikvisionapi.sink import ResultSink
+        sink = ResultSink(args.dsn, table=args.table)
+
+    async def run():
+        async for result in poll_fleet(devices, concurrency=args.concurrency, timeout=args.isapi_timeout,
+                                       deadline=args.deadline):
+            progress.update(result['status'] != 'ERROR')
+            if sink is not None:
+                # Waits off the loop when the database falls behind, so polls keep running
+                await sink.aput(result)
+            else:
+                print(json.dumps(result), flush=True)
+
+    try:
+        asyncio.run(run())
+    finally:
+        if sink is not None:
+            sink.close()
+            print(', '.join(f"{name}: {count}" for name, count in sink.stats.items()), file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refresh DVR sites without a browser')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='Refreshes running at once')
+    parser.add_argument('--timeout', type=float, default=REFRESH_TIMEOUT, help='Seconds per refresh request (http mode)')
+    parser.add_argument('--progress-every', type=float, default=PROGRESS_EVERY,
+                        help='Seconds between progress lines on stderr')
+    modes = parser.add_subparsers(dest='mode', required=True)
+
+    http = modes.add_parser('http', help='Call the dashboard refresh backend for every refresh button')
+    http.add_argument('--refresh-url', required=True,
+                      help='Refresh endpoint, formatted with the button data-* attributes, e.g. ...?atmid={atmid}')
+    http.add_argument('--method', choices=('GET', 'POST'), default='GET',
+                      help='POST sends the data-* attributes as form fields')
+    http.add_argument('--type', default='dvr_offline', help='site_details2.php list (dvr_offline, all_sites)')
+    http.add_argument('--username', default=USERNAME)
+    http.add_argument('--password', default=PASSWORD)
+    http.add_argument('--site-key', default='atmid', help='data-* attribute that identifies a site')
+    http.add_argument('--per-site', type=int, default=PER_SITE, help='Refreshes at once against one site')
+    http.add_argument('--site-interval', type=float, default=SITE_INTERVAL,
+                      help='Minimum seconds between refreshes of the same site')
+
+    poller = modes.add_parser('poller', help='Poll the DVRs directly with hikvisionapi')
+    poller.add_argument('devices', help='Device list (CSV or JSON) as taken by hikvisionapi.poller')
+    poller.add_argument('--isapi-timeout', type=float, default=POLL_TIMEOUT, help='Seconds per ISAPI request')
+    poller.add_argument('--deadline', type=float, default=15, help='Total seconds per device')
+    poller.add_argument('--dsn', help='Write results to PostgreSQL instead of printing NDJSON')
+    poller.add_argument('--table', default='dvr_activity')
+
+    args = parser.parse_args(argv)
+    if args.mode == 'http':
+        return run_http(args)
+    return run_poller(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
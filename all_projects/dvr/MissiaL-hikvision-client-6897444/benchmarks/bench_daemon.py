@@ -0,0 +1,76 @@
+"""
+Spawn-per-call against the resident daemon
+
+Polls a local fake DVR once per call, either by starting a fresh
+``python -m hikvisionapi.poller`` process the way the PHP layer spawns
+``hik_py/test_hikvision.py``, or through a running ``hikvisionapi.daemon``.
+
+    python benchmarks/bench_daemon.py [--calls 20]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from hikvisionapi.daemon import DaemonClient  # noqa: E402
+from hikvisionapi.fakedvr import FakeDVR  # noqa: E402
+
+
+def spawn_call(device):
+    output = subprocess.run(
+        [sys.executable, '-m', 'hikvisionapi.poller', '-', '--format', 'ndjson'],
+        input=json.dumps(device), capture_output=True, text=True, cwd=ROOT, check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def measure(call, device, calls):
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        result = call(device)
+        timings.append(time.perf_counter() - started)
+        assert result['status'] == 'ONLINE', result
+    timings.sort()
+    return timings
+
+
+def report(name, timings):
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{name:<16} mean {statistics.mean(timings) * 1000:8.2f} ms"
+          f"   p50 {statistics.median(timings) * 1000:8.2f} ms   p99 {p99 * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20)
+    args = parser.parse_args()
+
+    with FakeDVR().run_in_thread() as dvr:
+        device = {'ip': dvr.host, 'port': dvr.port, 'username': 'admin', 'password': 'admin'}
+        report('spawn per call', measure(spawn_call, device, args.calls))
+
+        path = os.path.join(tempfile.mkdtemp(), 'daemon.sock')
+        daemon = subprocess.Popen([sys.executable, '-m', 'hikvisionapi.daemon', '--socket', path], cwd=ROOT)
+        try:
+            while not os.path.exists(path):
+                time.sleep(0.05)
+            with DaemonClient(path) as client:
+                # The first poll pays for authentication and opening connections
+                report('daemon (cold)', measure(client.poll, device, 1))
+                report('daemon (warm)', measure(client.poll, device, args.calls))
+                client.call('shutdown')
+        finally:
+            daemon.wait(10)
+
+
+if __name__ == '__main__':
+    main()
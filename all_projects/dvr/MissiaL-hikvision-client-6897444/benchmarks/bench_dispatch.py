@@ -0,0 +1,86 @@
+"""
+Cost of getting from ``client.System.Video.inputs.channels(...)`` to a URL
+
+The transport is replaced by a stub that returns a canned response, so only
+the dispatch is timed: the previous DynamicMethod (a new object per segment
+and a join plus urljoin per call) against the cached chain and ``call()``.
+
+    python benchmarks/bench_dispatch.py --calls 200000
+"""
+
+import argparse
+import os
+import sys
+import time
+from urllib.parse import urljoin
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from hikvisionapi import AuthCache, Client  # noqa: E402
+from hikvisionapi.authcache import BASIC  # noqa: E402
+
+
+class StubResponse:
+    text = '<DeviceStatus><status>ok</status></DeviceStatus>'
+
+
+class LegacyDynamicMethod:
+    """DynamicMethod and URL building as they were before caching"""
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+
+    def __getattr__(self, key):
+        return LegacyDynamicMethod(self.client, '/'.join((self.path, key)))
+
+    def __getitem__(self, item):
+        return LegacyDynamicMethod(self.client, self.path + "/" + str(item))
+
+    def __call__(self, **kwargs):
+        url_path = [self.client.isapi_prefix, self.path]
+        full_url = urljoin(self.client.host, "/".join(url_path))
+        data = dict(kwargs)
+        method = data.pop('method')
+        present = data.pop('present', 'dict')
+        data.pop('type', '')
+        return self.client._parse(self.path, self.client.common_request(method, full_url, **data), present)
+
+
+def stub_client():
+    cache = AuthCache()
+    cache.set('http://10.0.0.1', 'admin', BASIC)
+    client = Client('http://10.0.0.1', 'admin', 'admin', auth_cache=cache)
+    client.common_request = lambda method, full_url, **data: StubResponse
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=200000)
+    args = parser.parse_args()
+    client = stub_client()
+
+    def legacy():
+        return LegacyDynamicMethod(client, 'System').Video.inputs.channels[1](method='get', present='text')
+
+    def dynamic():
+        return client.System.Video.inputs.channels[1](method='get', present='text')
+
+    def call():
+        return client.call('System/Video/inputs/channels/1', present='text')
+
+    results = {}
+    for name, run in (('legacy DynamicMethod', legacy), ('cached DynamicMethod', dynamic), ('call()', call)):
+        assert run() == StubResponse.text
+        started = time.perf_counter()
+        for _ in range(args.calls):
+            run()
+        results[name] = (time.perf_counter() - started) / args.calls
+    baseline = results['legacy DynamicMethod']
+    for name, elapsed in results.items():
+        print(f"{name:<22} {elapsed * 1e9:8.0f} ns/call   x{baseline / elapsed:5.2f}")
+
+
+if __name__ == '__main__':
+    main()
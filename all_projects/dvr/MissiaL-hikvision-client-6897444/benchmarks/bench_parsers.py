@@ -0,0 +1,67 @@
+"""
+Micro-benchmark of the ISAPI XML parser engines
+
+Compares the legacy json.loads(json.dumps(xmltodict.parse(...))) round-trip
+with every engine in hikvisionapi.parsers and with targeted field extraction,
+on DeviceInfo, channel-list and storage payloads.
+
+    python benchmarks/bench_parsers.py [--number 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import xmltodict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from hikvisionapi import parsers  # noqa: E402
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'fixtures', 'isapi')
+
+PAYLOADS = {
+    'deviceInfo': ('deviceInfo.xml', ('firmwareVersion', 'model', 'serialNumber')),
+    'channels': ('channels.xml', ('VideoInputChannel/id/videoInputEnabled/resDesc',)),
+    'storage': ('storage.xml', ('hdd/id/status/capacity/freeSpace',)),
+}
+
+
+def legacy(data):
+    return json.loads(json.dumps(xmltodict.parse(data)))
+
+
+def candidates(paths):
+    yield 'legacy round-trip', legacy
+    yield 'xmltodict', lambda data: parsers.parse_xml(data, 'xmltodict')
+    yield 'etree', lambda data: parsers.parse_xml(data, 'etree')
+    if parsers.lxml_etree is not None:
+        yield 'lxml', lambda data: parsers.parse_xml(data, 'lxml')
+    yield 'extract etree', lambda data: parsers.extract(data, *paths)
+    if parsers.lxml_etree is not None:
+        yield 'extract lxml', lambda data: parsers.extract(data, *paths, engine='lxml')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--number', type=int, default=2000, help='Parses per measurement')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='Measurements, best one is reported')
+    args = arg_parser.parse_args()
+
+    reference = None
+    for name, (filename, paths) in PAYLOADS.items():
+        with open(os.path.join(PAYLOAD_DIR, filename), 'rb') as fd:
+            data = fd.read()
+        print(f"\n{name} ({len(data)} bytes)")
+        for label, func in candidates(paths):
+            best = min(timeit.repeat(lambda: func(data), number=args.number, repeat=args.repeat))
+            per_call = best / args.number * 1e6
+            if label == 'legacy round-trip':
+                reference = per_call
+            print(f"  {label:<20} {per_call:9.1f} us/parse  {reference / per_call:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Fleet sweep throughput with 1, 2, 4 ... worker processes
+
+Starts fake DVR servers in separate processes (so they do not share the
+sweep's cores), then sweeps the same virtual fleet with a single-process
+``poll_fleet`` and with ``ShardedSweep`` at each shard count. Speed-up is
+bounded by the cores left over for the sweep once the servers have theirs.
+
+    python benchmarks/bench_shard.py --devices 2000 --shards 1,2,4 --servers 2
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from hikvisionapi.fakedvr import loopback_hosts  # noqa: E402
+from hikvisionapi.poller import poll_fleet  # noqa: E402
+from hikvisionapi.shard import ShardedSweep  # noqa: E402
+from loadtest import free_port, start_server  # noqa: E402
+
+
+def devices(count, ports):
+    return [
+        {'ip': host, 'port': ports[number % len(ports)], 'username': 'admin', 'password': 'admin'}
+        for number, host in enumerate(loopback_hosts(count))
+    ]
+
+
+def single(fleet, concurrency):
+    async def run():
+        return sum([1 async for _ in poll_fleet(fleet, concurrency=concurrency, timeout=10, deadline=30)])
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--shards', default='1,2,4', help='Comma separated shard counts')
+    parser.add_argument('--servers', type=int, default=2, help='Fake DVR processes')
+    parser.add_argument('--concurrency', type=int, default=200, help='Devices polled at once per process')
+    args = parser.parse_args()
+    args.latency = args.jitter = args.error_rate = 0
+    args.auth = None
+
+    ports = [free_port() for _ in range(args.servers)]
+    servers = [start_server(args, port) for port in ports]
+    fleet = devices(args.devices, ports)
+    print(f"{os.cpu_count()} CPUs, {args.devices} devices, {args.servers} fake DVR processes")
+    try:
+        started = time.perf_counter()
+        done = single(fleet, args.concurrency)
+        baseline = time.perf_counter() - started
+        print(f"{'poll_fleet':<12} {baseline:7.2f} s   {done / baseline:8.1f} devices/s")
+        for shards in (int(value) for value in args.shards.split(',')):
+            sweep = ShardedSweep(fleet, shards=shards, concurrency=args.concurrency, timeout=10, deadline=30)
+            started = time.perf_counter()
+            done = sum(1 for _ in sweep)
+            elapsed = time.perf_counter() - started
+            slowest = max(stats.elapsed for stats in sweep.stats)
+            print(f"{f'{shards} shards':<12} {elapsed:7.2f} s   {done / elapsed:8.1f} devices/s   "
+                  f"x{baseline / elapsed:4.2f}   slowest shard {slowest:.2f} s   "
+                  f"{sum(stats.bytes for stats in sweep.stats) / done:.0f} bytes/result")
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
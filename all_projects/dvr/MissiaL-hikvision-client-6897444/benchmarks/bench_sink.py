@@ -0,0 +1,141 @@
+"""
+Per-row INSERT against the batched result sink
+
+Writes the same poll results the way the PHP activity logger does (a
+connection and an INSERT per row), with per-row INSERTs on one connection,
+and through hikvisionapi.sink in COPY and upsert mode.
+
+Without ``--dsn`` the database is a stand-in: in-memory SQLite behind a
+DB-API wrapper that adds ``--rtt`` seconds per round-trip, so the numbers
+show what batching saves on the wire, not PostgreSQL's own speed.
+
+    python benchmarks/bench_sink.py --rows 5000 --rtt 0.0005
+    python benchmarks/bench_sink.py --dsn "host=localhost dbname=bench user=postgres"
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from hikvisionapi.sink import COLUMNS, COPY, UPSERT, ResultSink, result_row  # noqa: E402
+from hikvisionapi.snapshot import empty_result  # noqa: E402
+
+TABLE = 'dvr_activity_bench'
+
+
+class StandInConnection:
+    """sqlite3 with a simulated network round-trip per call"""
+
+    def __init__(self, db, rtt):
+        time.sleep(rtt * 3)  # TCP and startup handshake
+        self.db = db
+        self.rtt = rtt
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=()):
+        time.sleep(self.rtt)
+        self.db.execute(sql.replace('%s', '?'), params)
+
+    def copy_expert(self, sql, fd):
+        time.sleep(self.rtt)
+        columns = sql[sql.index('(') + 1:sql.index(')')]
+        rows = [[None if value == '\\N' else value for value in line.split('\t')]
+                for line in fd.getvalue().splitlines()]
+        placeholders = ', '.join('?' * len(rows[0]))
+        self.db.executemany(f"INSERT INTO {TABLE} ({columns}) VALUES ({placeholders})", rows)
+
+    def commit(self):
+        time.sleep(self.rtt)
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def close(self):
+        pass
+
+
+def results(count, devices):
+    for number in range(count):
+        result = empty_result()
+        result['ip'] = f"10.{number % devices // 65536}.{number % devices // 256 % 256}.{number % devices % 256}"
+        result['port'] = 80
+        yield result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--devices', type=int, default=1000, help='Distinct devices among the rows')
+    parser.add_argument('--rtt', type=float, default=0.0005, help='Stand-in round-trip time in seconds')
+    parser.add_argument('--dsn', default=None, help='Use a real PostgreSQL instead of the stand-in')
+    args = parser.parse_args()
+
+    if args.dsn:
+        import psycopg2
+
+        def connect():
+            return psycopg2.connect(args.dsn)
+    else:
+        db = sqlite3.connect(':memory:', check_same_thread=False)
+
+        def connect():
+            return StandInConnection(db, args.rtt)
+
+    setup = connect()
+    cursor = setup.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(f"CREATE TABLE {TABLE} ({', '.join(column + ' TEXT' for column in COLUMNS)})")
+    setup.commit()
+    rows = list(results(args.rows, args.devices))
+    insert = f"INSERT INTO {TABLE} ({', '.join(COLUMNS)}) VALUES ({', '.join(['%s'] * len(COLUMNS))})"
+
+    def truncate(unique):
+        cursor.execute(f"DROP INDEX IF EXISTS {TABLE}_ip")
+        cursor.execute(f"DELETE FROM {TABLE}")
+        if unique:
+            cursor.execute(f"CREATE UNIQUE INDEX {TABLE}_ip ON {TABLE} (ip_address)")
+        setup.commit()
+
+    def per_row_connect():
+        for result in rows:
+            connection = connect()
+            connection.cursor().execute(insert, result_row(result))
+            connection.commit()
+            connection.close()
+
+    def per_row_shared():
+        connection = connect()
+        for result in rows:
+            connection.cursor().execute(insert, result_row(result))
+            connection.commit()
+        connection.close()
+
+    def sink(mode):
+        def run():
+            with ResultSink(connect, table=TABLE, mode=mode, batch_size=500, max_latency=60) as writer:
+                for result in rows:
+                    writer.put(result)
+        return run
+
+    for name, unique, run in (
+        ('INSERT, connection per row', False, per_row_connect),
+        ('INSERT per row, one connection', False, per_row_shared),
+        ('sink COPY', False, sink(COPY)),
+        ('sink upsert', True, sink(UPSERT)),
+    ):
+        truncate(unique)
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        print(f"{name:<32} {elapsed * 1000:9.1f} ms   {args.rows / elapsed:10.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
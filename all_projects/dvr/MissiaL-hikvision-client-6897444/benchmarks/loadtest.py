@@ -0,0 +1,172 @@
+"""
+Load test of Client and AsyncClient against the fake DVR
+
+Starts ``hikvisionapi.fakedvr`` in a separate process, spreads the requests
+over many virtual devices and reports requests per second, latency
+percentiles, errors and the peak memory of the client process.
+
+    python benchmarks/loadtest.py --devices 500 --requests 5000 --concurrency 100
+    python benchmarks/loadtest.py --client async --auth digest --latency 0.02 --jitter 0.01 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import hikvisionapi  # noqa: E402
+from hikvisionapi.fakedvr import loopback_hosts  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port):
+    command = [
+        sys.executable, '-m', 'hikvisionapi.fakedvr', '--host', '0.0.0.0', '--port', str(port),
+        '--latency', str(args.latency), '--jitter', str(args.jitter),
+        '--error-rate', str(args.error_rate), '--seed', '1',
+    ]
+    if args.auth:
+        command += ['--auth', args.auth]
+    server = subprocess.Popen(command, cwd=ROOT)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("Fake DVR did not start")
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(name, timings, errors, elapsed, rss_before):
+    timings.sort()
+    done = len(timings) + errors
+
+    def percentile(share):
+        return timings[min(len(timings) - 1, int(len(timings) * share))] * 1000 if timings else float('nan')
+
+    print(f"{name:<6} {done / elapsed:9.1f} req/s   p50 {percentile(0.50):7.2f} ms   "
+          f"p99 {percentile(0.99):7.2f} ms   mean {statistics.mean(timings) * 1000 if timings else 0:7.2f} ms   "
+          f"errors {errors:5d}   peak RSS {max_rss_mb():7.1f} MB (+{max_rss_mb() - rss_before:.1f})")
+
+
+def run_sync(urls, args):
+    """One thread per concurrency slot, each owning the Clients of its devices"""
+    timings = []
+    errors = [0]
+    lock = threading.Lock()
+    path = args.path.split('/')
+    per_thread = args.requests // args.concurrency
+
+    def worker(index):
+        clients = {}
+        own = urls[index::args.concurrency] or urls[:1]
+        local, failed = [], 0
+        for number in range(per_thread):
+            url = own[number % len(own)]
+            started = time.perf_counter()
+            try:
+                client = clients.get(url)
+                if client is None:
+                    client = clients[url] = hikvisionapi.Client(url, 'admin', 'admin', timeout=args.timeout)
+                client.request(*path, method='get', present='text')
+                local.append(time.perf_counter() - started)
+            except Exception:
+                failed += 1
+        with lock:
+            timings.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors[0]
+
+
+async def run_async(urls, args):
+    """``concurrency`` workers sharing one pool and one AsyncClient per device"""
+    timings = []
+    errors = 0
+    path = args.path.split('/')
+    counter = itertools.count()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as pool:
+        clients = [hikvisionapi.AsyncClient(url, 'admin', 'admin', timeout=args.timeout, http_client=pool)
+                   for url in urls]
+
+        async def worker():
+            nonlocal errors
+            for number in iter(counter.__next__, None):
+                if number >= args.requests:
+                    return
+                started = time.perf_counter()
+                try:
+                    await clients[number % len(clients)].request(*path, method='get', present='text')
+                    timings.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return timings, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--client', choices=('sync', 'async', 'both'), default='both')
+    parser.add_argument('--devices', type=int, default=100, help='Virtual devices on the fake server')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--path', default='System/status', help='ISAPI path to request')
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--auth', choices=('basic', 'digest'), default=None)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(args, port)
+    urls = [f"http://{host}:{port}" for host in loopback_hosts(args.devices)]
+    try:
+        if args.client in ('sync', 'both'):
+            rss_before = max_rss_mb()
+            started = time.perf_counter()
+            timings, errors = run_sync(urls, args)
+            report('sync', timings, errors, time.perf_counter() - started, rss_before)
+        if args.client in ('async', 'both'):
+            rss_before = max_rss_mb()
+            started = time.perf_counter()
+            timings, errors = asyncio.run(run_async(urls, args))
+            report('async', timings, errors, time.perf_counter() - started, rss_before)
+    finally:
+        server.terminate()
+        server.wait(10)
+
+
+if __name__ == '__main__':
+    main()
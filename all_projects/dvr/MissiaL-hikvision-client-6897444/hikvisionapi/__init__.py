@@ -1,3 +1,5 @@
+from .authcache import AuthCache
+from .health import HealthTracker
 from .hikvisionapi import AsyncClient
 from .hikvisionapi import Client
 
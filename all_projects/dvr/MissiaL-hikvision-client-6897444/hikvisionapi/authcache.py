@@ -0,0 +1,218 @@
+# coding=utf-8
+"""
+Per-device cache of the authentication scheme a device accepted
+
+Probing ``System/status`` with Basic and then Digest costs one or two full
+round-trips per client construction. The cache remembers the winning scheme
+per ``host:port`` so later clients skip the probe, and hands out the same
+auth objects so a Digest challenge (nonce) is reused across clients.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from requests.auth import HTTPBasicAuth, HTTPDigestAuth
+
+BASIC = 'basic'
+DIGEST = 'digest'
+SCHEMES = (BASIC, DIGEST)
+SAVE_INTERVAL = 1.0
+# Name of the schemes in a metastore.MetaStore
+STORE_NAME = 'auth'
+
+_AUTH_CLASSES = {
+    'requests': {BASIC: HTTPBasicAuth, DIGEST: HTTPDigestAuth},
+    'httpx': {BASIC: httpx.BasicAuth, DIGEST: httpx.DigestAuth},
+}
+
+
+def host_key(host: str) -> str:
+    """Normalise a device URL to ``host:port``"""
+    parts = urlsplit(host if '//' in host else '//' + host)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    return f"{parts.hostname}:{port}"
+
+
+class _Entry:
+    __slots__ = ('scheme', 'login', 'expires', 'auth')
+
+    def __init__(self, scheme: str, login: Optional[str], expires: float):
+        self.scheme = scheme
+        self.login = login
+        self.expires = expires
+        self.auth: Dict[Tuple[str, Optional[str]], Any] = {}
+
+
+class AuthCache:
+    """
+    Thread-safe cache of authentication schemes keyed by ``host:port``
+
+    Basic Usage::
+
+    from hikvisionapi import AuthCache, Client
+    cache = AuthCache(ttl=3600, path='/var/tmp/hikvision_auth.json')
+    api = Client('http://192.168.0.2', 'admin', 'admin', auth_cache=cache)
+    """
+
+    def __init__(self, ttl: float = 3600, path: Optional[str] = None, store=None):
+        """
+        :param ttl: (optional) Seconds a remembered scheme stays valid
+        :param path: (optional) JSON file the schemes are persisted to, so
+            short-lived processes start warm
+        :param store: (optional) metastore.MetaStore the schemes are persisted
+            to instead, shared with other processes
+        """
+        self.ttl = float(ttl)
+        self.path = path
+        self.store = None
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self._changed: Set[str] = set()
+        self._dirty = False
+        self._saved_at = 0.0
+        if path:
+            self._load()
+            atexit.register(self.flush)
+        if store is not None:
+            self.attach(store)
+
+    def attach(self, store) -> None:
+        """Load the schemes kept in a metastore.MetaStore and persist changes there"""
+        stored = store.items(STORE_NAME)
+        with self._lock:
+            for key, (item, expires) in stored.items():
+                if key not in self._entries and isinstance(item, dict) and item.get('scheme') in SCHEMES:
+                    self._entries[key] = _Entry(item['scheme'], item.get('login'), expires)
+            if self.store is None:
+                atexit.register(self.flush)
+            self.store = store
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fd:
+                stored = json.load(fd)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, item in stored.items():
+            if item.get('scheme') in SCHEMES and item.get('expires', 0) > now:
+                self._entries[key] = _Entry(item['scheme'], item.get('login'), item['expires'])
+
+    def _save(self, force: bool = False) -> None:
+        # Writes are batched so a fleet sweep does not rewrite the file per device
+        self._dirty = True
+        if not (self.path or self.store) or not (force or time.monotonic() - self._saved_at >= SAVE_INTERVAL):
+            return
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if self.store is not None:
+            changed, self._changed = self._changed, set()
+            try:
+                self.store.update(STORE_NAME, {
+                    key: ({'scheme': entry.scheme, 'login': entry.login}, entry.expires) if entry else None
+                    for key, entry in ((key, self._entries.get(key)) for key in changed)
+                })
+            except Exception:
+                self._changed |= changed
+        if not self.path:
+            return
+        stored = {
+            key: {'scheme': entry.scheme, 'login': entry.login, 'expires': entry.expires}
+            for key, entry in self._entries.items()
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.authcache')
+            with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+                json.dump(stored, tmp)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def _entry(self, host: str, login: Optional[str]) -> Optional[_Entry]:
+        key = host_key(host)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.login != login or entry.expires <= time.time():
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, host: str, login: Optional[str]) -> Optional[str]:
+        """Return the remembered scheme ('basic' or 'digest') or None"""
+        with self._lock:
+            entry = self._entry(host, login)
+            return entry.scheme if entry else None
+
+    def set(self, host: str, login: Optional[str], scheme: str, auth=None,
+            password: Optional[str] = None, flavour: str = 'requests') -> None:
+        """Remember that ``host`` accepted ``scheme`` for ``login``
+
+        :param auth: (optional) Auth object that succeeded. It is handed out
+            by ``auth_for`` so its Digest challenge is not thrown away
+        """
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown auth scheme: {scheme}")
+        with self._lock:
+            key = host_key(host)
+            entry = self._entries.get(key)
+            if entry is not None and entry.scheme == scheme and entry.login == login:
+                entry.expires = time.time() + self.ttl
+            else:
+                entry = self._entries[key] = _Entry(scheme, login, time.time() + self.ttl)
+            if auth is not None:
+                entry.auth[(flavour, password)] = auth
+            self._changed.add(key)
+            self._save()
+
+    def invalidate(self, host: str) -> None:
+        """Forget the scheme of ``host``, e.g. after a 401"""
+        with self._lock:
+            key = host_key(host)
+            if self._entries.pop(key, None) is not None:
+                self._changed.add(key)
+                self._save()
+
+    def auth_for(self, host: str, login: Optional[str], password: Optional[str],
+                 scheme: str, flavour: str = 'requests'):
+        """Return a shared auth object for ``host``
+
+        The object is reused by every client of the device, so a Digest auth
+        keeps its last challenge and answers the next request without a 401.
+
+        :param flavour: 'requests' for Client or 'httpx' for AsyncClient
+        """
+        auth_class = _AUTH_CLASSES[flavour][scheme]
+        with self._lock:
+            entry = self._entry(host, login)
+            if entry is None or entry.scheme != scheme:
+                return auth_class(login, password)
+            auth = entry.auth.get((flavour, password))
+            if auth is None:
+                auth = entry.auth[(flavour, password)] = auth_class(login, password)
+            return auth
+
+    def flush(self) -> None:
+        """Write pending changes to ``path``"""
+        with self._lock:
+            if self._dirty:
+                self._save(force=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._changed.clear()
+            if self.store is not None:
+                self.store.clear(STORE_NAME)
+            self._save(force=True)
+
+
+default_auth_cache = AuthCache()
@@ -0,0 +1,501 @@
+# coding=utf-8
+"""
+Resident polling daemon
+
+Keeps one process up with warm device clients on a shared connection pool
+and answers newline-delimited JSON-RPC 2.0 over a Unix socket or over
+stdin/stdout. A poll then costs the ISAPI round-trips only, instead of a
+Python start-up, imports and a fresh authentication per DVR.
+
+Usage::
+
+    python -m hikvisionapi.daemon --socket /run/hikvision.sock
+    python -m hikvisionapi.daemon --stdio
+
+Request and response, one JSON document per line::
+
+    {"jsonrpc": "2.0", "id": 1, "method": "poll",
+     "params": {"device": {"ip": "10.0.0.5", "port": 80, "username": "admin", "password": "..."}}}
+    {"jsonrpc": "2.0", "id": 1, "result": {"status": "ONLINE", ...}}
+
+Methods: ``poll`` (the ``get_hikvision_data`` shape), ``snapshot`` (every
+field with its timing and error), ``changes`` (what changed since the
+previous poll of the device, see state.FleetState), ``device_info``
+(served from the metadata store when one is set), ``forget``, ``stats``,
+``metrics`` (request timings, see metrics.MetricsCollector), ``ping`` and
+``shutdown``. Requests on one connection run concurrently, so responses
+can come back out of order and are matched by id.
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import socket
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from .authcache import AuthCache
+from .fieldcache import FieldCache
+from .hikvisionapi import AsyncClient
+from .metastore import MetaStore
+from .metrics import MetricsCollector
+from .poller import DEVICE_FIELDS
+from .snapshot import FIELDS, HealthSnapshot, empty_result
+from .state import Change, FleetState
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+DeviceKey = Tuple[str, str, str, str]
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _jsonable(value: Any) -> Any:
+    if hasattr(value, '_asdict'):
+        return {key: _jsonable(item) for key, item in value._asdict().items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    return value
+
+
+def snapshot_to_dict(snapshot: HealthSnapshot) -> Dict[str, Any]:
+    """Convert a snapshot to plain JSON types"""
+    return {
+        'host': snapshot.host,
+        'elapsed': snapshot.elapsed,
+        'fields': {
+            name: {'value': _jsonable(field.value), 'elapsed': field.elapsed, 'error': field.error,
+                   'cached': field.cached}
+            for name, field in ((name, getattr(snapshot, name)) for name in FIELDS)
+        },
+    }
+
+
+class _Warm:
+    __slots__ = ('client', 'last_used', 'polls')
+
+    def __init__(self, client: AsyncClient):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.polls = 0
+
+
+class Daemon:
+    """
+    JSON-RPC front end over warm device clients
+
+    Basic Usage::
+
+    daemon = Daemon(idle_ttl=600)
+    await daemon.serve_unix('/run/hikvision.sock')
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float] = 5,
+        deadline: Optional[float] = 15,
+        concurrency: int = 256,
+        idle_ttl: float = 600,
+        http_client: Optional[httpx.AsyncClient] = None,
+        drift_threshold: float = 120,
+        field_cache: Optional[FieldCache] = None,
+        instruments: Optional[MetricsCollector] = None,
+        metadata: Optional[MetaStore] = None,
+    ):
+        """
+        :param timeout: (optional) Timeout for each ISAPI request
+        :param deadline: (optional) Total time budget of one poll, None to disable
+        :param concurrency: (optional) Maximum number of polls in flight
+        :param idle_ttl: (optional) Drop device clients unused for this many seconds
+        :param http_client: (optional) Shared httpx.AsyncClient for every device
+        :param drift_threshold: (optional) Clock drift in seconds reported by ``changes``
+        :param field_cache: (optional) FieldCache for storage and the recording range,
+            by default one with DEFAULT_TTLS kept in memory
+        :param instruments: (optional) MetricsCollector for the device clients,
+            read with the ``metrics`` method
+        :param metadata: (optional) MetaStore keeping auth schemes and static
+            device data across restarts
+        """
+        self.timeout = timeout
+        self.deadline = deadline
+        self.idle_ttl = idle_ttl
+        self.started_at = time.time()
+        self.calls = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._owns_http_client = http_client is None
+        self._http_client = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=concurrency,
+                max_keepalive_connections=concurrency,
+                keepalive_expiry=30,
+            ),
+            timeout=timeout,
+        )
+        self._devices: Dict[DeviceKey, _Warm] = {}
+        self.state = FleetState(drift_threshold)
+        self.field_cache = field_cache if field_cache is not None else FieldCache()
+        self.instruments = instruments
+        self.metadata = metadata
+        self.auth_cache = AuthCache(store=metadata) if metadata is not None else None
+        self._stopped = asyncio.Event()
+        self.methods = {
+            'poll': self.poll,
+            'snapshot': self.snapshot,
+            'changes': self.changes,
+            'device_info': self.device_info,
+            'forget': self.forget,
+            'stats': self.stats,
+            'metrics': self.metrics,
+            'ping': self.ping,
+            'shutdown': self.shutdown,
+        }
+
+    @staticmethod
+    def _key(device: Dict[str, Any]) -> DeviceKey:
+        if not isinstance(device, dict):
+            raise RpcError(INVALID_PARAMS, "device must be an object")
+        missing = [field for field in DEVICE_FIELDS if device.get(field) in (None, '')]
+        if missing:
+            raise RpcError(INVALID_PARAMS, f"device is missing {', '.join(missing)}")
+        return str(device['ip']), str(device['port']), str(device['username']), str(device['password'])
+
+    def _client(self, device: Dict[str, Any]) -> Tuple[DeviceKey, _Warm]:
+        key = self._key(device)
+        warm = self._devices.get(key)
+        if warm is None:
+            client = AsyncClient(
+                f"http://{key[0]}:{key[1]}", key[2], key[3],
+                timeout=self.timeout, http_client=self._http_client, instruments=self.instruments,
+                auth_cache=self.auth_cache, metadata=self.metadata,
+            )
+            warm = self._devices[key] = _Warm(client)
+        warm.last_used = time.monotonic()
+        warm.polls += 1
+        return key, warm
+
+    def evict_idle(self) -> int:
+        """Drop device clients that have not been used for idle_ttl seconds"""
+        cutoff = time.monotonic() - self.idle_ttl
+        idle = [key for key, warm in self._devices.items() if warm.last_used < cutoff]
+        for key in idle:
+            del self._devices[key]
+        return len(idle)
+
+    async def _snapshot(self, device: Dict[str, Any], fields: Optional[Sequence[str]]) -> HealthSnapshot:
+        _, warm = self._client(device)
+        fields = tuple(fields) if fields is not None else FIELDS
+        if set(fields) - set(FIELDS):
+            raise RpcError(INVALID_PARAMS, f"fields must be a subset of {', '.join(FIELDS)}")
+        async with self._semaphore:
+            return await asyncio.wait_for(warm.client.health_snapshot(fields, self.field_cache), self.deadline)
+
+    async def _poll(
+        self, device: Dict[str, Any], fields: Optional[Sequence[str]]
+    ) -> Tuple[Dict[str, Any], List[Change]]:
+        try:
+            result = (await self._snapshot(device, fields)).as_legacy_dict()
+        except asyncio.TimeoutError:
+            result = empty_result('ERROR', f"Deadline of {self.deadline}s exceeded")
+        result['ip'] = device['ip']
+        result['port'] = device['port']
+        # Every poll is applied, so ``changes`` also accounts for ``poll`` calls
+        return result, self.state.apply(result)
+
+    async def poll(self, device: Dict[str, Any], fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        result, _ = await self._poll(device, fields)
+        return result
+
+    async def changes(self, device: Dict[str, Any], fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Poll the device and return only what changed since its previous poll"""
+        _, changes = await self._poll(device, fields)
+        return [change._asdict() for change in changes]
+
+    async def snapshot(self, device: Dict[str, Any], fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        try:
+            return snapshot_to_dict(await self._snapshot(device, fields))
+        except asyncio.TimeoutError:
+            raise RpcError(SERVER_ERROR, f"Deadline of {self.deadline}s exceeded")
+
+    async def device_info(self, device: Dict[str, Any]) -> Dict[str, Any]:
+        """Model, serial number and firmware of the device"""
+        _, warm = self._client(device)
+        async with self._semaphore:
+            return await asyncio.wait_for(warm.client.device_info(), self.deadline)
+
+    async def forget(self, device: Dict[str, Any]) -> bool:
+        """Drop the warm client of ``device``, False when there was none"""
+        return self._devices.pop(self._key(device), None) is not None
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            'uptime': time.time() - self.started_at,
+            'calls': self.calls,
+            'devices': len(self._devices),
+            'cameras': self.state.camera_count,
+            'cache': {'hits': self.field_cache.hits, 'misses': self.field_cache.misses},
+            'metadata': {'hits': self.metadata.hits, 'misses': self.metadata.misses} if self.metadata else None,
+            'pid': os.getpid(),
+        }
+
+    async def metrics(self, format: str = 'dict') -> Any:
+        """Request timings as a dict, or as Prometheus text with format='prometheus'"""
+        if self.instruments is None:
+            raise RpcError(SERVER_ERROR, "Metrics are disabled, start the daemon with --metrics")
+        if format == 'prometheus':
+            return self.instruments.prometheus()
+        return self.instruments.as_dict()
+
+    async def ping(self) -> str:
+        return 'pong'
+
+    async def shutdown(self) -> bool:
+        self._stopped.set()
+        return True
+
+    async def handle(self, message: Any) -> Optional[Dict[str, Any]]:
+        """Run one JSON-RPC request and build its response
+
+        :return None for notifications, which get no response
+        """
+        request_id = message.get('id') if isinstance(message, dict) else None
+        try:
+            if not isinstance(message, dict) or not isinstance(message.get('method'), str):
+                raise RpcError(INVALID_REQUEST, "Invalid request")
+            method = self.methods.get(message['method'])
+            if method is None:
+                raise RpcError(METHOD_NOT_FOUND, f"Unknown method {message['method']}")
+            params = message.get('params') or {}
+            if not isinstance(params, (dict, list)):
+                raise RpcError(INVALID_PARAMS, "params must be an object or an array")
+            self.calls += 1
+            # Only a mismatch with the signature is the caller's fault, a
+            # TypeError raised inside the method is a server error
+            try:
+                if isinstance(params, dict):
+                    bound = inspect.signature(method).bind(**params)
+                else:
+                    bound = inspect.signature(method).bind(*params)
+            except TypeError as e:
+                raise RpcError(INVALID_PARAMS, str(e)) from None
+            result = await method(*bound.args, **bound.kwargs)
+        except RpcError as e:
+            error = {'code': e.code, 'message': e.message}
+        except Exception as e:
+            error = {'code': SERVER_ERROR, 'message': str(e) or type(e).__name__}
+        else:
+            if 'id' not in message:
+                return None
+            return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+        # Notifications get no response, not even an error. A message that is
+        # not a request object is invalid, so it is answered
+        if isinstance(message, dict) and 'id' not in message and isinstance(message.get('method'), str):
+            return None
+        return {'jsonrpc': '2.0', 'id': request_id, 'error': error}
+
+    async def _handle_line(self, line: bytes, write) -> None:
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            response = {'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': str(e)}}
+        else:
+            response = await self.handle(message)
+        if response is not None:
+            await write((json.dumps(response) + '\n').encode())
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of one client until it disconnects"""
+        lock = asyncio.Lock()
+
+        async def write(data: bytes) -> None:
+            async with lock:
+                writer.write(data)
+                await writer.drain()
+
+        tasks = set()
+        try:
+            while not reader.at_eof():
+                line = await reader.readline()
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self._handle_line(line, write))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _housekeeping(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_ttl / 4))
+            self.evict_idle()
+
+    async def serve_unix(self, path: str) -> None:
+        """Serve on a Unix socket until ``shutdown`` is called"""
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self.serve_connection, path, limit=1024 * 1024)
+        housekeeping = asyncio.ensure_future(self._housekeeping())
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            housekeeping.cancel()
+            await self.aclose()
+            if os.path.exists(path):
+                os.unlink(path)
+
+    async def serve_stdio(self) -> None:
+        """Serve on stdin/stdout until stdin closes or ``shutdown`` is called"""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=1024 * 1024)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        lock = asyncio.Lock()
+
+        async def write(data: bytes) -> None:
+            async with lock:
+                sys.stdout.buffer.write(data)
+                sys.stdout.buffer.flush()
+
+        housekeeping = asyncio.ensure_future(self._housekeeping())
+        stopped = asyncio.ensure_future(self._stopped.wait())
+        tasks = set()
+        try:
+            while not reader.at_eof() and not self._stopped.is_set():
+                # stdin may stay open after shutdown, so do not wait on it alone
+                read = asyncio.ensure_future(reader.readline())
+                await asyncio.wait((read, stopped), return_when=asyncio.FIRST_COMPLETED)
+                if not read.done():
+                    read.cancel()
+                    break
+                line = read.result()
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self._handle_line(line, write))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            stopped.cancel()
+            housekeeping.cancel()
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        self._devices.clear()
+        if self._owns_http_client:
+            await self._http_client.aclose()
+
+
+class DaemonError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class DaemonClient:
+    """
+    Blocking client for a daemon on a Unix socket
+
+    Basic Usage::
+
+    with DaemonClient('/run/hikvision.sock') as daemon:
+        result = daemon.poll({'ip': '10.0.0.5', 'port': 80, 'username': 'admin', 'password': '...'})
+    """
+
+    def __init__(self, path: str, timeout: Optional[float] = 30):
+        """
+        :param path: Unix socket of the daemon
+        :param timeout: (optional) Socket timeout for each call
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(path)
+        self._file = self._socket.makefile('rwb')
+        self._next_id = 0
+
+    def __enter__(self) -> "DaemonClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def call(self, method: str, **params) -> Any:
+        self._next_id += 1
+        request = {'jsonrpc': '2.0', 'id': self._next_id, 'method': method, 'params': params}
+        self._file.write((json.dumps(request) + '\n').encode())
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Daemon closed the connection")
+        response = json.loads(line)
+        if 'error' in response:
+            raise DaemonError(response['error']['code'], response['error']['message'])
+        return response['result']
+
+    def poll(self, device: Dict[str, Any], fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        return self.call('poll', device=device, fields=fields)
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m hikvisionapi.daemon',
+        description='Serve device polls over JSON-RPC with warm connections',
+    )
+    transport = parser.add_mutually_exclusive_group(required=True)
+    transport.add_argument('--socket', help='Unix socket path to listen on')
+    transport.add_argument('--stdio', action='store_true', help='Read requests from stdin, answer on stdout')
+    parser.add_argument('--timeout', type=float, default=5,
+                        help='Timeout for each request in seconds (default: 5)')
+    parser.add_argument('--deadline', type=float, default=15,
+                        help='Total time budget per poll in seconds (default: 15)')
+    parser.add_argument('--concurrency', type=int, default=256,
+                        help='Maximum number of polls in flight (default: 256)')
+    parser.add_argument('--idle-ttl', type=float, default=600,
+                        help='Forget devices unused for this many seconds (default: 600)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Collect request timings, served by the metrics method')
+    parser.add_argument('--metadata', default=None, metavar='FILE',
+                        help='SQLite file keeping auth schemes and device info across restarts')
+    args = parser.parse_args(argv)
+
+    async def run() -> None:
+        daemon = Daemon(args.timeout, args.deadline, args.concurrency, args.idle_ttl,
+                        instruments=MetricsCollector() if args.metrics else None,
+                        metadata=MetaStore(args.metadata) if args.metadata else None)
+        if args.stdio:
+            await daemon.serve_stdio()
+        else:
+            await daemon.serve_unix(args.socket)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+# coding=utf-8
+"""
+Streaming downloads of pictures and recordings
+
+``Streaming/channels/<id>/picture`` and ``ContentMgmt/download`` bodies are
+written chunk by chunk to a file, a file object or a preallocated buffer
+while a checksum is computed on the fly, so a clip never sits in memory as a
+whole. Downloads to a path go through ``<path>.part`` and are resumed with an
+HTTP Range request when that file is left over from an interrupted run.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, NamedTuple, Optional, Tuple, Union
+
+from .authcache import host_key
+
+CHUNK_SIZE = 64 * 1024
+PART_SUFFIX = '.part'
+
+Destination = Union[str, os.PathLike, bytearray, memoryview, io.IOBase]
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadResult(NamedTuple):
+    path: Optional[str]
+    size: int
+    received: int
+    resumed_from: int
+    checksum: Optional[str]
+    content_type: Optional[str]
+    elapsed: float
+
+
+def picture_path(channel: int, stream: int = 1) -> str:
+    """ISAPI path of a JPEG snapshot, e.g. channel 3 main stream -> Streaming/channels/301/picture"""
+    return f"Streaming/channels/{int(channel) * 100 + stream}/picture"
+
+
+def recording_request(playback_uri: str) -> str:
+    """Body of a ContentMgmt/download request for a playbackURI from ContentMgmt/search"""
+    uri = playback_uri.replace('&', '&amp;')
+    return f'<?xml version="1.0" encoding="UTF-8"?><downloadRequest><playbackURI>{uri}</playbackURI></downloadRequest>'
+
+
+def _content_range(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """Parse ``bytes START-END/TOTAL`` or ``bytes */TOTAL`` into (start, total)"""
+    if not value or not value.startswith('bytes '):
+        return None, None
+    span, _, total = value[6:].partition('/')
+    start = span.split('-', 1)[0]
+    return (int(start) if start.isdigit() else None), (int(total) if total.isdigit() else None)
+
+
+class _Sink:
+    """Destination of one download"""
+
+    __slots__ = ('path', 'part', 'fd', 'owns_fd', 'buffer', 'offset', 'position', 'hash',
+                 'checksum', 'content_type')
+
+    def __init__(self, dest: Destination, checksum: Optional[str], resume: bool):
+        self.path = self.part = None
+        self.fd = None
+        self.owns_fd = False
+        self.buffer = None
+        self.offset = 0
+        self.position = 0
+        self.checksum = checksum
+        self.hash = None
+        self.content_type = None
+        if isinstance(dest, (str, os.PathLike)):
+            self.path = os.fspath(dest)
+            self.part = self.path + PART_SUFFIX
+            if resume and os.path.exists(self.part):
+                self.offset = os.path.getsize(self.part)
+        elif isinstance(dest, (bytearray, memoryview)):
+            self.buffer = memoryview(dest).cast('B')
+        elif hasattr(dest, 'write'):
+            self.fd = dest
+        else:
+            raise TypeError(f"Cannot download to {type(dest).__name__}")
+
+    def headers(self) -> Dict[str, str]:
+        return {'Range': f"bytes={self.offset}-"} if self.offset else {}
+
+    def restart(self) -> None:
+        """Drop a partial file the device refuses to resume"""
+        self.offset = 0
+        if self.part and os.path.exists(self.part):
+            os.unlink(self.part)
+
+    def begin(self, status: int, headers) -> None:
+        self.content_type = headers.get('content-type')
+        if status == 206:
+            start, _ = _content_range(headers.get('content-range'))
+            if start != self.offset:
+                raise DownloadError(f"Asked to resume at {self.offset}, device sent {start}")
+        else:
+            # The device ignored the Range header and sends the whole body
+            self.offset = 0
+        self.position = self.offset
+        if self.checksum:
+            self.hash = hashlib.new(self.checksum)
+            if self.offset:
+                self._hash_part()
+
+        length = headers.get('content-length')
+        if self.buffer is not None and length and length.isdigit() and int(length) > len(self.buffer):
+            raise BufferError(f"Body of {length} bytes does not fit a {len(self.buffer)} byte buffer")
+        if self.part is not None:
+            self.fd = open(self.part, 'ab' if self.offset else 'wb')
+            self.owns_fd = True
+
+    def _hash_part(self) -> None:
+        with open(self.part, 'rb') as fd:
+            for chunk in iter(lambda: fd.read(1024 * 1024), b''):
+                self.hash.update(chunk)
+
+    def complete(self, headers) -> bool:
+        """Whether a 416 answer means the partial file already holds everything"""
+        _, total = _content_range(headers.get('content-range'))
+        return total is not None and total == self.offset
+
+    def write(self, chunk: bytes) -> None:
+        size = len(chunk)
+        if self.buffer is not None:
+            end = self.position + size
+            if end > len(self.buffer):
+                raise BufferError(f"Body does not fit a {len(self.buffer)} byte buffer")
+            self.buffer[self.position:end] = chunk
+        else:
+            self.fd.write(chunk)
+        if self.hash is not None:
+            self.hash.update(chunk)
+        self.position += size
+
+    def abort(self) -> None:
+        # The partial file is kept so the next call can resume it
+        if self.owns_fd:
+            self.fd.close()
+
+    def finish(self, started: float) -> DownloadResult:
+        if self.owns_fd:
+            self.fd.close()
+        if self.part is not None:
+            os.replace(self.part, self.path)
+        return DownloadResult(
+            path=self.path,
+            size=self.position,
+            received=self.position - self.offset,
+            resumed_from=self.offset,
+            checksum=self.hash.hexdigest() if self.hash is not None else None,
+            content_type=self.content_type,
+            elapsed=time.monotonic() - started,
+        )
+
+
+def _split(path: str) -> Tuple[str, ...]:
+    return tuple(part for part in path.split('/') if part)
+
+
+def _headers(sink: _Sink, data: Dict[str, Any]) -> Dict[str, str]:
+    headers = dict(data.get('headers') or {})
+    headers.update(sink.headers())
+    return headers
+
+
+def download(client, path: str, dest: Destination, method: str = 'get', checksum: Optional[str] = 'sha256',
+             resume: bool = True, chunk_size: int = CHUNK_SIZE, **data) -> DownloadResult:
+    """Stream ``path`` with a sync Client
+
+    :param path: ISAPI path, e.g. picture_path(1) or 'ContentMgmt/download'
+    :param dest: File path, writable binary file object, or bytearray/memoryview
+        to fill. Paths are written through ``<path>.part`` and renamed when done
+    :param method: (optional) HTTP method, ContentMgmt/download takes a body
+        from recording_request() as ``data``
+    :param checksum: (optional) hashlib algorithm computed while writing, None to skip
+    :param resume: (optional) Continue a leftover ``.part`` file with a Range request
+    """
+    sink = _Sink(dest, checksum, resume)
+    started = time.monotonic()
+    for _ in range(2):
+        with client.open_stream(*_split(path), method=method, **dict(data, headers=_headers(sink, data))) as response:
+            if response.status_code == 416 and sink.offset:
+                if sink.complete(response.headers):
+                    sink.begin(206, {'content-range': f"bytes {sink.offset}-/{sink.offset}"})
+                    return sink.finish(started)
+                sink.restart()
+                continue
+            response.raise_for_status()
+            sink.begin(response.status_code, response.headers)
+            try:
+                for chunk in response.iter_content(chunk_size):
+                    sink.write(chunk)
+            except BaseException:
+                sink.abort()
+                raise
+        return sink.finish(started)
+    raise DownloadError(f"Could not download {path}")
+
+
+async def async_download(client, path: str, dest: Destination, method: str = 'get',
+                         checksum: Optional[str] = 'sha256', resume: bool = True,
+                         chunk_size: int = CHUNK_SIZE, **data) -> DownloadResult:
+    """Stream ``path`` with an AsyncClient, see download() for the parameters"""
+    sink = _Sink(dest, checksum, resume)
+    started = time.monotonic()
+    for _ in range(2):
+        async with client.open_stream(*_split(path), method=method, **dict(data, headers=_headers(sink, data))) as response:
+            if response.status_code == 416 and sink.offset:
+                if sink.complete(response.headers):
+                    sink.begin(206, {'content-range': f"bytes {sink.offset}-/{sink.offset}"})
+                    return sink.finish(started)
+                sink.restart()
+                continue
+            response.raise_for_status()
+            sink.begin(response.status_code, response.headers)
+            try:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    sink.write(chunk)
+            except BaseException:
+                sink.abort()
+                raise
+        return sink.finish(started)
+    raise DownloadError(f"Could not download {path}")
+
+
+class SnapshotResult(NamedTuple):
+    client: Any
+    channel: int
+    result: Optional[DownloadResult]
+    data: Optional[bytes]
+    error: Optional[str]
+
+
+def snapshot_filename(client, channel: int) -> str:
+    return f"{host_key(client.host).replace(':', '_')}_ch{channel}.jpg"
+
+
+async def fetch_snapshots(
+    targets: Iterable[Tuple[Any, int]],
+    directory: Optional[str] = None,
+    concurrency: int = 64,
+    per_device: int = 2,
+    checksum: Optional[str] = 'sha256',
+    stream: int = 1,
+) -> AsyncIterator[SnapshotResult]:
+    """Fetch JPEG snapshots of many channels of many DVRs
+
+    Results are yielded as they finish. Recorders struggle with many parallel
+    picture requests, so each device gets at most ``per_device`` at a time.
+
+    :param targets: Iterable of (AsyncClient, channel number) pairs
+    :param directory: (optional) Write ``<host>_<port>_ch<channel>.jpg`` files
+        here. Without it the pictures are returned in ``SnapshotResult.data``
+    :param concurrency: (optional) Pictures in flight across all devices
+    :param per_device: (optional) Pictures in flight per device
+    """
+    overall = asyncio.Semaphore(concurrency)
+    devices: Dict[str, asyncio.Semaphore] = {}
+
+    async def fetch(client, channel: int) -> SnapshotResult:
+        device = devices.setdefault(host_key(client.host), asyncio.Semaphore(per_device))
+        async with device, overall:
+            dest = os.path.join(directory, snapshot_filename(client, channel)) if directory else io.BytesIO()
+            try:
+                result = await async_download(client, picture_path(channel, stream), dest,
+                                              checksum=checksum, resume=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return SnapshotResult(client, channel, None, None, str(e) or type(e).__name__)
+        data = dest.getvalue() if isinstance(dest, io.BytesIO) else None
+        return SnapshotResult(client, channel, result, data, None)
+
+    tasks = [asyncio.ensure_future(fetch(client, channel)) for client, channel in targets]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Let cancelled downloads close their responses and files before returning
+        await asyncio.gather(*tasks, return_exceptions=True)
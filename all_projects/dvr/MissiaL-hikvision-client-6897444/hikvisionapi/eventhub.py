@@ -0,0 +1,246 @@
+# coding=utf-8
+"""
+Multiplexed alertStream subscriptions
+
+``EventHub`` keeps one ``Event/notification/alertStream`` subscription per
+device on a shared connection pool, reconnects with jittered exponential
+backoff and fans the parsed events into one bounded queue. When the consumer
+falls behind, the queue fills up and the device readers stop reading their
+sockets, so memory stays bounded no matter how many devices are streaming.
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+import httpx
+
+from .hikvisionapi import AsyncClient
+
+ALERT_STREAM = 'Event/notification/alertStream'
+
+_STOP = object()
+
+
+class HubEvent(NamedTuple):
+    device: str
+    seq: int
+    received_at: float
+    latency: Optional[float]
+    event: Any
+
+
+class DeviceStats:
+    """Counters of one device subscription"""
+
+    __slots__ = ('connected', 'events', 'reconnects', 'last_event_at', 'last_error',
+                 'latency_avg', 'latency_max')
+
+    def __init__(self):
+        self.connected = False
+        self.events = 0
+        self.reconnects = 0
+        self.last_event_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.latency_avg: Optional[float] = None
+        self.latency_max: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _event_type(event: Any) -> Optional[str]:
+    if isinstance(event, dict):
+        alert = event.get('EventNotificationAlert', event)
+        if isinstance(alert, dict):
+            return alert.get('eventType')
+    return None
+
+
+def _event_latency(event: Any, received_at: float) -> Optional[float]:
+    """Seconds between the device timestamp of an alert and its arrival"""
+    if not isinstance(event, dict):
+        return None
+    alert = event.get('EventNotificationAlert', event)
+    value = alert.get('dateTime') if isinstance(alert, dict) else None
+    if not value:
+        return None
+    try:
+        return received_at - datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class EventHub:
+    """
+    Event stream hub for many devices
+
+    Basic Usage::
+
+    from hikvisionapi.eventhub import EventHub
+
+    async with EventHub(maxsize=10000, event_types={'VMD', 'videoloss', 'hdError', 'tamperdetection'}) as hub:
+        for dvr in dvrs:
+            hub.add_device(f"http://{dvr['ip']}:{dvr['port']}", dvr['username'], dvr['password'])
+        async for item in hub:
+            print(item.device, item.seq, item.event)
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        event_types: Optional[Iterable[str]] = None,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        idle_timeout: Optional[float] = 90,
+        connect_timeout: float = 5,
+        spread: float = 0,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ):
+        """
+        :param maxsize: (optional) Events buffered before device readers are paused
+        :param event_types: (optional) Only forward alerts with these eventType values
+        :param backoff_base: (optional) First reconnect delay ceiling in seconds
+        :param backoff_max: (optional) Largest reconnect delay ceiling in seconds
+        :param idle_timeout: (optional) Reconnect when a stream is silent this long.
+            Devices send heartbeats every few seconds, None waits forever
+        :param connect_timeout: (optional) Timeout to open a subscription
+        :param spread: (optional) Spread the first connections over this many
+            seconds to avoid a connect storm
+        :param http_client: (optional) Shared httpx.AsyncClient for the streams
+        """
+        self.event_types = frozenset(event_types) if event_types is not None else None
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = httpx.Timeout(connect_timeout, read=idle_timeout)
+        self.spread = spread
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._owns_http_client = http_client is None
+        self._http_client = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        )
+        self._clients: Dict[str, AsyncClient] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._seq: Dict[str, int] = {}
+        self.stats: Dict[str, DeviceStats] = {}
+        self._started = False
+        self._closed = False
+
+    async def __aenter__(self) -> "EventHub":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    def __aiter__(self) -> "EventHub":
+        return self
+
+    async def __anext__(self) -> HubEvent:
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is _STOP:
+            raise StopAsyncIteration
+        return item
+
+    def add_device(self, host: str, login: str, password: str, key: Optional[str] = None) -> str:
+        """Subscribe to a device on the shared pool
+
+        :return the device key used in events and stats
+        """
+        client = AsyncClient(host, login, password, http_client=self._http_client)
+        return self.add_client(client, key)
+
+    def add_client(self, client: AsyncClient, key: Optional[str] = None) -> str:
+        """Subscribe with an existing AsyncClient"""
+        key = key or client.host
+        if key in self._clients:
+            raise ValueError(f"Device {key} is already subscribed")
+        self._clients[key] = client
+        self._seq[key] = 0
+        self.stats[key] = DeviceStats()
+        if self._started:
+            self._spawn(key)
+        return key
+
+    async def remove(self, key: str) -> None:
+        """Cancel the subscription of a device"""
+        task = self._tasks.pop(key, None)
+        self._clients.pop(key, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def start(self) -> None:
+        """Open the subscriptions of every device added so far"""
+        self._started = True
+        for key in self._clients:
+            if key not in self._tasks:
+                self._spawn(key)
+
+    async def get(self) -> HubEvent:
+        """Wait for the next event of any device"""
+        return await self.__anext__()
+
+    def _spawn(self, key: str) -> None:
+        self._tasks[key] = asyncio.ensure_future(self._subscribe(key))
+
+    async def _subscribe(self, key: str) -> None:
+        client = self._clients[key]
+        stats = self.stats[key]
+        if self.spread:
+            await asyncio.sleep(random.uniform(0, self.spread))
+
+        attempt = 0
+        while True:
+            try:
+                stream = client.request(ALERT_STREAM, method='get', type='stream', timeout=self.timeout)
+                async for event in stream:
+                    stats.connected = True
+                    attempt = 0
+                    await self._publish(key, stats, event)
+            except asyncio.CancelledError:
+                stats.connected = False
+                raise
+            except Exception as e:
+                stats.last_error = str(e) or type(e).__name__
+            stats.connected = False
+            stats.reconnects += 1
+            # Full jitter keeps thousands of devices from reconnecting in lockstep
+            ceiling = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+            attempt += 1
+            await asyncio.sleep(random.uniform(0, ceiling))
+
+    async def _publish(self, key: str, stats: DeviceStats, event: Any) -> None:
+        if self.event_types is not None and _event_type(event) not in self.event_types:
+            return
+        received_at = time.time()
+        latency = _event_latency(event, received_at)
+        self._seq[key] += 1
+        stats.events += 1
+        stats.last_event_at = received_at
+        if latency is not None:
+            stats.latency_avg = latency if stats.latency_avg is None else stats.latency_avg * 0.9 + latency * 0.1
+            stats.latency_max = latency if stats.latency_max is None else max(stats.latency_max, latency)
+        await self._queue.put(HubEvent(key, self._seq[key], received_at, latency, event))
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def aclose(self) -> None:
+        """Cancel every subscription and close the pool if the hub owns it"""
+        self._closed = True
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            self._queue.put_nowait(_STOP)
+        except asyncio.QueueFull:
+            pass
+        if self._owns_http_client:
+            await self._http_client.aclose()
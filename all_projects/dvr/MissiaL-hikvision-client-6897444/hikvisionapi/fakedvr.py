@@ -0,0 +1,529 @@
+# coding=utf-8
+"""
+Fake ISAPI device for tests and benchmarks
+
+A small asyncio HTTP/1.1 server with keep-alive that answers the ISAPI
+endpoints the clients use, so throughput can be measured without real DVRs.
+It can require Basic or Digest auth, add latency, jitter and errors, stream
+a multipart alertStream and pose as thousands of devices on one port.
+
+Every loopback address reaches a server listening on 0.0.0.0, so the
+virtual devices are told apart by the Host header: 127.0.0.1, 127.0.0.2 and
+so on are separate devices with their own serial number and counters.
+
+Usage::
+
+    python -m hikvisionapi.fakedvr --port 8000 --auth digest --latency 0.02 --jitter 0.01
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import os
+import random
+import threading
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+XML = 'application/xml; charset="UTF-8"'
+XMLNS = 'xmlns="http://www.hikvision.com/ver20/XMLSchema"'
+BOUNDARY = 'boundary'
+MAX_HEADER_SIZE = 16 * 1024
+AUTH_MODES = (None, 'basic', 'digest')
+
+_REASONS = {200: 'OK', 206: 'Partial Content', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+            416: 'Range Not Satisfiable', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+PICTURE_PREFIX = '/ISAPI/Streaming/channels/'
+_WILDCARDS = ('', '0.0.0.0')
+
+
+class Request(NamedTuple):
+    method: str
+    target: str
+    path: str
+    headers: Dict[str, str]
+    body: bytes
+
+
+class Response(NamedTuple):
+    status: int
+    body: bytes = b''
+    content_type: str = XML
+    headers: Tuple[Tuple[str, str], ...] = ()
+    # Close-delimited body written chunk by chunk, used for alertStream
+    stream: Optional[AsyncIterator[bytes]] = None
+
+
+class VirtualDevice:
+    """State of one device served by a FakeDVR"""
+
+    __slots__ = ('name', 'index', 'channels', 'no_video', 'requests', 'events')
+
+    def __init__(self, name: str, index: int, channels: int, no_video: frozenset):
+        self.name = name
+        self.index = index
+        self.channels = channels
+        self.no_video = no_video
+        self.requests = 0
+        self.events = 0
+
+    @property
+    def serial(self) -> str:
+        return f"DS-7216HQHI-K1{self.index:016d}"
+
+
+Handler = Callable[[VirtualDevice, Request], Awaitable[Response]]
+
+
+def _xml(text: str) -> Response:
+    return Response(200, ('<?xml version="1.0" encoding="UTF-8"?>\n' + text).encode())
+
+
+def _md5(text: str) -> str:
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def _digest_params(header: str) -> Dict[str, str]:
+    params = {}
+    for item in header.split(','):
+        key, _, value = item.strip().partition('=')
+        params[key.strip().lower()] = value.strip().strip('"')
+    return params
+
+
+def loopback_hosts(count: int) -> List[str]:
+    """Distinct loopback addresses 127.0.0.1, 127.0.0.2, ... skipping .0 and .255"""
+    hosts = []
+    number = 1
+    while len(hosts) < count:
+        octets = ((number >> 16) & 255, (number >> 8) & 255, number & 255)
+        if octets[2] not in (0, 255):
+            hosts.append('127.%d.%d.%d' % octets)
+        number += 1
+        if number >= 1 << 24:
+            raise ValueError("Not enough loopback addresses")
+    return hosts
+
+
+class FakeDVR:
+    """
+    Fake Hikvision recorder
+
+    Basic Usage::
+
+    async with FakeDVR(auth='digest') as dvr:
+        cam = AsyncClient(dvr.url, 'admin', 'admin')
+        await cam.System.status(method='get')
+
+    or from synchronous code
+
+    with FakeDVR().run_in_thread() as dvr:
+        Client(dvr.url, 'admin', 'admin').System.status(method='get')
+
+    or as a thousand devices on one port
+
+    async with FakeDVR(host='0.0.0.0') as dvr:
+        urls = dvr.virtual_hosts(1000)
+    """
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        channels: int = 16,
+        no_video: Tuple[int, ...] = (),
+        ip_channels: int = 0,
+        offline: Tuple[int, ...] = (),
+        hdds: int = 2,
+        auth: Optional[str] = None,
+        login: str = 'admin',
+        password: str = 'admin',
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        event_interval: float = 1.0,
+        picture_size: int = 64 * 1024,
+        recording_size: int = 1024 * 1024,
+        seed: Optional[int] = None,
+    ):
+        """
+        :param host: (optional) Address to listen on, 0.0.0.0 for virtual hosts
+        :param port: (optional) Port to listen on, 0 picks a free one
+        :param channels: (optional) Number of analog channels
+        :param no_video: (optional) Channel numbers that report NO VIDEO
+        :param ip_channels: (optional) Number of IP channels in
+            ContentMgmt/InputProxy/channels/status, 0 answers it with 404 like a DVR.
+            They are numbered after the analog channels, as hybrid recorders do
+        :param offline: (optional) IP channels the NVR cannot reach, 1 is the first IP channel
+        :param hdds: (optional) Number of disks in ContentMgmt/Storage
+        :param auth: (optional) None, 'basic' or 'digest'. Digest devices reject Basic
+        :param login: (optional) Login accepted when auth is enabled
+        :param password: (optional) Password accepted when auth is enabled
+        :param latency: (optional) Seconds added before every response
+        :param jitter: (optional) Latency varies uniformly by up to this many seconds
+        :param error_rate: (optional) Share of authenticated requests answered with 503
+        :param event_interval: (optional) Seconds between alertStream events
+        :param picture_size: (optional) Bytes in a channel picture
+        :param recording_size: (optional) Bytes in a ContentMgmt/download clip
+        :param seed: (optional) Seed for jitter and errors, to make runs repeatable
+        """
+        if auth not in AUTH_MODES:
+            raise ValueError(f"auth must be one of {AUTH_MODES}")
+        self.host = host
+        self.port = port
+        self.channels = channels
+        self.no_video = frozenset(no_video)
+        self.ip_channels = ip_channels
+        self.offline = frozenset(offline)
+        self.hdds = hdds
+        self.auth = auth
+        self.login = login
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.event_interval = event_interval
+        self.picture_size = picture_size
+        self.recording_size = recording_size
+        self.realm = 'DS-FAKE'
+        self.nonce = base64.b64encode(os.urandom(16)).decode()
+        self.requests = 0
+        self.connections = 0
+        self.errors = 0
+        self.devices: Dict[str, VirtualDevice] = {}
+        self._random = random.Random(seed)
+        self.routes: Dict[Tuple[str, str], Handler] = {
+            ('GET', '/ISAPI/System/status'): self.system_status,
+            ('GET', '/ISAPI/System/deviceInfo'): self.device_info,
+            ('GET', '/ISAPI/System/time'): self.system_time,
+            ('GET', '/ISAPI/System/Video/inputs/channels'): self.video_channels,
+            ('GET', '/ISAPI/ContentMgmt/InputProxy/channels/status'): self.proxy_channels_status,
+            ('GET', '/ISAPI/ContentMgmt/Storage'): self.storage,
+            ('POST', '/ISAPI/ContentMgmt/search'): self.search,
+            ('GET', '/ISAPI/Event/notification/alertStream'): self.alert_stream,
+            ('GET', '/ISAPI/ContentMgmt/download'): self.recording,
+            ('POST', '/ISAPI/ContentMgmt/download'): self.recording,
+        }
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers = set()
+
+    @property
+    def url(self) -> str:
+        host = '127.0.0.1' if self.host in _WILDCARDS else self.host
+        return f"http://{host}:{self.port}"
+
+    def virtual_hosts(self, count: int) -> List[str]:
+        """Base URLs of ``count`` distinct devices served by this server"""
+        if self.host not in _WILDCARDS:
+            raise ValueError("Virtual hosts need the server to listen on 0.0.0.0")
+        return [f"http://{host}:{self.port}" for host in loopback_hosts(count)]
+
+    def device(self, name: str) -> VirtualDevice:
+        device = self.devices.get(name)
+        if device is None:
+            device = self.devices[name] = VirtualDevice(name, len(self.devices) + 1, self.channels, self.no_video)
+        return device
+
+    async def __aenter__(self) -> "FakeDVR":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host or None, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Keep-alive and stream connections would otherwise outlive the server
+            handlers = list(self._handlers)
+            for task in handlers:
+                task.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def run_in_thread(self) -> "_ServerThread":
+        """Run the server on its own event loop in a daemon thread"""
+        return _ServerThread(self)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        sockname = writer.get_extra_info('sockname')
+        local_host = sockname[0] if sockname else '127.0.0.1'
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                self.requests += 1
+                name = request.headers.get('host', local_host).rsplit(':', 1)[0] or local_host
+                device = self.device(name)
+                device.requests += 1
+                response = await self.dispatch(device, request)
+                keep_alive = response.stream is None and request.headers.get('connection', '').lower() != 'close'
+                writer.write(self._encode(response, keep_alive))
+                await writer.drain()
+                if response.stream is not None:
+                    async for chunk in response.stream:
+                        writer.write(chunk)
+                        await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        head = await reader.readuntil(b'\r\n\r\n') if not reader.at_eof() else b''
+        if not head:
+            return None
+        if len(head) > MAX_HEADER_SIZE:
+            raise ConnectionError("Request headers too large")
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            name, colon, value = line.partition(':')
+            if colon:
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length') or 0)
+        body = await reader.readexactly(length) if length else b''
+        return Request(method.upper(), target, target.split('?', 1)[0], headers, body)
+
+    def _authorized(self, request: Request) -> bool:
+        header = request.headers.get('authorization', '')
+        scheme, _, credentials = header.partition(' ')
+        scheme = scheme.lower()
+        if self.auth == 'basic' and scheme == 'basic':
+            try:
+                login, _, password = base64.b64decode(credentials).decode().partition(':')
+            except ValueError:
+                return False
+            return login == self.login and password == self.password
+        if self.auth == 'digest' and scheme == 'digest':
+            params = _digest_params(credentials)
+            if params.get('username') != self.login or params.get('nonce') != self.nonce:
+                return False
+            ha1 = _md5(f"{self.login}:{self.realm}:{self.password}")
+            ha2 = _md5(f"{request.method}:{params.get('uri', '')}")
+            if params.get('qop'):
+                expected = _md5(f"{ha1}:{self.nonce}:{params.get('nc')}:{params.get('cnonce')}:{params['qop']}:{ha2}")
+            else:
+                expected = _md5(f"{ha1}:{self.nonce}:{ha2}")
+            return params.get('response') == expected
+        return False
+
+    def _challenge(self) -> Response:
+        if self.auth == 'basic':
+            challenge = f'Basic realm="{self.realm}"'
+        else:
+            challenge = f'Digest qop="auth", realm="{self.realm}", nonce="{self.nonce}", stale="FALSE"'
+        return Response(401, b'', 'text/html', (('WWW-Authenticate', challenge),))
+
+    async def dispatch(self, device: VirtualDevice, request: Request) -> Response:
+        delay = self.latency + (self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.auth is not None and not self._authorized(request):
+            return self._challenge()
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            return Response(503, b'')
+        handler = self.routes.get((request.method, request.path))
+        if handler is None and request.path.startswith(PICTURE_PREFIX) and request.path.endswith('/picture'):
+            handler = self.picture
+        if handler is None:
+            return Response(404, b'')
+        return await handler(device, request)
+
+    @staticmethod
+    def _encode(response: Response, keep_alive: bool) -> bytes:
+        head = [
+            f"HTTP/1.1 {response.status} {_REASONS.get(response.status, 'Unknown')}",
+            f"Content-Type: {response.content_type}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if response.stream is None:
+            head.append(f"Content-Length: {len(response.body)}")
+        head.extend(f"{name}: {value}" for name, value in response.headers)
+        return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + response.body
+
+    async def system_status(self, device: VirtualDevice, request: Request) -> Response:
+        return _xml(
+            f'<DeviceStatus version="2.0" {XMLNS}><currentDeviceTime>{datetime.now().isoformat()}'
+            '</currentDeviceTime><deviceUpTime>86400</deviceUpTime><status>ok</status></DeviceStatus>'
+        )
+
+    async def device_info(self, device: VirtualDevice, request: Request) -> Response:
+        return _xml(
+            f'<DeviceInfo version="2.0" {XMLNS}><deviceName>Fake DVR {device.name}</deviceName>'
+            f'<model>DS-7216HQHI-K1</model><serialNumber>{device.serial}</serialNumber>'
+            '<firmwareVersion>V4.21.005</firmwareVersion><deviceType>DVR</deviceType></DeviceInfo>'
+        )
+
+    async def system_time(self, device: VirtualDevice, request: Request) -> Response:
+        return _xml(
+            f'<Time version="2.0" {XMLNS}><timeMode>NTP</timeMode>'
+            f'<localTime>{datetime.now().strftime("%Y-%m-%dT%H:%M:%S+05:30")}</localTime>'
+            '<timeZone>CST-5:30:00</timeZone></Time>'
+        )
+
+    async def video_channels(self, device: VirtualDevice, request: Request) -> Response:
+        channels = ''.join(
+            f'<VideoInputChannel version="2.0" {XMLNS}><id>{number}</id><inputPort>{number}</inputPort>'
+            f'<videoInputEnabled>true</videoInputEnabled><name>Camera {number:02d}</name>'
+            f'<resDesc>{"NO VIDEO" if number in device.no_video else "1080P25"}</resDesc></VideoInputChannel>'
+            for number in range(1, device.channels + 1)
+        )
+        return _xml(f'<VideoInputChannelList version="2.0" {XMLNS}>{channels}</VideoInputChannelList>')
+
+    async def proxy_channels_status(self, device: VirtualDevice, request: Request) -> Response:
+        if not self.ip_channels:
+            return Response(404, b'')
+        channels = ''.join(
+            f'<InputProxyChannelStatus version="2.0" {XMLNS}><id>{device.channels + number}</id>'
+            '<sourceInputPortDescriptor><proxyProtocol>HIKVISION</proxyProtocol>'
+            f'<addressingFormatType>ipaddress</addressingFormatType><ipAddress>192.168.254.{number}</ipAddress>'
+            '<managePortNo>8000</managePortNo><srcInputPort>1</srcInputPort><userName>admin</userName>'
+            '<streamType>auto</streamType></sourceInputPortDescriptor>'
+            f'<online>{"false" if number in self.offline else "true"}</online>'
+            f'<chanDetectResult>{"NETWORK_UNREACHABLE" if number in self.offline else "connect"}</chanDetectResult>'
+            '</InputProxyChannelStatus>'
+            for number in range(1, self.ip_channels + 1)
+        )
+        return _xml(f'<InputProxyChannelStatusList version="2.0" {XMLNS}>{channels}</InputProxyChannelStatusList>')
+
+    async def storage(self, device: VirtualDevice, request: Request) -> Response:
+        hdds = ''.join(
+            f'<hdd version="2.0" {XMLNS}><id>{number}</id><hddName>hdd{number}</hddName>'
+            '<hddType>SATA</hddType><status>ok</status><capacity>1907729</capacity>'
+            '<freeSpace>0</freeSpace><property>RW</property></hdd>'
+            for number in range(1, self.hdds + 1)
+        )
+        return _xml(f'<storage version="2.0" {XMLNS}><hddList>{hdds}</hddList><workMode>group</workMode></storage>')
+
+    async def search(self, device: VirtualDevice, request: Request) -> Response:
+        today = datetime.now().strftime('%Y-%m-%d')
+        return _xml(
+            f'<CMSearchResult version="2.0" {XMLNS}><responseStatus>true</responseStatus>'
+            '<responseStatusStrg>OK</responseStatusStrg><numOfMatches>1</numOfMatches><matchList>'
+            '<searchMatchItem><trackID>101</trackID><timeSpan>'
+            f'<startTime>{today}T00:00:00Z</startTime><endTime>{today}T23:59:59Z</endTime>'
+            '</timeSpan></searchMatchItem></matchList></CMSearchResult>'
+        )
+
+    @staticmethod
+    def _ranged(request: Request, body: bytes, content_type: str) -> Response:
+        """Answer a Range request with 206, 416 or the whole body"""
+        value = request.headers.get('range', '')
+        if not value.startswith('bytes='):
+            return Response(200, body, content_type, (('Accept-Ranges', 'bytes'),))
+        start, _, end = value[6:].partition('-')
+        start = int(start or 0)
+        end = min(int(end), len(body) - 1) if end else len(body) - 1
+        if start >= len(body):
+            return Response(416, b'', content_type, (('Content-Range', f"bytes */{len(body)}"),))
+        return Response(206, body[start:end + 1], content_type,
+                        (('Content-Range', f"bytes {start}-{end}/{len(body)}"),))
+
+    @staticmethod
+    def _payload(seed: str, size: int) -> bytes:
+        block = hashlib.sha256(seed.encode()).digest()
+        return (block * (size // len(block) + 1))[:size]
+
+    async def picture(self, device: VirtualDevice, request: Request) -> Response:
+        stream_id = request.path[len(PICTURE_PREFIX):-len('/picture')]
+        if not stream_id.isdigit() or not 1 <= int(stream_id) // 100 <= device.channels:
+            return Response(404, b'')
+        # Same bytes for the same device and channel, framed like a JPEG
+        body = b'\xff\xd8' + self._payload(f"{device.name}/{stream_id}", self.picture_size - 4) + b'\xff\xd9'
+        return self._ranged(request, body, 'image/jpeg')
+
+    async def recording(self, device: VirtualDevice, request: Request) -> Response:
+        body = self._payload(f"{device.name}/{request.body!r}", self.recording_size)
+        return self._ranged(request, body, 'video/mp4')
+
+    async def alert_stream(self, device: VirtualDevice, request: Request) -> Response:
+        return Response(200, content_type=f'multipart/mixed; boundary={BOUNDARY}', stream=self._events(device))
+
+    async def _events(self, device: VirtualDevice) -> AsyncIterator[bytes]:
+        """Alerts cycling through the channels, with videoloss heartbeats in between"""
+        while True:
+            device.events += 1
+            channel = (device.events - 1) % device.channels + 1
+            event_type, state = ('VMD', 'active') if device.events % 2 else ('videoloss', 'inactive')
+            body = (
+                f'<EventNotificationAlert version="2.0" {XMLNS}><ipAddress>{device.name}</ipAddress>'
+                f'<channelID>{channel}</channelID><dateTime>{datetime.now().astimezone().isoformat()}</dateTime>'
+                f'<activePostCount>{device.events}</activePostCount><eventType>{event_type}</eventType>'
+                f'<eventState>{state}</eventState></EventNotificationAlert>'
+            ).encode()
+            yield (
+                f'--{BOUNDARY}\r\nContent-Type: application/xml; charset="UTF-8"\r\n'
+                f'Content-Length: {len(body)}\r\n\r\n'
+            ).encode() + body + b'\r\n'
+            await asyncio.sleep(self.event_interval)
+
+
+class _ServerThread:
+    def __init__(self, dvr: FakeDVR):
+        self.dvr = dvr
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self) -> FakeDVR:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.dvr.start(), self.loop).result()
+        return self.dvr
+
+    def __exit__(self, *exc_info) -> None:
+        asyncio.run_coroutine_threadsafe(self.dvr.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m hikvisionapi.fakedvr', description='Serve a fake ISAPI device')
+    parser.add_argument('--host', default='127.0.0.1', help='Listen address, 0.0.0.0 for virtual hosts')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--channels', type=int, default=16)
+    parser.add_argument('--ip-channels', type=int, default=0, help='IP channels of an NVR')
+    parser.add_argument('--auth', choices=('basic', 'digest'), default=None)
+    parser.add_argument('--login', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random latency variation in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--event-interval', type=float, default=1.0, help='Seconds between alertStream events')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    dvr = FakeDVR(
+        args.host, args.port, channels=args.channels, ip_channels=args.ip_channels, auth=args.auth, login=args.login,
+        password=args.password, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, event_interval=args.event_interval, seed=args.seed,
+    )
+    try:
+        asyncio.run(dvr.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,151 @@
+# coding=utf-8
+"""
+Per-device cache of slow-changing snapshot fields
+
+HDD capacity changes over weeks and the oldest recording moves once a day
+when the disks wrap, but finding them costs a storage query and a track
+search on every sweep. ``FieldCache`` keeps the last value of each field per
+``host:port`` with its own time to live, so most sweeps only ask the device
+for what really moves. The newest recording is cached for a short time and,
+once expired, its previous value still narrows the next search.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from .authcache import host_key
+from .channels import ChannelStatus
+from .snapshot import HddInfo
+
+SAVE_INTERVAL = 1.0
+
+# Seconds each cached value stays fresh. Fields without a TTL are never cached
+DEFAULT_TTLS = {
+    'storage': 15 * 60,
+    'recording_start': 6 * 3600,
+    'recording_end': 5 * 60,
+}
+
+# Rebuild typed values from their JSON form
+_DECODERS: Dict[str, Callable[[Any], Any]] = {
+    'storage': lambda value: [HddInfo(*item) for item in value],
+    'channels': lambda value: [ChannelStatus(*item) for item in value],
+}
+
+
+class _Entry:
+    __slots__ = ('value', 'expires')
+
+    def __init__(self, value: Any, expires: float):
+        self.value = value
+        self.expires = expires
+
+
+class FieldCache:
+    """
+    Thread-safe field cache keyed by ``host:port`` and field name
+
+    Basic Usage::
+
+    from hikvisionapi.fieldcache import FieldCache
+    cache = FieldCache(ttls={'storage': 3600, 'recording_end': 120}, path='fields.json')
+    snapshot = await cam.health_snapshot(cache=cache)
+    """
+
+    def __init__(self, ttls: Optional[Mapping[str, float]] = None, path: Optional[str] = None):
+        """
+        :param ttls: (optional) Seconds per cache key, merged over DEFAULT_TTLS.
+            Keys are snapshot fields, plus 'recording_start' and 'recording_end'
+            for the two halves of 'recording'. A TTL of 0 disables caching the key
+        :param path: (optional) JSON file the cache is persisted to, so one-shot
+            sweeps started by cron share it
+        """
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._load()
+            atexit.register(self.flush)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fd:
+                stored = json.load(fd)
+        except (OSError, ValueError):
+            return
+        for host, fields in stored.items():
+            for name, (value, expires) in fields.items():
+                decode = _DECODERS.get(name)
+                try:
+                    self._entries[(host, name)] = _Entry(decode(value) if decode else value, expires)
+                except (TypeError, ValueError):
+                    continue
+
+    def _save(self, force: bool = False) -> None:
+        self._dirty = True
+        if not self.path or not (force or time.monotonic() - self._saved_at >= SAVE_INTERVAL):
+            return
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        stored: Dict[str, Dict[str, Any]] = {}
+        for (host, name), entry in self._entries.items():
+            stored.setdefault(host, {})[name] = [entry.value, entry.expires]
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.fieldcache')
+            with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+                json.dump(stored, tmp)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def caches(self, name: str) -> bool:
+        return self.ttls.get(name, 0) > 0
+
+    def get(self, host: str, name: str) -> Any:
+        """Fresh value of ``name`` for ``host``, or None"""
+        with self._lock:
+            entry = self._entries.get((host_key(host), name))
+            if entry is None or entry.expires <= time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry.value
+
+    def stale(self, host: str, name: str) -> Any:
+        """Last value of ``name`` for ``host`` even if expired, or None"""
+        with self._lock:
+            entry = self._entries.get((host_key(host), name))
+            return None if entry is None else entry.value
+
+    def set(self, host: str, name: str, value: Any) -> None:
+        ttl = self.ttls.get(name, 0)
+        if ttl <= 0 or value is None:
+            return
+        with self._lock:
+            self._entries[(host_key(host), name)] = _Entry(value, time.time() + ttl)
+            self._save()
+
+    def invalidate(self, host: str, name: Optional[str] = None) -> None:
+        """Forget one field of ``host``, or all of them, e.g. after a disk swap"""
+        key = host_key(host)
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == key and (name is None or k[1] == name)]:
+                del self._entries[entry_key]
+            self._save()
+
+    def flush(self) -> None:
+        """Write pending changes to ``path``"""
+        with self._lock:
+            if self._dirty:
+                self._save(force=True)
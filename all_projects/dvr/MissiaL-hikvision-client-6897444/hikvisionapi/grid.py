@@ -0,0 +1,256 @@
+# coding=utf-8
+"""
+Snapshot grid capture with thumbnails
+
+Pictures of many (DVR, channel) pairs are fetched with ``fetch_snapshots``,
+which caps the requests in flight per recorder, and handed to a process pool
+that decodes and downscales them to fixed-size JPEG thumbnails. Thumbnails
+are stored under the SHA-256 of the source picture, so a frame that did not
+change since the last sweep (a static scene, a "NO VIDEO" screen) is found
+in the cache and never decoded again.
+
+Decoding needs Pillow: ``pip install hikvisionapi[thumbnails]``.
+
+Usage::
+
+    python -m hikvisionapi.grid devices.csv --channels 1-16 --cache thumbs > grid.ndjson
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import io
+import json
+import os
+import sys
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+from .authcache import host_key
+from .download import SnapshotResult, fetch_snapshots
+from .hikvisionapi import AsyncClient
+from .poller import load_devices
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+SIZE = (320, 180)
+QUALITY = 75
+
+Encoder = Callable[[bytes, Tuple[int, int], int], bytes]
+
+
+class Thumbnail(NamedTuple):
+    client: Any
+    channel: int
+    key: Optional[str]
+    path: Optional[str]
+    cached: bool
+    error: Optional[str]
+
+
+def make_thumbnail(data: bytes, size: Tuple[int, int] = SIZE, quality: int = QUALITY) -> bytes:
+    """Downscale a JPEG to exactly ``size``, letterboxed to keep the aspect ratio"""
+    if Image is None:
+        raise ImportError("Thumbnails require Pillow: pip install Pillow")
+    with Image.open(io.BytesIO(data)) as image:
+        # Lets the JPEG decoder scale by 1/2 to 1/8 while decoding
+        image.draft('RGB', size)
+        image = image.convert('RGB')
+    image.thumbnail(size, Image.BILINEAR)
+    canvas = Image.new('RGB', size)
+    canvas.paste(image, ((size[0] - image.width) // 2, (size[1] - image.height) // 2))
+    output = io.BytesIO()
+    canvas.save(output, 'JPEG', quality=quality)
+    return output.getvalue()
+
+
+def _encode(encoder: Encoder, data: bytes, path: str, size: Tuple[int, int], quality: int) -> None:
+    """Runs in a pool worker and writes the thumbnail atomically"""
+    thumbnail = encoder(data, size, quality)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as fd:
+        fd.write(thumbnail)
+    os.replace(tmp_path, path)
+
+
+class GridCapture:
+    """
+    Capture engine for a wall of camera thumbnails
+
+    Basic Usage::
+
+    with GridCapture('thumbs', size=(320, 180), per_device=2) as grid:
+        async for thumb in grid.capture([(cam, channel) for channel in range(1, 17)]):
+            print(thumb.channel, thumb.path, thumb.cached)
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        size: Tuple[int, int] = SIZE,
+        quality: int = QUALITY,
+        per_device: int = 2,
+        concurrency: int = 64,
+        workers: Optional[int] = None,
+        encoder: Encoder = make_thumbnail,
+        executor: Optional[concurrent.futures.Executor] = None,
+    ):
+        """
+        :param cache_dir: Directory of the content-addressed thumbnail cache
+        :param size: (optional) Thumbnail width and height
+        :param quality: (optional) JPEG quality of the thumbnails
+        :param per_device: (optional) Picture requests in flight per recorder
+        :param concurrency: (optional) Picture requests in flight overall
+        :param workers: (optional) Processes decoding pictures, defaults to the CPU count
+        :param encoder: (optional) Picklable ``(data, size, quality) -> bytes`` function
+        :param executor: (optional) Executor to use instead of a private process pool
+        """
+        self.cache_dir = cache_dir
+        self.size = tuple(size)
+        self.quality = quality
+        self.per_device = per_device
+        self.concurrency = concurrency
+        self.workers = workers
+        self.encoder = encoder
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._pending: Dict[str, asyncio.Future] = {}
+        # Latest thumbnail of every camera, keyed by (host:port, channel)
+        self.latest: Dict[Tuple[str, int], str] = {}
+
+    def path_for(self, key: str) -> str:
+        width, height = self.size
+        return os.path.join(self.cache_dir, key[:2], f"{key}_{width}x{height}.jpg")
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        return self._executor
+
+    async def _thumbnail(self, item: SnapshotResult) -> Thumbnail:
+        if item.error is not None:
+            return Thumbnail(item.client, item.channel, None, None, False, item.error)
+        key = item.result.checksum
+        path = self.path_for(key)
+        cached = True
+        try:
+            pending = self._pending.get(key)
+            if pending is not None:
+                # The same frame is being encoded for another camera
+                await asyncio.shield(pending)
+            elif not os.path.exists(path):
+                cached = False
+                loop = asyncio.get_running_loop()
+                pending = self._pending[key] = loop.run_in_executor(
+                    self.executor, _encode, self.encoder, item.data, path, self.size, self.quality
+                )
+                try:
+                    await pending
+                finally:
+                    del self._pending[key]
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return Thumbnail(item.client, item.channel, key, None, False, str(e) or type(e).__name__)
+        self.latest[(host_key(item.client.host), item.channel)] = path
+        return Thumbnail(item.client, item.channel, key, path, cached, None)
+
+    async def capture(self, targets: Iterable[Tuple[AsyncClient, int]]) -> AsyncIterator[Thumbnail]:
+        """Fetch and thumbnail every (client, channel) pair, yielding as they finish
+
+        Decoding overlaps with the downloads of the other pictures.
+        """
+        tasks = set()
+        try:
+            async for item in fetch_snapshots(targets, concurrency=self.concurrency, per_device=self.per_device):
+                tasks.add(asyncio.ensure_future(self._thumbnail(item)))
+                done = {task for task in tasks if task.done()}
+                for task in done:
+                    tasks.discard(task)
+                    yield task.result()
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def close(self) -> None:
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _channels(value: str) -> List[int]:
+    """Parse '1-16' or '1,2,5' into channel numbers"""
+    channels = []
+    for part in value.split(','):
+        start, _, end = part.partition('-')
+        channels.extend(range(int(start), int(end or start) + 1))
+    return channels
+
+
+async def _run(args, output) -> int:
+    devices = load_devices(args.source, args.format)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    count = 0
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as http_client:
+        clients = [
+            (device, AsyncClient(f"http://{device['ip']}:{device['port']}", device['username'],
+                                 device['password'], timeout=args.timeout, http_client=http_client))
+            for device in devices
+        ]
+        owners = {id(client): device for device, client in clients}
+        targets = [(client, channel) for _, client in clients for channel in args.channels]
+        with GridCapture(args.cache, size=args.size, quality=args.quality, per_device=args.per_device,
+                         concurrency=args.concurrency, workers=args.workers) as grid:
+            async for thumb in grid.capture(targets):
+                device = owners[id(thumb.client)]
+                output.write(json.dumps({
+                    'ip': device['ip'], 'port': device['port'], 'channel': thumb.channel, 'key': thumb.key,
+                    'path': thumb.path, 'cached': thumb.cached, 'error': thumb.error,
+                }) + '\n')
+                count += 1
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m hikvisionapi.grid',
+        description='Capture a thumbnail of every channel of every DVR',
+    )
+    parser.add_argument('source', help="Device list (.json, .ndjson or .csv), '-' for stdin")
+    parser.add_argument('--format', choices=('json', 'ndjson', 'csv'), default=None)
+    parser.add_argument('--channels', type=_channels, default=_channels('1-16'),
+                        help="Channels to capture, e.g. '1-16' or '1,3,5' (default: 1-16)")
+    parser.add_argument('--cache', default='thumbnails', help='Thumbnail cache directory')
+    parser.add_argument('--size', type=lambda value: tuple(int(n) for n in value.split('x')), default=SIZE,
+                        help='Thumbnail size as WIDTHxHEIGHT (default: 320x180)')
+    parser.add_argument('--quality', type=int, default=QUALITY)
+    parser.add_argument('--per-device', type=int, default=2,
+                        help='Picture requests in flight per DVR (default: 2)')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='Picture requests in flight overall (default: 64)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Decoding processes (default: CPU count)')
+    parser.add_argument('--timeout', type=float, default=10)
+    args = parser.parse_args(argv)
+
+    count = asyncio.run(_run(args, sys.stdout))
+    print(f"{count} thumbnails", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
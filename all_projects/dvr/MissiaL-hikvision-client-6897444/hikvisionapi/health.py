@@ -0,0 +1,237 @@
+# coding=utf-8
+"""
+Per-device latency tracking, adaptive timeouts and a circuit breaker
+
+A fixed timeout makes every offline DVR cost the full timeout for every
+endpoint on every sweep. The tracker keeps a window of round-trip times per
+``host:port`` and derives the connect timeout from their percentiles, so a
+device that normally answers in 40 ms is given up on after a fraction of a
+second instead of seconds. After a few consecutive failures to connect the
+circuit opens: requests to the device fail at once with ``CircuitOpenError``
+and a single probe is let through on a schedule that backs off while the
+device stays dead.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from .authcache import host_key
+
+CLOSED = 'closed'
+OPEN = 'open'
+SAVE_INTERVAL = 1.0
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of contacting a device that is known to be down"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Circuit open for {host}, next probe in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class _HostState:
+    __slots__ = ('samples', 'failures', 'state', 'next_probe', 'probe_interval')
+
+    def __init__(self, window: int, probe_interval: float):
+        self.samples = deque(maxlen=window)
+        self.failures = 0
+        self.state = CLOSED
+        self.next_probe = 0.0
+        self.probe_interval = probe_interval
+
+
+class HealthTracker:
+    """
+    Thread-safe latency and failure tracker keyed by ``host:port``
+
+    Basic Usage::
+
+    from hikvisionapi.health import HealthTracker
+    tracker = HealthTracker(failure_threshold=3, probe_interval=30)
+    api = AsyncClient('http://192.168.0.2', 'admin', 'admin', health=tracker)
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        multiplier: float = 4.0,
+        min_timeout: float = 0.5,
+        min_samples: int = 5,
+        window: int = 50,
+        failure_threshold: int = 3,
+        probe_interval: float = 30,
+        probe_max: float = 1800,
+        path: Optional[str] = None,
+    ):
+        """
+        :param percentile: (optional) RTT percentile the connect timeout is based on
+        :param multiplier: (optional) Connect timeout is the percentile times this
+        :param min_timeout: (optional) Lower bound of the adaptive connect timeout
+        :param min_samples: (optional) Samples needed before the timeout adapts
+        :param window: (optional) Number of recent RTT samples kept per device
+        :param failure_threshold: (optional) Consecutive network failures that
+            open the circuit, 0 disables the breaker
+        :param probe_interval: (optional) Seconds before the first probe of an open circuit
+        :param probe_max: (optional) The probe interval doubles after every failed
+            probe up to this many seconds
+        :param path: (optional) JSON file the state is persisted to, so short-lived
+            sweeps remember which devices are down
+        """
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.min_samples = min_samples
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.probe_max = probe_max
+        self.path = path
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, _HostState] = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        if path:
+            self._load()
+            atexit.register(self.flush)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fd:
+                stored = json.load(fd)
+        except (OSError, ValueError):
+            return
+        for key, item in stored.items():
+            state = _HostState(self.window, self.probe_interval)
+            state.samples.extend(item.get('samples', []))
+            state.failures = item.get('failures', 0)
+            state.state = OPEN if item.get('state') == OPEN else CLOSED
+            state.next_probe = item.get('next_probe', 0.0)
+            state.probe_interval = item.get('probe_interval', self.probe_interval)
+            self._hosts[key] = state
+
+    def _save(self, force: bool = False) -> None:
+        self._dirty = True
+        if not self.path or not (force or time.monotonic() - self._saved_at >= SAVE_INTERVAL):
+            return
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        stored = {
+            key: {
+                'samples': list(state.samples),
+                'failures': state.failures,
+                'state': state.state,
+                'next_probe': state.next_probe,
+                'probe_interval': state.probe_interval,
+            }
+            for key, state in self._hosts.items()
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.health')
+            with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+                json.dump(stored, tmp)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def _state(self, host: str) -> _HostState:
+        key = host_key(host)
+        state = self._hosts.get(key)
+        if state is None:
+            state = self._hosts[key] = _HostState(self.window, self.probe_interval)
+        return state
+
+    def check(self, host: str) -> None:
+        """Raise CircuitOpenError unless a request to ``host`` may be sent
+
+        When the circuit is open and a probe is due, the caller becomes the
+        probe and the next one is scheduled, so only one request at a time
+        reaches a dead device.
+        """
+        with self._lock:
+            state = self._hosts.get(host_key(host))
+            if state is None or state.state == CLOSED:
+                return
+            now = time.time()
+            if now < state.next_probe:
+                raise CircuitOpenError(host_key(host), state.next_probe - now)
+            state.next_probe = now + state.probe_interval
+
+    def timeout_for(self, host: str, default: Optional[float]) -> Optional[float]:
+        """Connect timeout for ``host``
+
+        Derived from the RTT percentile once enough samples exist, never
+        longer than ``default``.
+        """
+        with self._lock:
+            state = self._hosts.get(host_key(host))
+            if state is None or len(state.samples) < self.min_samples:
+                return default
+            samples = sorted(state.samples)
+        rtt = samples[int(self.percentile * (len(samples) - 1))]
+        timeout = max(self.min_timeout, rtt * self.multiplier)
+        return timeout if default is None else min(timeout, default)
+
+    def record_success(self, host: str, rtt: float) -> None:
+        """Record a response from ``host`` that took ``rtt`` seconds"""
+        with self._lock:
+            state = self._state(host)
+            state.samples.append(round(rtt, 4))
+            state.failures = 0
+            state.state = CLOSED
+            state.probe_interval = self.probe_interval
+            self._save()
+
+    def record_failure(self, host: str) -> None:
+        """Record a connect error or connect timeout talking to ``host``"""
+        with self._lock:
+            state = self._state(host)
+            state.failures += 1
+            if state.state == OPEN:
+                # A failed probe: back off further
+                state.probe_interval = min(self.probe_max, state.probe_interval * 2)
+                state.next_probe = time.time() + state.probe_interval
+            elif self.failure_threshold and state.failures >= self.failure_threshold:
+                state.state = OPEN
+                state.probe_interval = self.probe_interval
+                state.next_probe = time.time() + state.probe_interval
+            self._save()
+
+    def is_open(self, host: str) -> bool:
+        with self._lock:
+            state = self._hosts.get(host_key(host))
+            return state is not None and state.state == OPEN
+
+    def stats(self, host: str) -> Dict[str, object]:
+        """Latency percentiles and breaker state of ``host``"""
+        with self._lock:
+            state = self._hosts.get(host_key(host))
+            if state is None:
+                return {'state': CLOSED, 'samples': 0, 'failures': 0}
+            samples = sorted(state.samples)
+            result = {'state': state.state, 'samples': len(samples), 'failures': state.failures}
+        if samples:
+            result['p50'] = samples[len(samples) // 2]
+            result['p95'] = samples[int(0.95 * (len(samples) - 1))]
+        return result
+
+    def reset(self, host: str) -> None:
+        """Forget everything about ``host``, e.g. after it was repaired"""
+        with self._lock:
+            if self._hosts.pop(host_key(host), None) is not None:
+                self._save()
+
+    def flush(self) -> None:
+        """Write pending changes to ``path``"""
+        with self._lock:
+            if self._dirty:
+                self._save(force=True)
+
@@ -1,14 +1,42 @@
 # coding=utf-8
 
+import contextlib
 import inspect
-import json
-from typing import Any, AsyncGenerator, AsyncIterator, Coroutine, List, Optional, Union
+import sys
+import threading
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Coroutine, Dict, List, Optional, Union
 from urllib.parse import urljoin
 
 import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth, HTTPDigestAuth
-import xmltodict
+from urllib3.exceptions import NewConnectionError
+
+from . import metrics
+from .authcache import BASIC, DIGEST, AuthCache, default_auth_cache
+from .health import HealthTracker
+from .metastore import DEVICE_INFO, MetaStore
+from .metrics import Exchange, Instruments
+from .multipart import MultipartParser, boundary_from_content_type, decode_part
+from .parsers import parse_xml
+from .download import DownloadResult, async_download, download
+from .channels import ChannelStatus
+from .snapshot import (
+    FIELDS, HealthSnapshot, async_channel_status, async_health_snapshot, channel_status, health_snapshot,
+)
+
+
+# Hikvision recorders struggle with many parallel connections, so a device
+# client keeps a few warm connections rather than httpx's defaults
+DEFAULT_LIMITS = httpx.Limits(max_connections=4, max_keepalive_connections=4, keepalive_expiry=5)
+
+# Connections each thread of a sync Client keeps open to its device
+DEFAULT_POOL_SIZE = 4
+
+# Full URLs a client keeps built, more distinct paths are joined per call
+MAX_CACHED_URLS = 256
 
 
 class ConvertToJsonError(Exception):
@@ -16,23 +44,61 @@ class ConvertToJsonError(Exception):
 
 
 class DynamicMethod(object):
+    """One ISAPI path segment chain, e.g. ``client.System.Video.inputs``
+
+    Children are created on first access and kept, so a chain used in a
+    polling loop is bound once and later lookups are plain attribute reads.
+    Indexed children such as ``Streaming.channels[101]`` are kept only up to
+    MAX_CACHED_URLS per chain, since ids like track or event numbers are
+    unbounded.
+    """
+
     def __init__(self, client, path):
         self.client = client
         self.path = path
+        self._items = {}
 
     def __repr__(self):
         return f"<DynamicMethod client={self.client} path={self.path}"
 
     def __getattr__(self, key):
-        return DynamicMethod(self.client, '/'.join((self.path, key)))
+        child = DynamicMethod(self.client, '/'.join((self.path, key)))
+        if not key.startswith('_'):
+            self.__dict__[key] = child
+        return child
 
     def __getitem__(self, item):
-        return DynamicMethod(self.client, self.path + "/" + str(item))
+        child = self._items.get(item)
+        if child is None:
+            child = DynamicMethod(self.client, self.path + "/" + str(item))
+            if len(self._items) < MAX_CACHED_URLS:
+                self._items[item] = child
+        return child
 
     def __call__(self, **kwargs):
         assert 'method' in kwargs, "set http method in args"
         return self.client.request(self.path, **kwargs)
 
+
+class _UrlCache:
+    """Full URLs of one client by ISAPI path, interned and built once"""
+
+    __slots__ = ('host', 'prefix', 'urls')
+
+    def __init__(self, host: str, isapi_prefix: str):
+        self.host = host
+        self.prefix = isapi_prefix + '/'
+        self.urls: Dict[str, str] = {}
+
+    def __call__(self, path: str) -> str:
+        url = self.urls.get(path)
+        if url is None:
+            url = urljoin(self.host, self.prefix + path)
+            if len(self.urls) < MAX_CACHED_URLS:
+                url = self.urls[path] = sys.intern(url)
+        return url
+
+
 async def async_response_parser(response, present='dict'):
     if inspect.iscoroutine(response):
         data = await response
@@ -41,26 +107,38 @@ async def async_response_parser(response, present='dict'):
     return response_parser(data, present=present)
 
 
-def response_parser(response, present='dict'):
-    """ Convert Hikvision results
+def _connect_failed(error):
+    """Whether ``error`` means the device could not be reached at all
+
+    Only these count against a device in the health tracker: a read timeout
+    or a dropped connection comes from a device that answered, often a slow
+    search or an overloaded NVR, and must not open its circuit.
     """
-    if isinstance(response, (list,)):
-        result = "".join(response)
-    elif isinstance(response, str):
-        result = response
-    else:
-        result = response.text
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, requests.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+    return False
 
+
+def response_parser(response, present='dict', engine=None):
+    """ Convert Hikvision results
+
+    :param engine: (optional) XML engine, see hikvisionapi.parsers
+    """
     if present is None or present == 'dict':
         if isinstance(response, (list,)):
-            events = []
-            for event in response:
-                e = json.loads(json.dumps(xmltodict.parse(event)))
-                events.append(e)
-            return events
-        return json.loads(json.dumps(xmltodict.parse(result)))
+            return [parse_xml(event, engine) for event in response]
+        if isinstance(response, (str, bytes)):
+            return parse_xml(response, engine)
+        return parse_xml(response.content, engine)
+
+    if isinstance(response, (list,)):
+        return "".join(response)
+    elif isinstance(response, str):
+        return response
     else:
-        return result
+        return response.text
 
 
 class Client:
@@ -91,87 +169,347 @@ class Client:
         <DeviceInfo version="1.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">
         <deviceName>HIKVISION</deviceName>
     </DeviceInfo>
+
+    A client can be shared by threads: each thread gets its own requests
+    session and connection pool, the detected auth is shared.
     """
 
-    def __init__(self, host, login=None, password=None, timeout=3, isapi_prefix='ISAPI'):
+    def __init__(self, host, login=None, password=None, timeout=3, isapi_prefix='ISAPI',
+                 auth_cache=None, health=None, instruments=None, pool_size=DEFAULT_POOL_SIZE, metadata=None):
         """
         :param host: Host for device ('http://192.168.0.2')
         :param login: (optional) Login for device
         :param password: (optional) Password for device
         :param isapi_prefix: (optional) defaults to ISAPI but can be customized
         :param timeout: (optional) Timeout for request
+        :param auth_cache: (optional) AuthCache remembering the scheme per device,
+            defaults to a process-wide cache
+        :param health: (optional) HealthTracker adapting the connect timeout and
+            failing fast on dead devices, none by default
+        :param instruments: (optional) metrics.Instruments receiving request,
+            auth, stream and parse timings, defaults to metrics.default_instruments
+        :param pool_size: (optional) Connections kept open per thread
+        :param metadata: (optional) metastore.MetaStore serving ``static`` paths
+            such as System/deviceInfo without a request
         """
         self.host = host
         self.login = login
         self.password = password
         self.timeout = float(timeout)
         self.isapi_prefix = isapi_prefix
-        self.req = self._check_session()
+        self._url = _UrlCache(host, isapi_prefix)
+        self.auth_cache = auth_cache if auth_cache is not None else default_auth_cache
+        self.health = health
+        self.instruments = instruments if instruments is not None else metrics.default_instruments
+        self.pool_size = pool_size
+        self.metadata = metadata
+        self._local = threading.local()
+        self._sessions = []
+        # Reentrant: re-authenticating may create the calling thread's session
+        self._lock = threading.RLock()
+        self._auth = None
+        self._check_session()
+        # Default for stream requests without a count_events argument
         self.count_events = 1
 
+    def _new_session(self):
+        session = requests.session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        with self._lock:
+            self._sessions.append(session)
+        self._local.session = session
+        return session
+
     def _check_session(self):
         """Check the connection with device
 
+        The probe is skipped when the auth cache already knows the scheme
+
          :return request.session() object
         """
-        full_url = urljoin(self.host, self.isapi_prefix + '/System/status')
-        session = requests.session()
-        session.auth = HTTPBasicAuth(self.login, self.password)
-        response = session.get(full_url)
-        if response.status_code == 401:
-            session.auth = HTTPDigestAuth(self.login, self.password)
-            response = session.get(full_url)
-        response.raise_for_status()
+        session = self._new_session()
+        self._auth = session.auth = self._authenticate(session)
+        return session
+
+    @property
+    def req(self):
+        """requests.Session of the calling thread"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._new_session()
+        if session.auth is not self._auth:
+            session.auth = self._auth
         return session
 
+    def close(self):
+        """Close the sessions of every thread"""
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _authenticate(self, session):
+        scheme = self.auth_cache.get(self.host, self.login)
+        if scheme is None:
+            started = time.perf_counter()
+            full_url = self._url('System/status')
+            scheme, auth = BASIC, HTTPBasicAuth(self.login, self.password)
+            try:
+                response = self._send(session, 'get', full_url, auth=auth)
+                if response.status_code == 401:
+                    scheme, auth = DIGEST, HTTPDigestAuth(self.login, self.password)
+                    response = self._send(session, 'get', full_url, auth=auth)
+                response.raise_for_status()
+            except Exception:
+                if self.instruments is not None:
+                    self.instruments.auth_probe(self.host, None, time.perf_counter() - started)
+                raise
+            if self.instruments is not None:
+                self.instruments.auth_probe(self.host, scheme, time.perf_counter() - started)
+            self.auth_cache.set(self.host, self.login, scheme, auth=auth, password=self.password)
+        return self.auth_cache.auth_for(self.host, self.login, self.password, scheme)
+
+    def _reauthenticate(self, rejected=None):
+        """Drop the cached scheme after a 401 and probe the device again
+
+        :param rejected: (optional) The auth that got the 401. When another
+            thread already replaced it, its auth is used without a new probe
+        """
+        with self._lock:
+            if rejected is not None and rejected is not self._auth:
+                return
+            self.auth_cache.invalidate(self.host)
+            self._auth = self._authenticate(self.req)
+
+    def _send(self, session, method, full_url, **data):
+        """Send a request through the health tracker
+
+        The connect timeout adapts to the device RTT, the read timeout stays
+        ``timeout``. Dead devices raise health.CircuitOpenError without a request.
+        """
+        if self.health is None:
+            timeout = self.timeout
+        else:
+            self.health.check(self.host)
+            timeout = (self.health.timeout_for(self.host, self.timeout), self.timeout)
+        if self.instruments is not None:
+            return self._send_instrumented(session, method, full_url, timeout, **data)
+        if self.health is None:
+            return session.request(method, full_url, timeout=timeout, **data)
+        started = time.monotonic()
+        try:
+            response = session.request(method, full_url, timeout=timeout, **data)
+        except Exception as e:
+            if _connect_failed(e):
+                self.health.record_failure(self.host)
+            raise
+        self.health.record_success(self.host, time.monotonic() - started)
+        return response
+
+    def _send_instrumented(self, session, method, full_url, timeout, **data):
+        """_send reporting to ``instruments``
+
+        requests has no connection events, so reuse is read from the urllib3
+        pool's connection count. Streamed bodies are counted by Content-Length.
+        """
+        pool = session.get_adapter(full_url).poolmanager.connection_from_url(full_url)
+        connections = pool.num_connections
+        exchange = Exchange(self.instruments, self.host, method, metrics.endpoint(full_url, self.isapi_prefix))
+        try:
+            response = session.request(method, full_url, timeout=timeout, **data)
+        except Exception as e:
+            if self.health is not None and _connect_failed(e):
+                self.health.record_failure(self.host)
+            exchange.reused = pool.num_connections == connections
+            exchange.finish(error=e)
+            raise
+        if self.health is not None:
+            self.health.record_success(self.host, time.perf_counter() - exchange.started)
+        exchange.reused = pool.num_connections == connections
+        if data.get('stream'):
+            length = response.headers.get('Content-Length')
+            size = int(length) if length and length.isdigit() else None
+        else:
+            size = len(response.content)
+        exchange.finish(response.status_code, size)
+        return response
+
     def __getattr__(self, key):
-        return DynamicMethod(self, key)
+        method = DynamicMethod(self, key)
+        if not key.startswith('_'):
+            self.__dict__[key] = method
+        return method
+
+    def health_snapshot(self, fields=FIELDS, cache=None):
+        """Collect status, time, channels, storage and recording range
 
-    def stream_request(self, method, full_url, **data):
+        The requests run one after another on the keep-alive session. A failing
+        field is reported in the snapshot instead of raising.
+
+        :param fields: (optional) Subset of snapshot.FIELDS to collect
+        :param cache: (optional) fieldcache.FieldCache for slow-changing fields
+        :return snapshot.HealthSnapshot
+        """
+        return health_snapshot(self, fields, cache)
+
+    def channel_status(self) -> List[ChannelStatus]:
+        """Online, offline, video loss or disabled state of every channel
+
+        Reads the local inputs and, on NVRs, the IP channel status.
+        :return list of channels.ChannelStatus
+        """
+        return channel_status(self)
+
+    def stream_request(self, method, full_url, count_events=None, **data):
+        """Read ``count_events`` parts of a multipart stream
+
+        :param count_events: (optional) Parts to read, defaults to ``self.count_events``
+        :return list of multipart.Part objects
+        """
+        count_events = count_events or self.count_events
         events = []
-        response = self.req.request(method, full_url, timeout=self.timeout, stream=True, **data)
-        for chunk in response.iter_lines(chunk_size=1024, delimiter=b'--boundary'):
-            if chunk:
-                xml = chunk.split(b'\r\n\r\n')[1].decode("utf-8")
-                events.append(xml)
-                if len(events) == self.count_events:
-                    return events
+        response = self._send(self.req, method, full_url, stream=True, **data)
+        response.raise_for_status()
+        parser = MultipartParser(boundary_from_content_type(response.headers.get('Content-Type')))
+        try:
+            for chunk in response.iter_content(chunk_size=4096):
+                parts = parser.feed(chunk)
+                if parts and self.instruments is not None:
+                    for part in parts:
+                        self.instruments.stream_event(
+                            self.host, metrics.endpoint(full_url, self.isapi_prefix), len(part.body)
+                        )
+                events.extend(parts)
+                if len(events) >= count_events:
+                    return events[:count_events]
+        finally:
+            response.close()
+        return events
 
     def opaque_request(self, method, full_url, **data):
-        return self.req.request(method, full_url, timeout=self.timeout, stream=True, **data)
+        return self._send(self.req, method, full_url, stream=True, **data)
+
+    @contextlib.contextmanager
+    def open_stream(self, *args, method='get', **data):
+        """Send a request and hand out the response before its body is read
+
+        Basic Usage::
+
+        with api.open_stream('Streaming', 'channels', '101', 'picture') as response:
+            for chunk in response.iter_content(65536):
+                fd.write(chunk)
+
+        :return requests.Response, closed when the block exits
+        """
+        full_url = self._url("/".join(args))
+        session = self.req
+        response = self._send(session, method, full_url, stream=True, **data)
+        if response.status_code == 401:
+            response.close()
+            self._reauthenticate(session.auth)
+            response = self._send(self.req, method, full_url, stream=True, **data)
+        try:
+            yield response
+        finally:
+            response.close()
+
+    def download(self, path, dest, method='get', checksum='sha256', resume=True, **data):
+        """Stream a picture or recording to a file, file object or buffer
+
+        See download.download for the parameters.
+
+        :return download.DownloadResult
+        """
+        return download(self, path, dest, method=method, checksum=checksum, resume=resume, **data)
 
     def common_request(self, method, full_url, **data):
-        response = self.req.request(method, full_url, timeout=self.timeout, **data)
+        session = self.req
+        response = self._send(session, method, full_url, **data)
+        if response.status_code == 401:
+            self._reauthenticate(session.auth)
+            response = self._send(self.req, method, full_url, **data)
         response.raise_for_status()
         return response
 
-    def _prepared_request(self, *args, **kwargs):
-        url_path = list(args)
-        url_path.insert(0, self.isapi_prefix)
-        full_url = urljoin(self.host, "/".join(url_path))
-        method = kwargs['method']
+    def call(self, path: str, method: str = 'get', present: str = 'dict', **data) -> Any:
+        """Request an ISAPI path directly, without DynamicMethod dispatch
 
-        data = kwargs
-        data.pop('present', None)
-        data.pop('method')
-        supported_types = {
-            'stream': self.stream_request,
-            'opaque_data': self.opaque_request
-        }
-        return_type = data.pop('type', '').lower()
+        Basic Usage::
 
-        if return_type in supported_types and method == 'get':
-            return supported_types[return_type](method, full_url, **data)
-        else:
-            return self.common_request(method, full_url, **data)
+        status = api.call('System/status')
+        xml = api.call('System/time', present='text')
+        api.call('System/time', method='put', data=xml)
+
+        :param path: Path below the ISAPI prefix, e.g. 'System/Video/inputs/channels'
+        :param method: (optional) HTTP method
+        :param present: (optional) 'dict' or 'text'
+        :param data: (optional) Passed on to requests
+        """
+        return self._parse(path, self.common_request(method, self._url(path), **data), present)
+
+    def static(self, path: str, ttl: Optional[float] = None) -> Any:
+        """GET an ISAPI path that rarely changes, served from ``metadata`` while fresh
+
+        Without a metadata store this is ``call(path)``. A System/deviceInfo with
+        another firmware drops everything else stored for the device.
+
+        :param path: Path below the ISAPI prefix, e.g. 'System/Video/inputs/channels'
+        :param ttl: (optional) Seconds to keep the value, defaults to the store's TTL
+        """
+        if self.metadata is None:
+            return self.call(path)
+        value = self.metadata.get(self.host, path)
+        if value is None:
+            value = self.call(path)
+            self.metadata.remember(self.host, path, value, ttl)
+        return value
+
+    def device_info(self) -> Dict[str, Any]:
+        """Model, serial number and firmware from System/deviceInfo, see ``static``"""
+        return self.static(DEVICE_INFO)
+
+    def _parse(self, path, response, present):
+        if self.instruments is not None and present in (None, 'dict'):
+            started = time.perf_counter()
+            parsed = response_parser(response, present)
+            self.instruments.parse(self.host, metrics.endpoint(path, self.isapi_prefix),
+                                   len(response.content), time.perf_counter() - started)
+            return parsed
+        return response_parser(response, present)
 
     def request(self, *args, **kwargs):
-        response = self._prepared_request(*args, **kwargs)
-        present = kwargs.get('present', 'dict')
-        return_type = kwargs.get('type', '').lower()
+        """Send a DynamicMethod request
+
+        ``method``, ``present``, ``type`` and ``count_events`` are read once
+        here, every other keyword goes to requests.
+        """
+        method = kwargs.pop('method')
+        present = kwargs.pop('present', 'dict')
+        return_type = kwargs.pop('type', '').lower()
+        count_events = kwargs.pop('count_events', None)
+        path = "/".join(args)
+        full_url = self._url(path)
+
+        if method == 'get' and return_type == 'stream':
+            events = [decode_part(part, present) for part in self.stream_request(method, full_url, count_events,
+                                                                                   **kwargs)]
+            if present == 'text' and all(isinstance(event, str) for event in events):
+                return "".join(events)
+            return events
+        if method == 'get' and return_type == 'opaque_data':
+            return self.opaque_request(method, full_url, **kwargs)
+        response = self.common_request(method, full_url, **kwargs)
         if return_type == 'opaque_data':
             return response
-        return response_parser(response, present)
+        return self._parse(path, response, present)
 
 
 class AsyncClient:
@@ -211,6 +549,12 @@ class AsyncClient:
         password: str,
         timeout: Optional[float] = 3,
         isapi_prefix: str = "ISAPI",
+        limits: Optional[httpx.Limits] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        auth_cache: Optional[AuthCache] = None,
+        health: Optional[HealthTracker] = None,
+        instruments: Optional[Instruments] = None,
+        metadata: Optional[MetaStore] = None,
     ):
         """
         :param host: Host for device ('http://192.168.0.2')
@@ -218,32 +562,228 @@ class AsyncClient:
         :param password: (optional) Password for device
         :param isapi_prefix: (optional) defaults to ISAPI but can be customized
         :param timeout: (optional) Default timeout for requests
+        :param limits: (optional) Connection pool limits for the owned http client
+        :param http_client: (optional) Shared httpx.AsyncClient. It is not closed by aclose()
+        :param auth_cache: (optional) AuthCache remembering the scheme per device,
+            defaults to a process-wide cache
+        :param health: (optional) HealthTracker adapting the connect timeout and
+            failing fast on dead devices, none by default
+        :param instruments: (optional) metrics.Instruments receiving request,
+            auth, stream and parse timings, defaults to metrics.default_instruments
+        :param metadata: (optional) metastore.MetaStore serving ``static`` paths
+            such as System/deviceInfo without a request
         """
         self.host: str = host
         self.login: str = login
         self.password: str = password
         self.timeout: Optional[float] = timeout
         self.isapi_prefix: str = isapi_prefix
+        self._url = _UrlCache(host, isapi_prefix)
+        self.limits: httpx.Limits = limits or DEFAULT_LIMITS
+        self._http_client: Optional[httpx.AsyncClient] = http_client
+        self._owns_http_client: bool = http_client is None
+        self.auth_cache: AuthCache = auth_cache if auth_cache is not None else default_auth_cache
+        self.health: Optional[HealthTracker] = health
+        self.instruments: Optional[Instruments] = (
+            instruments if instruments is not None else metrics.default_instruments
+        )
+        self.metadata: Optional[MetaStore] = metadata
         self._auth_method: Optional[httpx._auth.Auth] = None
 
     def __getattr__(self, key: str):
-        return DynamicMethod(self, key)
-
+        method = DynamicMethod(self, key)
+        if not key.startswith('_'):
+            self.__dict__[key] = method
+        return method
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the pooled connections if this client owns them"""
+        if self._owns_http_client and self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Long-lived httpx client whose connections are reused between requests"""
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        return self._http_client
 
     async def _detect_auth_method(self):
-        """Establish the connection with device"""
-        full_url = urljoin(self.host, self.isapi_prefix + '/System/status')
-        for method in [
-            httpx.BasicAuth(self.login, self.password),
-            httpx.DigestAuth(self.login, self.password),
-        ]:
-                async with httpx.AsyncClient(auth=method) as client:
-                    response = await client.get(full_url)
-                    if response.status_code == 200:
-                        self._auth_method = method
+        """Establish the connection with device
+
+        The probe is skipped when the auth cache already knows the scheme
+        """
+        scheme = self.auth_cache.get(self.host, self.login)
+        if scheme is None:
+            started = time.perf_counter()
+            full_url = self._url('System/status')
+            for scheme, method in [
+                (BASIC, httpx.BasicAuth(self.login, self.password)),
+                (DIGEST, httpx.DigestAuth(self.login, self.password)),
+            ]:
+                try:
+                    response = await self._send('get', full_url, self._adaptive_timeout(), auth=method)
+                except Exception:
+                    self._auth_probed(None, started)
+                    raise
+                if response.status_code == 200:
+                    self._auth_probed(scheme, started)
+                    self.auth_cache.set(
+                        self.host, self.login, scheme, auth=method, password=self.password, flavour='httpx'
+                    )
+                    break
+            else:
+                self._auth_probed(None, started)
+                response.raise_for_status()
+                return
+
+        self._auth_method = self.auth_cache.auth_for(
+            self.host, self.login, self.password, scheme, flavour='httpx'
+        )
+
+    def _auth_probed(self, scheme: Optional[str], started: float) -> None:
+        if self.instruments is not None:
+            self.instruments.auth_probe(self.host, scheme, time.perf_counter() - started)
+
+    async def health_snapshot(self, fields=FIELDS, cache=None) -> HealthSnapshot:
+        """Collect status, time, channels, storage and recording range
+
+        The requests run concurrently on the client's connection pool. A failing
+        field is reported in the snapshot instead of raising.
+
+        :param fields: (optional) Subset of snapshot.FIELDS to collect
+        :param cache: (optional) fieldcache.FieldCache for slow-changing fields
+        """
+        return await async_health_snapshot(self, fields, cache)
 
+    async def channel_status(self) -> List[ChannelStatus]:
+        """Online, offline, video loss or disabled state of every channel
+
+        Reads the local inputs and, on NVRs, the IP channel status.
+        """
+        return await async_channel_status(self)
+
+    def _adaptive_timeout(self) -> httpx.Timeout:
+        """``timeout`` with the connect phase shortened to the device RTT"""
+        if self.health is None:
+            return httpx.Timeout(self.timeout)
+        return httpx.Timeout(self.timeout, connect=self.health.timeout_for(self.host, self.timeout))
+
+    async def _send(self, method: str, full_url: str, timeout, **data) -> httpx.Response:
+        """Send a request through the health tracker
+
+        Dead devices raise health.CircuitOpenError without a request.
+        """
+        if self.health is not None:
+            self.health.check(self.host)
+        if self.instruments is not None:
+            return await self._send_instrumented(method, full_url, timeout, **data)
+        if self.health is None:
+            return await self.http_client.request(method, full_url, timeout=timeout, **data)
+        started = time.monotonic()
+        try:
+            response = await self.http_client.request(method, full_url, timeout=timeout, **data)
+        except Exception as e:
+            if _connect_failed(e):
+                self.health.record_failure(self.host)
+            raise
+        self.health.record_success(self.host, time.monotonic() - started)
+        return response
+
+    def _exchange(self, method: str, full_url: str, data: dict) -> Exchange:
+        """Start an Exchange and hook its trace callback into the request"""
+        exchange = Exchange(self.instruments, self.host, method, metrics.endpoint(full_url, self.isapi_prefix))
+        data['extensions'] = dict(data.get('extensions') or {}, trace=exchange.trace)
+        return exchange
+
+    async def _send_instrumented(self, method: str, full_url: str, timeout, **data) -> httpx.Response:
+        exchange = self._exchange(method, full_url, data)
+        try:
+            response = await self.http_client.request(method, full_url, timeout=timeout, **data)
+        except Exception as e:
+            if self.health is not None and _connect_failed(e):
+                self.health.record_failure(self.host)
+            exchange.finish(error=e)
+            raise
+        if self.health is not None:
+            self.health.record_success(self.host, time.perf_counter() - exchange.started)
+        exchange.finish(response.status_code, len(response.content))
+        return response
+
+    @contextlib.asynccontextmanager
+    async def _stream(self, method: str, full_url: str, timeout, **data) -> AsyncIterator[httpx.Response]:
+        """Streaming counterpart of _send
+
+        The request is reported to ``instruments`` when the stream closes,
+        with the bytes actually read.
+        """
+        if self.health is not None:
+            self.health.check(self.host)
+        exchange = self._exchange(method, full_url, data) if self.instruments is not None else None
+        started = time.monotonic()
+        response = None
+        try:
+            async with self.http_client.stream(method, full_url, timeout=timeout, **data) as response:
+                if self.health is not None:
+                    self.health.record_success(self.host, time.monotonic() - started)
+                yield response
+        except httpx.TransportError as e:
+            # Only failures to get a response count, not a stream dying later
+            if response is None and self.health is not None and _connect_failed(e):
+                self.health.record_failure(self.host)
+            if exchange is not None:
+                exchange.finish(getattr(response, 'status_code', None),
+                                getattr(response, 'num_bytes_downloaded', None), e)
+                exchange = None
+            raise
+        finally:
+            if exchange is not None:
+                exchange.finish(getattr(response, 'status_code', None), getattr(response, 'num_bytes_downloaded', None))
+
+    @contextlib.asynccontextmanager
+    async def open_stream(
+        self, *args, method: str = 'get', timeout=None, **data
+    ) -> AsyncIterator[httpx.Response]:
+        """Send a request and hand out the response before its body is read
+
+        Basic Usage::
+
+        async with api.open_stream('Streaming', 'channels', '101', 'picture') as response:
+            async for chunk in response.aiter_bytes():
+                fd.write(chunk)
+        """
+        full_url = self._url("/".join(args))
+        timeout = timeout if timeout is not None else self._adaptive_timeout()
         if not self._auth_method:
-            response.raise_for_status()
+            await self._detect_auth_method()
+        for attempt in range(2):
+            async with self._stream(method, full_url, timeout, auth=self._auth_method, **data) as response:
+                if response.status_code == 401 and attempt == 0:
+                    self._forget_auth_method()
+                    await self._detect_auth_method()
+                    continue
+                yield response
+                return
+
+    async def download(self, path: str, dest, method: str = 'get', checksum: Optional[str] = 'sha256',
+                       resume: bool = True, **data) -> DownloadResult:
+        """Stream a picture or recording to a file, file object or buffer
+
+        See download.download for the parameters.
+        """
+        return await async_download(self, path, dest, method=method, checksum=checksum, resume=resume, **data)
+
+    def _forget_auth_method(self):
+        """Drop the cached scheme after a 401 so the next request probes again"""
+        self.auth_cache.invalidate(self.host)
+        self._auth_method = None
 
     async def stream_request(
         self,
@@ -256,26 +796,20 @@ class AsyncClient:
         if not self._auth_method:
             await self._detect_auth_method()
 
-        # This is a naive parser that assumes all stream endpoints will generate XML since
-        # there aren't any convenient multipart readers
-        async with httpx.AsyncClient(auth=self._auth_method) as client:
-            async with client.stream(
-                method, full_url, timeout=timeout, **data
-            ) as response:
-                buffer = ""
-                opening_tag = None
-
-                async for chunk in response.aiter_text():
-                    buffer += chunk
-                    events = buffer.split("\r\n\r\n")[1:]
-
-                    if not opening_tag and len(events) > 0 and ">" in events[0]:
-                        opening_tag = events[0].split(">", 1)[0].split("<", 1)[1].split(" ")[0]
-
-                    if opening_tag and f"</{opening_tag}>" in events[0]:
-                        yield await async_response_parser(events[0].split(f"</{opening_tag}>", 1)[0] + f"</{opening_tag}>", present=present)
-                        opening_tag = None
-                        buffer = "".join(events[1:])
+        async with self._stream(
+            method, full_url, timeout, auth=self._auth_method, **data
+        ) as response:
+            if response.status_code == 401:
+                self._forget_auth_method()
+            response.raise_for_status()
+            parser = MultipartParser(boundary_from_content_type(response.headers.get('content-type')))
+            async for chunk in response.aiter_bytes():
+                for part in parser.feed(chunk):
+                    if self.instruments is not None:
+                        self.instruments.stream_event(
+                            self.host, metrics.endpoint(full_url, self.isapi_prefix), len(part.body)
+                        )
+                    yield decode_part(part, present)
 
     async def opaque_request(
         self,
@@ -288,12 +822,13 @@ class AsyncClient:
         if not self._auth_method:
             await self._detect_auth_method()
 
-        async with httpx.AsyncClient(auth=self._auth_method) as client:
-            async with client.stream(
-                method, full_url, timeout=timeout, **data
-            ) as response:
-                async for chunk in response.aiter_bytes():
-                    yield chunk
+        async with self._stream(
+            method, full_url, timeout, auth=self._auth_method, **data
+        ) as response:
+            if response.status_code == 401:
+                self._forget_auth_method()
+            async for chunk in response.aiter_bytes():
+                yield chunk
 
     async def common_request(
         self,
@@ -306,10 +841,56 @@ class AsyncClient:
         if not self._auth_method:
             await self._detect_auth_method()
 
-        async with httpx.AsyncClient(auth=self._auth_method) as client:
-            response = await client.request(method, full_url, timeout=timeout, **data)
-            response.raise_for_status()
-            return await async_response_parser(response, present)
+        response = await self._send(method, full_url, timeout, auth=self._auth_method, **data)
+        if response.status_code == 401:
+            self._forget_auth_method()
+            await self._detect_auth_method()
+            response = await self._send(method, full_url, timeout, auth=self._auth_method, **data)
+        response.raise_for_status()
+        if self.instruments is not None and present in (None, 'dict'):
+            started = time.perf_counter()
+            parsed = await async_response_parser(response, present)
+            self.instruments.parse(self.host, metrics.endpoint(full_url, self.isapi_prefix),
+                                   len(response.content), time.perf_counter() - started)
+            return parsed
+        return await async_response_parser(response, present)
+
+    async def call(self, path: str, method: str = 'get', present: str = 'dict', **data) -> Any:
+        """Request an ISAPI path directly, without DynamicMethod dispatch
+
+        Basic Usage::
+
+        status = await api.call('System/status')
+        await api.call('System/time', method='put', content=xml, timeout=10)
+
+        :param path: Path below the ISAPI prefix, e.g. 'System/Video/inputs/channels'
+        :param method: (optional) HTTP method
+        :param present: (optional) 'dict' or 'text'
+        :param data: (optional) Passed on to httpx, ``timeout`` defaults to the adaptive one
+        """
+        timeout = data.pop('timeout') if 'timeout' in data else self._adaptive_timeout()
+        return await self.common_request(method, self._url(path), present, timeout, **data)
+
+    async def static(self, path: str, ttl: Optional[float] = None) -> Any:
+        """GET an ISAPI path that rarely changes, served from ``metadata`` while fresh
+
+        Without a metadata store this is ``call(path)``. A System/deviceInfo with
+        another firmware drops everything else stored for the device.
+
+        :param path: Path below the ISAPI prefix, e.g. 'System/Video/inputs/channels'
+        :param ttl: (optional) Seconds to keep the value, defaults to the store's TTL
+        """
+        if self.metadata is None:
+            return await self.call(path)
+        value = self.metadata.get(self.host, path)
+        if value is None:
+            value = await self.call(path)
+            self.metadata.remember(self.host, path, value, ttl)
+        return value
+
+    async def device_info(self) -> Dict[str, Any]:
+        """Model, serial number and firmware from System/deviceInfo, see ``static``"""
+        return await self.static(DEVICE_INFO)
 
     def request(
         self, *args, **kwargs
@@ -318,9 +899,7 @@ class AsyncClient:
         AsyncIterator[bytes],
         AsyncGenerator[Union[List[str], str], None],
     ]:
-        url_path = list(args)
-        url_path.insert(0, self.isapi_prefix)
-        full_url = urljoin(self.host, "/".join(url_path))
+        full_url = self._url("/".join(args))
 
         method = kwargs["method"]
         kwargs.pop("method")
@@ -330,8 +909,7 @@ class AsyncClient:
             'opaque_data': self.opaque_request
         }
         return_type = kwargs.pop("type", "").lower()
-        timeout = kwargs.get("timeout", self.timeout)
-        kwargs.pop("timeout", None)
+        timeout = kwargs.pop("timeout") if "timeout" in kwargs else self._adaptive_timeout()
 
         if return_type in supported_types and method == "get":
             return supported_types[return_type](
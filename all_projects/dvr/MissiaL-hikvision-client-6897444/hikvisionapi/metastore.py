@@ -0,0 +1,202 @@
+# coding=utf-8
+"""
+Persistent store of static device metadata
+
+Model, firmware and serial number from ``System/deviceInfo``, the channel
+configuration and the auth scheme a device accepts only change with a
+firmware upgrade or a swapped device, yet every short-lived process asks
+each DVR for them again. ``MetaStore`` keeps them in a SQLite file keyed by
+``host:port`` with a time to live, so a CLI run or a restarted daemon starts
+warm and serves them without a request. Processes may share the file: it is
+opened in WAL mode and every write is one short transaction.
+
+When a fresh ``System/deviceInfo`` reports another firmware than the one
+stored, everything else known about the device is dropped, since an upgrade
+may change its channels and auth.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from .authcache import host_key
+
+DEVICE_INFO = 'System/deviceInfo'
+DEFAULT_TTL = 7 * 24 * 3600
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS metadata ('
+    ' host TEXT NOT NULL,'
+    ' name TEXT NOT NULL,'
+    ' value TEXT NOT NULL,'
+    ' expires REAL NOT NULL,'
+    ' PRIMARY KEY (host, name)'
+    ') WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS firmware ('
+    ' host TEXT PRIMARY KEY,'
+    ' version TEXT NOT NULL'
+    ') WITHOUT ROWID',
+)
+
+
+def firmware_of(device_info: Any) -> Optional[str]:
+    """Firmware version and build date from a parsed ``System/deviceInfo``"""
+    if not isinstance(device_info, dict):
+        return None
+    info = device_info.get('DeviceInfo', device_info)
+    if not isinstance(info, dict) or not info.get('firmwareVersion'):
+        return None
+    return ' '.join(filter(None, (info.get('firmwareVersion'), info.get('firmwareReleasedDate'))))
+
+
+class MetaStore:
+    """
+    Thread- and process-safe metadata store keyed by ``host:port`` and name
+
+    Basic Usage::
+
+    from hikvisionapi.metastore import MetaStore
+    store = MetaStore('/var/lib/hikvision/metadata.db')
+    api = Client('http://192.168.0.2', 'admin', 'admin', auth_cache=AuthCache(store=store), metadata=store)
+    info = api.device_info()  # From the store until its TTL expires
+    """
+
+    def __init__(self, path: str = ':memory:', ttl: float = DEFAULT_TTL, ttls: Optional[Mapping[str, float]] = None):
+        """
+        :param path: (optional) SQLite file, by default a store that lives in memory
+        :param ttl: (optional) Seconds a value stays valid
+        :param ttls: (optional) Seconds per name, e.g. {'System/deviceInfo': 86400}
+        """
+        self.path = path
+        self.ttl = float(ttl)
+        self.ttls = dict(ttls or {})
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            if path != ':memory:':
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+            self._db.execute('DELETE FROM metadata WHERE expires <= ?', (time.time(),))
+
+    def ttl_for(self, name: str) -> float:
+        return self.ttls.get(name, self.ttl)
+
+    def get(self, host: str, name: str) -> Any:
+        """Return the stored value, or None when missing or expired"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT value FROM metadata WHERE host = ? AND name = ? AND expires > ?',
+                (host_key(host), name, time.time()),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, host: str, name: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a JSON serialisable value for ``ttl`` seconds"""
+        expires = time.time() + (ttl if ttl is not None else self.ttl_for(name))
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO metadata (host, name, value, expires) VALUES (?, ?, ?, ?)',
+                (host_key(host), name, json.dumps(value), expires),
+            )
+
+    def set_device_info(self, host: str, device_info: Any, ttl: Optional[float] = None) -> bool:
+        """Store ``System/deviceInfo``, dropping the rest of the device when its firmware changed
+
+        :return True when the firmware differs from the stored one
+        """
+        key = host_key(host)
+        version = firmware_of(device_info)
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._db.execute('SELECT version FROM firmware WHERE host = ?', (key,)).fetchone()
+                upgraded = row is not None and version is not None and row[0] != version
+                if upgraded:
+                    self._db.execute('DELETE FROM metadata WHERE host = ?', (key,))
+                if version is not None:
+                    self._db.execute('INSERT OR REPLACE INTO firmware (host, version) VALUES (?, ?)', (key, version))
+                self._db.execute(
+                    'INSERT OR REPLACE INTO metadata (host, name, value, expires) VALUES (?, ?, ?, ?)',
+                    (key, DEVICE_INFO, json.dumps(device_info),
+                     time.time() + (ttl if ttl is not None else self.ttl_for(DEVICE_INFO))),
+                )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        return upgraded
+
+    def remember(self, host: str, name: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value fetched from the device, deviceInfo with the firmware check"""
+        if name == DEVICE_INFO:
+            self.set_device_info(host, value, ttl)
+        else:
+            self.set(host, name, value, ttl)
+
+    def firmware(self, host: str) -> Optional[str]:
+        """Last firmware version seen on ``host``"""
+        with self._lock:
+            row = self._db.execute('SELECT version FROM firmware WHERE host = ?', (host_key(host),)).fetchone()
+        return row[0] if row else None
+
+    def items(self, name: str) -> Dict[str, Tuple[Any, float]]:
+        """Every unexpired value of ``name`` as {host: (value, expires)}"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT host, value, expires FROM metadata WHERE name = ? AND expires > ?', (name, time.time()),
+            ).fetchall()
+        return {host: (json.loads(value), expires) for host, value, expires in rows}
+
+    def update(self, name: str, values: Mapping[str, Optional[Tuple[Any, float]]]) -> None:
+        """Write many values of ``name`` in one transaction
+
+        :param values: {host: (value, expires)}, None deletes the host's value
+        """
+        if not values:
+            return
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                for host, item in values.items():
+                    if item is None:
+                        self._db.execute('DELETE FROM metadata WHERE host = ? AND name = ?', (host_key(host), name))
+                    else:
+                        self._db.execute(
+                            'INSERT OR REPLACE INTO metadata (host, name, value, expires) VALUES (?, ?, ?, ?)',
+                            (host_key(host), name, json.dumps(item[0]), item[1]),
+                        )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def invalidate(self, host: str, name: Optional[str] = None) -> None:
+        """Forget one value of ``host``, or all of them"""
+        with self._lock:
+            if name is None:
+                self._db.execute('DELETE FROM metadata WHERE host = ?', (host_key(host),))
+            else:
+                self._db.execute('DELETE FROM metadata WHERE host = ? AND name = ?', (host_key(host), name))
+
+    def clear(self, name: Optional[str] = None) -> None:
+        """Forget every value of ``name``, or everything"""
+        with self._lock:
+            if name is None:
+                self._db.execute('DELETE FROM metadata')
+                self._db.execute('DELETE FROM firmware')
+            else:
+                self._db.execute('DELETE FROM metadata WHERE name = ?', (name,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,355 @@
+# coding=utf-8
+"""
+Request instrumentation for Client and AsyncClient
+
+Clients call the hooks of an ``Instruments`` object around every request,
+authentication probe, multipart stream event and response parse. Without
+one (the default) a request costs a single ``is not None`` check.
+``MetricsCollector`` keeps per-endpoint latency histograms, bytes, errors
+and connection reuse, exported as a dict or in the Prometheus text format.
+``AsyncClient`` also splits connect time and time to first byte out of the
+total using the httpx ``trace`` extension.
+
+Basic Usage::
+
+    from hikvisionapi import metrics
+    collector = metrics.enable()          # clients created from now on report to it
+    api = Client('http://192.168.0.2', 'admin', 'admin')
+    api.System.status(method='get')
+    print(collector.prometheus())
+"""
+
+import bisect
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+# Seconds, chosen around DVR round-trips: a LAN device answers in a few ms,
+# a DVR on a 3G uplink in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+default_instruments: Optional["Instruments"] = None
+
+
+@lru_cache(maxsize=4096)
+def endpoint(url: str, prefix: str = 'ISAPI') -> str:
+    """Metric label of a request URL or ISAPI path
+
+    The query and the ISAPI prefix are dropped and numeric segments become
+    ``{id}``, so ``/ISAPI/Streaming/channels/101/picture`` and channel 201
+    share ``Streaming/channels/{id}/picture``.
+    """
+    segments = urlsplit(url).path.strip('/').split('/')
+    if segments and segments[0] == prefix.strip('/'):
+        segments = segments[1:]
+    return '/'.join('{id}' if segment.isdigit() else segment for segment in segments)
+
+
+class Exchange:
+    """One request as seen by the hooks, filled in as it progresses"""
+
+    __slots__ = ('instruments', 'host', 'method', 'endpoint', 'started', 'elapsed', 'status', 'size',
+                 'error', 'reused', 'connect', 'first_byte', '_connecting')
+
+    def __init__(self, instruments: "Instruments", host: str, method: str, endpoint: str):
+        self.instruments = instruments
+        self.host = host
+        self.method = method.upper()
+        self.endpoint = endpoint
+        self.elapsed: Optional[float] = None
+        self.status: Optional[int] = None
+        self.size: Optional[int] = None
+        self.error: Optional[str] = None
+        # None when the transport cannot tell
+        self.reused: Optional[bool] = None
+        self.connect: Optional[float] = None
+        self.first_byte: Optional[float] = None
+        self._connecting: Optional[float] = None
+        self.started = time.perf_counter()
+        instruments.request_start(self)
+
+    async def trace(self, name: str, info: Dict[str, Any]) -> None:
+        """httpx ``trace`` extension callback"""
+        if name == 'connection.connect_tcp.started':
+            self._connecting = time.perf_counter()
+            self.reused = False
+        elif name == 'connection.connect_tcp.complete' and self._connecting is not None:
+            self.connect = time.perf_counter() - self._connecting
+        elif name.endswith('.send_request_headers.started') and self.reused is None:
+            self.reused = True
+        elif name.endswith('.receive_response_headers.complete'):
+            self.first_byte = time.perf_counter() - self.started
+
+    def finish(self, status: Optional[int] = None, size: Optional[int] = None,
+               error: Optional[BaseException] = None) -> None:
+        self.elapsed = time.perf_counter() - self.started
+        self.status = status
+        self.size = size
+        if status is not None and status >= 400:
+            self.error = str(status)
+        elif error is not None:
+            self.error = type(error).__name__
+        self.instruments.request_end(self)
+
+
+class Instruments:
+    """
+    No-op hooks, override the ones you need
+
+    Hooks run on the request path, in the client's thread or event loop,
+    so they should only record and return.
+    """
+
+    def request_start(self, exchange: Exchange) -> None:
+        pass
+
+    def request_end(self, exchange: Exchange) -> None:
+        pass
+
+    def auth_probe(self, host: str, scheme: Optional[str], elapsed: float) -> None:
+        """Scheme detection finished, ``scheme`` is None when it failed"""
+
+    def stream_event(self, host: str, endpoint: str, size: int) -> None:
+        """One part of a multipart event stream was received"""
+
+    def parse(self, host: str, endpoint: str, size: int, elapsed: float) -> None:
+        """A response body was parsed"""
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, count) pairs ending with +inf, as Prometheus buckets"""
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, share: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``share`` quantile"""
+        if not self.count:
+            return None
+        for bound, total in self.cumulative():
+            if total >= share * self.count:
+                return bound
+        return float('inf')
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {'count': self.count, 'sum': self.sum, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99)}
+
+
+class _EndpointStats:
+    __slots__ = ('latency', 'connect', 'first_byte', 'bytes', 'errors', 'reused', 'new')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.latency = Histogram(buckets)
+        self.connect = Histogram(buckets)
+        self.first_byte = Histogram(buckets)
+        self.bytes = 0
+        self.errors: Dict[str, int] = {}
+        self.reused = 0
+        self.new = 0
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels: Any) -> str:
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _bound(value: float) -> str:
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class MetricsCollector(Instruments):
+    """
+    Thread-safe default collector
+
+    Basic Usage::
+
+    collector = MetricsCollector()
+    api = AsyncClient('http://192.168.0.2', 'admin', 'admin', instruments=collector)
+    ...
+    collector.as_dict()['requests']['System/status GET']['latency']['p99']
+    open('/var/lib/node_exporter/hikvision.prom', 'w').write(collector.prometheus())
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        :param buckets: (optional) Histogram upper bounds in seconds
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._requests: Dict[Tuple[str, str], _EndpointStats] = {}
+            self._parse: Dict[str, Histogram] = {}
+            self._parsed_bytes: Dict[str, int] = {}
+            self._auth: Dict[str, Histogram] = {}
+            self._streams: Dict[str, List[int]] = {}
+            self.in_flight = 0
+
+    def request_start(self, exchange: Exchange) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def request_end(self, exchange: Exchange) -> None:
+        key = (exchange.endpoint, exchange.method)
+        with self._lock:
+            self.in_flight -= 1
+            stats = self._requests.get(key)
+            if stats is None:
+                stats = self._requests[key] = _EndpointStats(self.buckets)
+            stats.latency.observe(exchange.elapsed)
+            if exchange.connect is not None:
+                stats.connect.observe(exchange.connect)
+            if exchange.first_byte is not None:
+                stats.first_byte.observe(exchange.first_byte)
+            if exchange.size:
+                stats.bytes += exchange.size
+            if exchange.error is not None:
+                stats.errors[exchange.error] = stats.errors.get(exchange.error, 0) + 1
+            if exchange.reused is True:
+                stats.reused += 1
+            elif exchange.reused is False:
+                stats.new += 1
+
+    def auth_probe(self, host: str, scheme: Optional[str], elapsed: float) -> None:
+        with self._lock:
+            histogram = self._auth.get(scheme or 'failed')
+            if histogram is None:
+                histogram = self._auth[scheme or 'failed'] = Histogram(self.buckets)
+            histogram.observe(elapsed)
+
+    def stream_event(self, host: str, endpoint: str, size: int) -> None:
+        with self._lock:
+            counts = self._streams.setdefault(endpoint, [0, 0])
+            counts[0] += 1
+            counts[1] += size
+
+    def parse(self, host: str, endpoint: str, size: int, elapsed: float) -> None:
+        with self._lock:
+            histogram = self._parse.get(endpoint)
+            if histogram is None:
+                histogram = self._parse[endpoint] = Histogram(self.buckets)
+            histogram.observe(elapsed)
+            self._parsed_bytes[endpoint] = self._parsed_bytes.get(endpoint, 0) + size
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Summary with p50/p99 bucket bounds, keyed by ``'<endpoint> <METHOD>'``"""
+        with self._lock:
+            requests = {}
+            for (name, method), stats in sorted(self._requests.items()):
+                known = stats.reused + stats.new
+                requests[f"{name} {method}"] = {
+                    'latency': stats.latency.as_dict(),
+                    'connect': stats.connect.as_dict(),
+                    'first_byte': stats.first_byte.as_dict(),
+                    'bytes': stats.bytes,
+                    'errors': dict(stats.errors),
+                    'reuse_ratio': stats.reused / known if known else None,
+                }
+            return {
+                'in_flight': self.in_flight,
+                'requests': requests,
+                'parse': {name: dict(histogram.as_dict(), bytes=self._parsed_bytes[name])
+                          for name, histogram in sorted(self._parse.items())},
+                'auth': {scheme: histogram.as_dict() for scheme, histogram in sorted(self._auth.items())},
+                'streams': {name: {'events': events, 'bytes': size}
+                            for name, (events, size) in sorted(self._streams.items())},
+            }
+
+    def prometheus(self, prefix: str = 'hikvision') -> str:
+        """Metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+
+        def header(name: str, kind: str, text: str) -> None:
+            lines.append(f"# HELP {prefix}_{name} {text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        def histogram(name: str, value: Histogram, **labels: Any) -> None:
+            for le, count in value.cumulative():
+                lines.append(f"{prefix}_{name}_bucket{_labels(**labels, le=_bound(le))} {count}")
+            lines.append(f"{prefix}_{name}_sum{_labels(**labels)} {value.sum}")
+            lines.append(f"{prefix}_{name}_count{_labels(**labels)} {value.count}")
+
+        with self._lock:
+            requests = sorted(self._requests.items())
+            header('requests_in_flight', 'gauge', 'ISAPI requests waiting for a response')
+            lines.append(f"{prefix}_requests_in_flight {self.in_flight}")
+            for name, attribute, text in (
+                ('request_duration_seconds', 'latency', 'ISAPI request latency'),
+                ('connect_duration_seconds', 'connect', 'TCP connect time including DNS, async client only'),
+                ('first_byte_seconds', 'first_byte', 'Time to the response headers, async client only'),
+            ):
+                header(name, 'histogram', text)
+                for (path, method), stats in requests:
+                    histogram(name, getattr(stats, attribute), endpoint=path, method=method)
+            header('response_bytes_total', 'counter', 'Response body bytes')
+            for (path, method), stats in requests:
+                lines.append(f"{prefix}_response_bytes_total{_labels(endpoint=path, method=method)} {stats.bytes}")
+            header('request_errors_total', 'counter', 'Failed requests by HTTP status or exception')
+            for (path, method), stats in requests:
+                for error, count in sorted(stats.errors.items()):
+                    lines.append(
+                        f"{prefix}_request_errors_total{_labels(endpoint=path, method=method, error=error)} {count}"
+                    )
+            header('connections_total', 'counter', 'Requests by whether they reused a pooled connection')
+            for (path, method), stats in requests:
+                for reused, count in (('true', stats.reused), ('false', stats.new)):
+                    lines.append(
+                        f"{prefix}_connections_total{_labels(endpoint=path, method=method, reused=reused)} {count}"
+                    )
+            header('parse_duration_seconds', 'histogram', 'Response parse time')
+            for path, value in sorted(self._parse.items()):
+                histogram('parse_duration_seconds', value, endpoint=path)
+            header('parse_bytes_total', 'counter', 'Parsed response bytes')
+            for path, size in sorted(self._parsed_bytes.items()):
+                lines.append(f"{prefix}_parse_bytes_total{_labels(endpoint=path)} {size}")
+            header('auth_probe_duration_seconds', 'histogram', 'Authentication scheme detection time')
+            for scheme, value in sorted(self._auth.items()):
+                histogram('auth_probe_duration_seconds', value, scheme=scheme)
+            header('stream_events_total', 'counter', 'Multipart stream events received')
+            for path, (events, _) in sorted(self._streams.items()):
+                lines.append(f"{prefix}_stream_events_total{_labels(endpoint=path)} {events}")
+            header('stream_bytes_total', 'counter', 'Multipart stream event bytes')
+            for path, (_, size) in sorted(self._streams.items()):
+                lines.append(f"{prefix}_stream_bytes_total{_labels(endpoint=path)} {size}")
+        return '\n'.join(lines) + '\n'
+
+
+def enable(instruments: Optional[Instruments] = None) -> Instruments:
+    """Make clients created from now on report to ``instruments``
+
+    :param instruments: (optional) defaults to a new MetricsCollector
+    :return the installed instruments
+    """
+    global default_instruments
+    default_instruments = instruments if instruments is not None else MetricsCollector()
+    return default_instruments
+
+
+def disable() -> None:
+    """Stop instrumenting clients created from now on"""
+    global default_instruments
+    default_instruments = None
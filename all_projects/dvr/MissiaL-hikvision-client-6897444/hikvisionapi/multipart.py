@@ -0,0 +1,242 @@
+# coding=utf-8
+"""
+Incremental parser for multipart/x-mixed-replace event streams
+
+``Event/notification/alertStream`` is a never-ending multipart body whose
+parts are XML or JSON alerts and, on some firmwares, JPEG pictures. The
+parser works on bytes, keeps at most one part in memory and hands each part
+out as soon as it is complete, so a subscription costs constant memory and
+CPU per event however long it runs.
+"""
+
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+from .parsers import parse_xml
+
+DEFAULT_BOUNDARY = b'boundary'
+MAX_HEADER_SIZE = 16 * 1024
+MAX_PART_SIZE = 4 * 1024 * 1024
+
+_PREAMBLE, _HEADERS, _BODY, _DISCARD, _END = range(5)
+
+
+class MultipartError(Exception):
+    pass
+
+
+class Part(NamedTuple):
+    headers: Dict[str, str]
+    body: bytes
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get('content-type', '').split(';', 1)[0].strip().lower()
+
+    @property
+    def charset(self) -> str:
+        for param in self.headers.get('content-type', '').split(';')[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'charset':
+                return value.strip().strip('"') or 'utf-8'
+        return 'utf-8'
+
+
+def boundary_from_content_type(content_type: Optional[str]) -> bytes:
+    """Read the boundary parameter of a multipart Content-Type header
+
+    Falls back to ``boundary``, which is what Hikvision devices use
+    """
+    for param in (content_type or '').split(';')[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'boundary':
+            value = value.strip().strip('"')
+            if value.startswith('--'):
+                # Some firmwares put the dashes in the header as well
+                value = value[2:]
+            if value:
+                return value.encode('latin-1')
+    return DEFAULT_BOUNDARY
+
+
+class MultipartParser:
+    """
+    Push parser for multipart bodies
+
+    Basic Usage::
+
+    parser = MultipartParser(boundary_from_content_type(response.headers['Content-Type']))
+    for chunk in response.iter_content(chunk_size=4096):
+        for part in parser.feed(chunk):
+            handle(part.headers, part.body)
+    """
+
+    def __init__(self, boundary: Union[bytes, str] = DEFAULT_BOUNDARY,
+                 max_part_size: int = MAX_PART_SIZE):
+        """
+        :param boundary: Boundary from the Content-Type header, without leading dashes
+        :param max_part_size: (optional) Parts larger than this are skipped
+            instead of being buffered
+        """
+        if isinstance(boundary, str):
+            boundary = boundary.encode('latin-1')
+        self.dash_boundary = b'--' + boundary
+        self.delimiter = b'\r\n' + self.dash_boundary
+        self.max_part_size = max_part_size
+        self.skipped_parts = 0
+        self._buffer = bytearray()
+        self._state = _PREAMBLE
+        self._headers: Dict[str, str] = {}
+        self._length: Optional[int] = None
+        self._scan_from = 0
+
+    @property
+    def buffered(self) -> int:
+        """Number of bytes held while waiting for the rest of a part"""
+        return len(self._buffer)
+
+    def feed(self, data: bytes) -> List[Part]:
+        """Consume a chunk of the body and return the parts it completed"""
+        self._buffer += data
+        parts = []
+        while True:
+            if self._state == _PREAMBLE:
+                if not self._find_boundary():
+                    break
+            elif self._state == _HEADERS:
+                if not self._read_headers():
+                    break
+            elif self._state == _BODY:
+                part = self._read_body()
+                if part is not None:
+                    parts.append(part)
+                elif self._state == _BODY:
+                    break
+            elif self._state == _DISCARD:
+                if not self._discard():
+                    break
+            else:
+                self._buffer.clear()
+                break
+        return parts
+
+    def _find_boundary(self) -> bool:
+        buffer = self._buffer
+        index = buffer.find(self.dash_boundary, self._scan_from)
+        if index < 0:
+            # Keep only a tail that could hold the start of the boundary
+            keep = len(self.dash_boundary) - 1
+            if len(buffer) > keep:
+                del buffer[:len(buffer) - keep]
+            self._scan_from = 0
+            return False
+        line_end = buffer.find(b'\n', index + len(self.dash_boundary))
+        if line_end < 0:
+            if index:
+                del buffer[:index]
+            self._scan_from = 0
+            return False
+        closing = buffer[index + len(self.dash_boundary):line_end].startswith(b'--')
+        del buffer[:line_end + 1]
+        self._scan_from = 0
+        self._state = _END if closing else _HEADERS
+        return True
+
+    def _read_headers(self) -> bool:
+        buffer = self._buffer
+        end = buffer.find(b'\r\n\r\n')
+        separator = 4
+        if end < 0:
+            end = buffer.find(b'\n\n')
+            separator = 2
+        if end < 0:
+            if len(buffer) > MAX_HEADER_SIZE:
+                raise MultipartError(f"Part headers exceed {MAX_HEADER_SIZE} bytes")
+            return False
+
+        headers = {}
+        for line in bytes(buffer[:end]).decode('latin-1').splitlines():
+            name, colon, value = line.partition(':')
+            if colon:
+                headers[name.strip().lower()] = value.strip()
+        del buffer[:end + separator]
+
+        self._headers = headers
+        self._scan_from = 0
+        try:
+            self._length = int(headers['content-length'])
+        except (KeyError, ValueError):
+            self._length = None
+        if self._length is not None and self._length > self.max_part_size:
+            self.skipped_parts += 1
+            self._state = _DISCARD
+        else:
+            self._state = _BODY
+        return True
+
+    def _read_body(self) -> Optional[Part]:
+        buffer = self._buffer
+        if self._length is not None:
+            if len(buffer) < self._length:
+                return None
+            body = bytes(buffer[:self._length])
+            del buffer[:self._length]
+        else:
+            index = buffer.find(self.delimiter, self._scan_from)
+            if index < 0:
+                if len(buffer) > self.max_part_size:
+                    self.skipped_parts += 1
+                    self._state = _DISCARD
+                    return None
+                # Resume the search where a split delimiter could start
+                self._scan_from = max(0, len(buffer) - len(self.delimiter) + 1)
+                return None
+            body = bytes(buffer[:index])
+            del buffer[:index + 2]
+        self._scan_from = 0
+        self._state = _PREAMBLE
+        return Part(self._headers, body)
+
+    def _discard(self) -> bool:
+        buffer = self._buffer
+        if self._length is not None:
+            dropped = min(self._length, len(buffer))
+            del buffer[:dropped]
+            self._length -= dropped
+            if self._length:
+                return False
+        else:
+            index = buffer.find(self.delimiter)
+            if index < 0:
+                keep = len(self.delimiter) - 1
+                if len(buffer) > keep:
+                    del buffer[:len(buffer) - keep]
+                return False
+            del buffer[:index + 2]
+        self._length = None
+        self._scan_from = 0
+        self._state = _PREAMBLE
+        return True
+
+
+def decode_part(part: Part, present: Optional[str] = 'dict', engine: Optional[str] = None) -> Any:
+    """Convert a part to an event
+
+    XML and JSON parts become dicts (or text when ``present='text'``), other
+    parts such as pictures are returned as raw bytes.
+    """
+    content_type = part.content_type
+    textual = 'xml' in content_type or 'json' in content_type or content_type.startswith('text/')
+    if not content_type:
+        textual = part.body.lstrip()[:1] in (b'<', b'{', b'[')
+    if not textual:
+        return part.body
+
+    body = part.body.strip()
+    if present is not None and present != 'dict':
+        return body.decode(part.charset, errors='replace')
+    if 'json' in content_type or body[:1] in (b'{', b'['):
+        return json.loads(body.decode(part.charset))
+    if 'xml' in content_type or body[:1] == b'<':
+        return parse_xml(body, engine)
+    return body.decode(part.charset, errors='replace')
@@ -0,0 +1,263 @@
+# coding=utf-8
+"""
+XML parsing engines for ISAPI responses
+
+``parse_xml`` converts a response to plain dicts shaped like ``xmltodict``
+output (``@attr`` keys, ``#text``, lists for repeated tags) without the old
+``json.loads(json.dumps(...))`` round-trip. Engines:
+
+- ``xmltodict``: the reference engine (default)
+- ``etree``: stdlib ``xml.etree.ElementTree`` parser feeding a dict builder
+- ``lxml``: ``lxml.etree`` parser feeding the same builder, available when
+  lxml is installed
+
+``extract`` pulls only the requested fields from the parser events, so no
+tree is built and nothing but the answer is kept in memory.
+"""
+
+from typing import Any, Callable, Dict, List, Mapping, Optional, Union
+from xml.etree import ElementTree
+
+import xmltodict
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # pragma: no cover
+    lxml_etree = None
+
+Data = Union[str, bytes]
+
+_default_engine = 'xmltodict'
+
+
+def _as_bytes(data: Data) -> bytes:
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    return data
+
+
+def _local(tag: str) -> str:
+    if tag[0] == '{':
+        return tag.rsplit('}', 1)[1]
+    return tag
+
+
+def _parse_xmltodict(data: Data) -> Dict[str, Any]:
+    return xmltodict.parse(data, dict_constructor=dict)
+
+
+class _DictBuilder:
+    """Parser target building xmltodict-shaped dicts straight from expat events"""
+
+    def __init__(self):
+        self.stack: List[Dict[str, Any]] = [{}]
+        self.texts: List[List[str]] = [[]]
+        self.namespaces = []
+
+    def start_ns(self, prefix: str, uri: str) -> None:
+        self.namespaces.append((prefix, uri))
+
+    def start(self, tag: str, attrib: Mapping[str, str]) -> None:
+        node = {}
+        if self.namespaces:
+            for prefix, uri in self.namespaces:
+                node['@xmlns:' + prefix if prefix else '@xmlns'] = uri
+            self.namespaces = []
+        for key, value in attrib.items():
+            node['@' + _local(key)] = value
+        self.stack.append(node)
+        self.texts.append([])
+
+    def data(self, data: str) -> None:
+        self.texts[-1].append(data)
+
+    def end(self, tag: str) -> None:
+        node = self.stack.pop()
+        text = ''.join(self.texts.pop()).strip()
+        if node:
+            if text:
+                node['#text'] = text
+            value = node
+        else:
+            value = text or None
+        parent = self.stack[-1]
+        key = _local(tag)
+        if key in parent:
+            existing = parent[key]
+            if isinstance(existing, list):
+                existing.append(value)
+            else:
+                parent[key] = [existing, value]
+        else:
+            parent[key] = value
+
+    def close(self) -> Dict[str, Any]:
+        return self.stack[0]
+
+
+def _feed(parser_class, target, data: Data):
+    parser = parser_class(target=target)
+    parser.feed(_as_bytes(data))
+    return parser.close()
+
+
+def _parse_etree(data: Data) -> Dict[str, Any]:
+    return _feed(ElementTree.XMLParser, _DictBuilder(), data)
+
+
+def _parse_lxml(data: Data) -> Dict[str, Any]:
+    return _feed(_lxml_parser_class(), _DictBuilder(), data)
+
+
+def _lxml_parser_class():
+    if lxml_etree is None:
+        raise ImportError("The 'lxml' parser engine requires lxml: pip install lxml")
+    return lxml_etree.XMLParser
+
+
+ENGINES: Dict[str, Callable[[Data], Dict[str, Any]]] = {
+    'xmltodict': _parse_xmltodict,
+    'etree': _parse_etree,
+    'lxml': _parse_lxml,
+}
+
+
+def set_default_engine(engine: str) -> None:
+    """Select the engine used by ``response_parser`` when none is given"""
+    global _default_engine
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown parser engine: {engine}")
+    if engine == 'lxml':
+        _lxml_parser_class()
+    _default_engine = engine
+
+
+def get_default_engine() -> str:
+    return _default_engine
+
+
+def parse_xml(data: Data, engine: Optional[str] = None) -> Dict[str, Any]:
+    """Convert an XML document to plain dicts
+
+    :param data: XML text or bytes
+    :param engine: (optional) 'xmltodict', 'etree' or 'lxml'
+    """
+    return ENGINES[engine or _default_engine](data)
+
+
+def to_bool(value: Optional[str]) -> Optional[bool]:
+    """Converter for ISAPI 'true'/'false' fields"""
+    if value is None:
+        return None
+    return value.strip().lower() == 'true'
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _Extractor:
+    """Parser target keeping only the requested fields"""
+
+    def __init__(self, paths, converters):
+        self.converters = converters
+        self.result: Dict[str, Any] = {}
+        self.scalars: Dict[str, str] = {}
+        self.records: Dict[str, tuple] = {}
+        for path in paths:
+            tag, *fields = path.split('/')
+            if fields:
+                self.records[tag] = (path, tuple(fields))
+                self.result[path] = []
+            else:
+                self.scalars[tag] = path
+                self.result[path] = None
+        fields = {field for _, record_fields in self.records.values() for field in record_fields}
+        self.wanted = set(self.scalars).union(field.rsplit('.', 1)[-1] for field in fields)
+        # Levels below their record of the dotted fields, e.g. 2 for 'child.field'
+        self.nested = sorted({field.count('.') + 1 for field in fields if '.' in field})
+        self.tags: List[str] = []
+        self.depth = 0
+        self.open_records: Dict[int, tuple] = {}
+        self.text: Optional[List[str]] = None
+
+    def start(self, tag: str, attrib: Mapping[str, str]) -> None:
+        self.depth += 1
+        tag = _local(tag)
+        if self.nested:
+            self.tags.append(tag)
+        self.text = [] if tag in self.wanted else None
+        if tag in self.records:
+            path, fields = self.records[tag]
+            self.open_records[self.depth] = (path, fields, dict.fromkeys(fields))
+
+    def data(self, data: str) -> None:
+        if self.text is not None:
+            self.text.append(data)
+
+    def _value(self, tag: str) -> Any:
+        text = ''.join(self.text or ()).strip() or None
+        convert = self.converters.get(tag)
+        if convert is None or text is None:
+            return text
+        return convert(text)
+
+    def end(self, tag: str) -> None:
+        tag = _local(tag)
+        record = self.open_records.get(self.depth - 1)
+        if record is not None and tag in record[1]:
+            record[2][tag] = self._value(tag)
+        if self.nested:
+            if self.text is not None:
+                for levels in self.nested:
+                    record = self.open_records.get(self.depth - levels)
+                    name = '.'.join(self.tags[-levels:])
+                    if record is not None and name in record[1]:
+                        record[2][name] = self._value(tag)
+            self.tags.pop()
+        if tag in self.scalars:
+            self.result[self.scalars.pop(tag)] = self._value(tag)
+            if not self.scalars and not self.records:
+                raise _StopParsing()
+        record = self.open_records.pop(self.depth, None)
+        if record is not None:
+            self.result[record[0]].append(record[2])
+        self.depth -= 1
+        self.text = None
+
+    def close(self) -> Dict[str, Any]:
+        return self.result
+
+
+def extract(
+    data: Data,
+    *paths: str,
+    converters: Optional[Mapping[str, Callable[[str], Any]]] = None,
+    engine: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Pull only the requested fields out of an ISAPI document
+
+    A bare tag (``'localTime'``) returns the text of its first occurrence. A
+    path ``'Record/field/...'`` (``'VideoInputChannel/id/enabled'``) returns
+    a list with one dict per ``Record`` holding the listed child fields. A
+    dotted field (``'child.field'``) is read from a grandchild of the record.
+    Namespaces are ignored and no tree is built. Parsing stops as soon as
+    every bare tag is found and no record path is pending.
+
+    Usage::
+
+    extract(xml, 'localTime')
+    {'localTime': '2024-01-01T10:00:00+05:30'}
+
+    extract(xml, 'VideoInputChannel/id/enabled', converters={'id': int, 'enabled': to_bool})
+    {'VideoInputChannel/id/enabled': [{'id': 1, 'enabled': True}, ...]}
+
+    :param converters: (optional) Callables applied to non-empty field values, by field name
+    :param engine: (optional) 'etree' (default) or 'lxml'
+    """
+    extractor = _Extractor(paths, converters or {})
+    parser_class = _lxml_parser_class() if engine == 'lxml' else ElementTree.XMLParser
+    try:
+        return _feed(parser_class, extractor, data)
+    except _StopParsing:
+        return extractor.result
@@ -0,0 +1,408 @@
+# coding=utf-8
+"""
+Fleet-wide poller for Hikvision devices
+
+Polls many DVRs concurrently in a single process over ``AsyncClient`` and
+writes one NDJSON line per device in the same shape the ``hik_py``
+``get_hikvision_data`` helper returns.
+
+Usage::
+
+    python -m hikvisionapi.poller devices.csv --concurrency 200 --deadline 10
+    cat devices.json | python -m hikvisionapi.poller - > results.ndjson
+    python -m hikvisionapi.poller devices.csv --shards 4 > results.ndjson
+    python -m hikvisionapi.poller devices.csv --threads 32 > results.ndjson
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO,
+)
+
+import httpx
+
+from . import metrics
+from .authcache import default_auth_cache
+from .fieldcache import FieldCache
+from .health import HealthTracker
+from .metastore import MetaStore
+from .hikvisionapi import AsyncClient, Client
+from .precheck import Reachability, check
+from .shard import ShardedSweep
+from .snapshot import FIELDS, SKIPPED, HealthSnapshot, empty_result
+
+DEVICE_FIELDS = ('ip', 'port', 'username', 'password')
+
+
+def _read_devices(stream: TextIO, fmt: Optional[str]) -> List[Dict[str, Any]]:
+    text = stream.read()
+    if fmt is None:
+        stripped = text.lstrip()
+        if stripped.startswith('['):
+            fmt = 'json'
+        elif stripped.startswith('{'):
+            fmt = 'ndjson'
+        else:
+            fmt = 'csv'
+
+    if fmt == 'json':
+        devices = json.loads(text)
+    elif fmt == 'ndjson':
+        devices = [json.loads(line) for line in text.splitlines() if line.strip()]
+    elif fmt == 'csv':
+        devices = list(csv.DictReader(io.StringIO(text)))
+    else:
+        raise ValueError(f"Unsupported device list format: {fmt}")
+
+    for device in devices:
+        missing = [field for field in DEVICE_FIELDS if device.get(field) in (None, '')]
+        if missing:
+            raise ValueError(f"Device {device!r} is missing {', '.join(missing)}")
+    return devices
+
+
+def load_devices(source: str, fmt: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Read a list of DVRs from a JSON, NDJSON or CSV file
+
+    :param source: Path to the device list, or '-' to read stdin
+    :param fmt: (optional) 'json', 'ndjson' or 'csv'. Guessed from the file
+        extension or the content when omitted
+    :return: list of dicts with at least ip, port, username and password
+    """
+    if source == '-':
+        return _read_devices(sys.stdin, fmt)
+
+    if fmt is None:
+        extension = source.rsplit('.', 1)[-1].lower()
+        if extension in ('json', 'ndjson', 'csv'):
+            fmt = extension
+        elif extension == 'jsonl':
+            fmt = 'ndjson'
+    with open(source, 'r', encoding='utf-8-sig', newline='') as fd:
+        return _read_devices(fd, fmt)
+
+
+async def poll_device(
+    device: Dict[str, Any],
+    timeout: Optional[float] = 5,
+    http_client: Optional[httpx.AsyncClient] = None,
+    fields: Sequence[str] = FIELDS,
+    health: Optional[HealthTracker] = None,
+    cache: Optional[FieldCache] = None,
+) -> Dict[str, Any]:
+    """Collect status, time, camera, storage and recording information for one DVR
+
+    Returns the ``get_hikvision_data`` shape from ``hik_py/test_hikvision.py``,
+    built from one concurrent ``health_snapshot`` of the device.
+
+    :param http_client: (optional) Shared httpx client to reuse connections from
+    :param fields: (optional) Subset of snapshot.FIELDS to collect
+    :param health: (optional) HealthTracker, known-dead devices fail at once
+    :param cache: (optional) FieldCache serving storage and recording range between sweeps
+    """
+    async with AsyncClient(
+        f"http://{device['ip']}:{device['port']}",
+        device['username'],
+        device['password'],
+        timeout=timeout,
+        http_client=http_client,
+        health=health,
+    ) as cam:
+        snapshot = await cam.health_snapshot(fields, cache)
+    return _legacy_result(device, snapshot)
+
+
+def _legacy_result(device: Dict[str, Any], snapshot: HealthSnapshot) -> Dict[str, Any]:
+    for name, error in snapshot.errors().items():
+        if name != 'status' and error != SKIPPED:
+            print(f"Error getting {name} info from {device['ip']}: {error}", file=sys.stderr)
+    return snapshot.as_legacy_dict()
+
+
+async def _poll_one(
+    device: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+    timeout: Optional[float],
+    deadline: Optional[float],
+    http_client: httpx.AsyncClient,
+    fields: Sequence[str] = FIELDS,
+    health: Optional[HealthTracker] = None,
+    precheck: Optional[Callable[[Dict[str, Any]], Awaitable[Reachability]]] = None,
+    cache: Optional[FieldCache] = None,
+) -> Dict[str, Any]:
+    if precheck is not None:
+        reach = await precheck(device)
+        if not reach.reachable:
+            result = reach.as_result()
+            result['ip'] = device['ip']
+            result['port'] = device['port']
+            return result
+
+    async with semaphore:
+        try:
+            result = await asyncio.wait_for(poll_device(device, timeout, http_client, fields, health, cache), deadline)
+        except asyncio.TimeoutError:
+            result = empty_result('ERROR', f"Deadline of {deadline}s exceeded")
+        except Exception as e:
+            result = empty_result('ERROR', str(e) or type(e).__name__)
+    result['ip'] = device['ip']
+    result['port'] = device['port']
+    return result
+
+
+async def poll_fleet(
+    devices: Iterable[Dict[str, Any]],
+    concurrency: int = 100,
+    timeout: Optional[float] = 5,
+    deadline: Optional[float] = 15,
+    fields: Sequence[str] = FIELDS,
+    health: Optional[HealthTracker] = None,
+    precheck: Optional[float] = None,
+    precheck_isapi: bool = False,
+    precheck_concurrency: int = 500,
+    cache: Optional[FieldCache] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Poll every device concurrently and yield results as they complete
+
+    :param devices: Iterable of device dicts (ip, port, username, password)
+    :param concurrency: (optional) Maximum number of devices polled at once
+    :param timeout: (optional) Timeout for each request
+    :param deadline: (optional) Total time budget per device, None to disable
+    :param fields: (optional) Subset of snapshot.FIELDS to collect per device
+    :param health: (optional) HealthTracker shared by the sweep. Devices whose
+        circuit is open fail at once, so the sweep time is set by healthy devices
+    :param precheck: (optional) Deadline of a raw TCP pre-check in seconds. Devices
+        that fail it get 'NO NETWORK' or 'ERROR' without a full poll
+    :param precheck_isapi: (optional) Make the pre-check send an unauthenticated
+        System/status request as well
+    :param precheck_concurrency: (optional) Pre-check connections open at once
+    :param cache: (optional) FieldCache shared by the sweep, so HDD capacity and the
+        recording range are only searched for when their TTL expired
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    reachable = None
+    if precheck is not None:
+        precheck_semaphore = asyncio.Semaphore(precheck_concurrency)
+
+        async def reachable(device: Dict[str, Any]) -> Reachability:
+            async with precheck_semaphore:
+                return await check(device['ip'], device['port'], precheck, precheck_isapi)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as http_client:
+        tasks = [
+            asyncio.ensure_future(_poll_one(
+                device, semaphore, timeout, deadline, http_client, fields, health, reachable, cache
+            ))
+            for device in devices
+        ]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Let the cancelled polls unwind before their http client closes
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _poll_device_sync(
+    device: Dict[str, Any],
+    timeout: float,
+    fields: Sequence[str],
+    health: Optional[HealthTracker],
+    cache: Optional[FieldCache],
+) -> Dict[str, Any]:
+    try:
+        with Client(
+            f"http://{device['ip']}:{device['port']}", device['username'], device['password'],
+            timeout=timeout, health=health,
+        ) as cam:
+            result = _legacy_result(device, cam.health_snapshot(fields, cache))
+    except Exception as e:
+        result = empty_result('ERROR', str(e) or type(e).__name__)
+    result['ip'] = device['ip']
+    result['port'] = device['port']
+    return result
+
+
+def sweep(
+    devices: Iterable[Dict[str, Any]],
+    max_workers: int = 32,
+    timeout: float = 5,
+    fields: Sequence[str] = FIELDS,
+    health: Optional[HealthTracker] = None,
+    cache: Optional[FieldCache] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Poll every device with the sync Client in a thread pool, yield results as they complete
+
+    For callers that cannot run an event loop. A thread cannot be cancelled,
+    so a device takes up to ``timeout`` per request instead of a total deadline.
+
+    Basic Usage::
+
+    for result in sweep(devices, max_workers=32):
+        print(result['ip'], result['status'])
+
+    :param devices: Iterable of device dicts (ip, port, username, password)
+    :param max_workers: (optional) Devices polled at once
+    :param timeout: (optional) Timeout for each request
+    :param fields: (optional) Subset of snapshot.FIELDS to collect per device
+    :param health: (optional) HealthTracker shared by the sweep
+    :param cache: (optional) FieldCache shared by the sweep
+    """
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hikvision-sweep') as executor:
+        futures = [
+            executor.submit(_poll_device_sync, device, timeout, fields, health, cache)
+            for device in devices
+        ]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+async def _run(args, output: TextIO) -> int:
+    devices = load_devices(args.source, args.format)
+    count = 0
+    async for result in poll_fleet(
+        devices,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        deadline=args.deadline,
+        fields=args.fields,
+        health=HealthTracker(path=args.health_state) if args.health_state else None,
+        precheck=args.precheck,
+        precheck_isapi=args.precheck_isapi,
+        cache=FieldCache(path=args.field_cache) if args.field_cache else None,
+    ):
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+        count += 1
+    return count
+
+
+def _write_metrics(path: str, text: str) -> None:
+    """Replace ``path`` atomically, as node_exporter's textfile collector expects"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics')
+    with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+        tmp.write(text)
+    os.replace(tmp_path, path)
+
+
+def _run_threads(args, output: TextIO) -> int:
+    count = 0
+    for result in sweep(
+        load_devices(args.source, args.format),
+        max_workers=args.threads,
+        timeout=args.timeout,
+        fields=args.fields,
+        health=HealthTracker(path=args.health_state) if args.health_state else None,
+        cache=FieldCache(path=args.field_cache) if args.field_cache else None,
+    ):
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+        count += 1
+    return count
+
+
+def _run_sharded(args, output: TextIO) -> int:
+    sweep = ShardedSweep(
+        load_devices(args.source, args.format),
+        shards=args.shards,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        deadline=args.deadline,
+        fields=args.fields,
+        health_state=args.health_state,
+        precheck=args.precheck,
+        precheck_isapi=args.precheck_isapi,
+        field_cache=args.field_cache,
+        metadata=args.metadata,
+    )
+    count = 0
+    for result in sweep:
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+        count += 1
+    for stats in sorted(sweep.stats):
+        print(f"Shard {stats.shard}: {stats.devices} devices, {stats.errors} errors in {stats.elapsed:.2f}s "
+              f"({stats.rate:.1f} devices/s, {stats.bytes} bytes)", file=sys.stderr)
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m hikvisionapi.poller',
+        description='Poll a fleet of Hikvision DVRs and write one NDJSON result per device',
+    )
+    parser.add_argument('source', help="Device list (.json, .ndjson or .csv), '-' for stdin")
+    parser.add_argument('--format', choices=('json', 'ndjson', 'csv'), default=None,
+                        help='Device list format (default: guessed)')
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help='Maximum number of devices polled at once (default: 100)')
+    parser.add_argument('--timeout', type=float, default=5,
+                        help='Timeout for each request in seconds (default: 5)')
+    parser.add_argument('--deadline', type=float, default=15,
+                        help='Total time budget per device in seconds (default: 15)')
+    parser.add_argument('--fields', type=lambda value: tuple(value.split(',')), default=FIELDS,
+                        help=f"Comma separated snapshot fields (default: {','.join(FIELDS)})")
+    parser.add_argument('--health-state', default=None,
+                        help='JSON file keeping device latency and circuit state between runs')
+    parser.add_argument('--precheck', type=float, nargs='?', const=0.8, default=None, metavar='SECONDS',
+                        help='TCP pre-check with this deadline before polling (default deadline: 0.8)')
+    parser.add_argument('--precheck-isapi', action='store_true',
+                        help='Make the pre-check request /ISAPI/System/status without credentials')
+    parser.add_argument('--field-cache', default=None,
+                        help='JSON file caching storage and recording range between runs')
+    parser.add_argument('--metadata', default=None, metavar='FILE',
+                        help='SQLite file keeping auth schemes between runs, shared by shards and daemons')
+    parser.add_argument('--shards', type=int, nargs='?', const=0, default=None, metavar='N',
+                        help='Poll in N worker processes (default N: the CPU count). Health state and '
+                             'field cache files get a .shard<N> suffix')
+    parser.add_argument('--threads', type=int, default=None, metavar='N',
+                        help='Poll with the sync client in N threads instead of asyncio. '
+                             'No --deadline or --precheck')
+    parser.add_argument('--metrics', default=None, metavar='FILE',
+                        help='Write request timings in the Prometheus text format to FILE after the sweep')
+    parser.add_argument('--output', default='-', help="Output file, '-' for stdout")
+    args = parser.parse_args(argv)
+    if args.metrics and args.shards is not None:
+        parser.error('--metrics is not supported with --shards')
+    if args.threads is not None and (args.shards is not None or args.precheck is not None):
+        parser.error('--threads cannot be combined with --shards or --precheck')
+
+    def run(output: TextIO) -> None:
+        collector = metrics.enable() if args.metrics else None
+        if args.metadata and args.shards is None:
+            default_auth_cache.attach(MetaStore(args.metadata))
+        if args.shards is not None:
+            _run_sharded(args, output)
+        elif args.threads is not None:
+            _run_threads(args, output)
+        else:
+            asyncio.run(_run(args, output))
+        if collector is not None:
+            _write_metrics(args.metrics, collector.prometheus())
+
+    if args.output == '-':
+        run(sys.stdout)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            run(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
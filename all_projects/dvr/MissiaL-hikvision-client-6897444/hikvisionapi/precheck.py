@@ -0,0 +1,193 @@
+# coding=utf-8
+"""
+Cheap reachability pre-check
+
+Opens a raw TCP connection to the ISAPI port of every device with a short
+deadline, optionally sends one unauthenticated ``System/status`` request,
+and sorts devices into "no network", "port closed", "not ISAPI" and
+reachable. Only reachable devices are worth a full authenticated poll.
+
+Usage::
+
+    python -m hikvisionapi.precheck devices.csv --timeout 0.8 --isapi > reachability.ndjson
+"""
+
+import argparse
+import asyncio
+import errno
+import json
+import socket
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .snapshot import empty_result
+
+OPEN = 'open'
+ISAPI = 'isapi'
+NOT_ISAPI = 'not_isapi'
+REFUSED = 'refused'
+TIMEOUT = 'timeout'
+UNREACHABLE = 'unreachable'
+DNS = 'dns'
+
+REACHABLE = frozenset((OPEN, ISAPI))
+
+# Status values shared with get_hikvision_data and the Node worker
+STATUSES = {
+    OPEN: 'ONLINE',
+    ISAPI: 'ONLINE',
+    NOT_ISAPI: 'ERROR',
+    REFUSED: 'ERROR',
+    TIMEOUT: 'NO NETWORK',
+    UNREACHABLE: 'NO NETWORK',
+    DNS: 'NO NETWORK',
+}
+
+_UNREACHABLE_ERRNOS = frozenset(
+    getattr(errno, name) for name in ('ENETUNREACH', 'EHOSTUNREACH', 'EHOSTDOWN', 'ENETDOWN')
+    if hasattr(errno, name)
+)
+
+
+class Reachability(NamedTuple):
+    host: str
+    port: int
+    state: str
+    elapsed: float
+    error: Optional[str] = None
+
+    @property
+    def reachable(self) -> bool:
+        return self.state in REACHABLE
+
+    @property
+    def status(self) -> str:
+        return STATUSES[self.state]
+
+    def as_result(self) -> Dict[str, Any]:
+        """Result in the ``get_hikvision_data`` shape for an unreachable device"""
+        result = empty_result(self.status, self.error or self.state)
+        result['precheck'] = self.state
+        return result
+
+
+async def _isapi_probe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       host: str, port: int, prefix: str) -> Tuple[str, Optional[str]]:
+    writer.write(
+        f"GET /{prefix}/System/status HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n\r\n".encode()
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    parts = status_line.split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith(b'HTTP/'):
+        return NOT_ISAPI, "Not an HTTP server"
+    code = int(parts[1]) if parts[1].isdigit() else 0
+    # ISAPI answers 401 without credentials, some firmwares 200
+    if code in (200, 401):
+        return ISAPI, None
+    return NOT_ISAPI, f"HTTP {code} on /{prefix}/System/status"
+
+
+async def check(host: str, port: int = 80, timeout: float = 0.8, isapi: bool = False,
+                prefix: str = 'ISAPI') -> Reachability:
+    """Classify one device
+
+    :param host: IP address or name of the device
+    :param port: (optional) ISAPI port
+    :param timeout: (optional) Deadline for the whole check in seconds
+    :param isapi: (optional) Also send an unauthenticated System/status request
+        and check that ISAPI answers
+    """
+    port = int(port)
+    started = time.monotonic()
+    writer = None
+    try:
+        async def run() -> Tuple[str, Optional[str]]:
+            nonlocal writer
+            reader, writer = await asyncio.open_connection(host, port)
+            if isapi:
+                return await _isapi_probe(reader, writer, host, port, prefix)
+            return OPEN, None
+
+        state, error = await asyncio.wait_for(run(), timeout)
+    except asyncio.TimeoutError:
+        state, error = TIMEOUT, f"No answer within {timeout}s"
+    except ConnectionRefusedError:
+        state, error = REFUSED, f"Port {port} closed"
+    except socket.gaierror as e:
+        state, error = DNS, str(e)
+    except OSError as e:
+        state = UNREACHABLE if e.errno in _UNREACHABLE_ERRNOS else REFUSED
+        error = e.strerror or str(e)
+    finally:
+        if writer is not None:
+            writer.close()
+    return Reachability(host, port, state, time.monotonic() - started, error)
+
+
+async def check_many(
+    devices: Iterable[Dict[str, Any]],
+    concurrency: int = 500,
+    timeout: float = 0.8,
+    isapi: bool = False,
+) -> AsyncIterator[Tuple[Dict[str, Any], Reachability]]:
+    """Check devices in parallel and yield ``(device, reachability)`` as they finish
+
+    :param concurrency: (optional) Sockets open at once. Keep it under the
+        process file descriptor limit
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(device):
+        async with semaphore:
+            return device, await check(device['ip'], device['port'], timeout, isapi)
+
+    tasks = [asyncio.ensure_future(one(device)) for device in devices]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Let cancelled checks close their sockets before returning
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _run(args, output) -> Dict[str, int]:
+    # Imported here because the poller imports this module
+    from .poller import load_devices
+
+    counts: Dict[str, int] = {}
+    async for device, reach in check_many(load_devices(args.source, args.format), args.concurrency,
+                                          args.timeout, args.isapi):
+        counts[reach.state] = counts.get(reach.state, 0) + 1
+        output.write(json.dumps({
+            'ip': device['ip'], 'port': device['port'], 'state': reach.state,
+            'status': reach.status, 'elapsed': round(reach.elapsed, 4), 'error': reach.error,
+        }) + '\n')
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m hikvisionapi.precheck',
+        description='Classify DVR reachability with raw TCP connects',
+    )
+    parser.add_argument('source', help="Device list (.json, .ndjson or .csv), '-' for stdin")
+    parser.add_argument('--format', choices=('json', 'ndjson', 'csv'), default=None)
+    parser.add_argument('--concurrency', type=int, default=500,
+                        help='Connections open at once (default: 500)')
+    parser.add_argument('--timeout', type=float, default=0.8,
+                        help='Deadline per device in seconds (default: 0.8)')
+    parser.add_argument('--isapi', action='store_true',
+                        help='Also check that /ISAPI/System/status answers')
+    args = parser.parse_args(argv)
+
+    counts = asyncio.run(_run(args, sys.stdout))
+    print(', '.join(f"{state}: {count}" for state, count in sorted(counts.items())), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
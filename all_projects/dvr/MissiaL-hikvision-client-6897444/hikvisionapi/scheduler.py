@@ -0,0 +1,401 @@
+# coding=utf-8
+"""
+Incremental poll scheduler with per-device, per-field due times
+
+A sweep polls every field of every DVR each time round, so a device that has
+been stable for weeks costs as much as one that flapped a minute ago, and the
+monitoring host sees a burst of requests at the start of every sweep. The
+scheduler instead keeps a heap of next-due times per device and snapshot
+field, each with its own cadence: ``status`` is cheap and checked often,
+channels, storage and the recording search are expensive and checked rarely.
+
+After every poll the interval of a field adapts:
+
+* a change (online to offline, a camera losing video, an HDD error) makes the
+  field due again soon, and a device going on- or offline pulls its other
+  fields forward
+* every unchanged poll lets the interval grow back to its base and then
+  stretch further for devices that stay stable
+* consecutive errors back off exponentially, so dead devices stop eating
+  the budget the circuit breaker has not already saved
+* a device ``priority`` divides every interval, and when more is due than
+  the budget allows the highest priority devices go first
+
+Requests are paced by a token bucket, so the load on the host stays flat at
+``rate`` requests per second instead of arriving in sweeps.
+
+Basic Usage::
+
+    from hikvisionapi.scheduler import Scheduler
+    scheduler = Scheduler(rate=50, concurrency=100)
+    for device in devices:
+        scheduler.add_device(device, priority=device.get('priority', 1))
+    async for poll in scheduler:
+        print(poll.key, poll.changed, poll.snapshot.status.ok)
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import time
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import httpx
+
+from .fieldcache import FieldCache
+from .health import HealthTracker
+from .hikvisionapi import AsyncClient
+from .snapshot import FIELDS, FieldResult, HealthSnapshot, _error, _result
+
+# Base seconds between polls of each field for a device of priority 1
+DEFAULT_INTERVALS = {
+    'status': 60,
+    'time': 15 * 60,
+    'channels': 5 * 60,
+    'storage': 30 * 60,
+    'recording': 15 * 60,
+}
+
+# Requests one poll of a field costs against the budget
+COSTS = {
+    'status': 1,
+    'time': 1,
+    'channels': 2,
+    'storage': 1,
+    'recording': 3,
+}
+
+# What counts as a change of each field. The clock moves on every poll, drift
+# is left to FleetState, and free space or the newest recording move all the time
+SIGNATURES: Dict[str, Callable[[Any], Any]] = {
+    'status': lambda value: True,
+    'time': lambda value: None,
+    'channels': lambda value: tuple((channel.id, channel.working) for channel in value or ()),
+    'storage': lambda value: tuple((hdd.id, hdd.status) for hdd in value or ()),
+    'recording': lambda value: bool(value and value[0]),
+}
+
+_ERROR = object()
+
+
+class Poll(NamedTuple):
+    key: str
+    device: Dict[str, Any]
+    snapshot: HealthSnapshot
+    # Fields whose state differs from the previous poll, including first polls
+    changed: Tuple[str, ...]
+    # Seconds the poll started after it was due
+    lag: float
+
+
+class TokenBucket:
+    """Paces requests at ``rate`` per second with bursts of up to ``burst``"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self, cost: float) -> None:
+        """Wait until ``cost`` tokens are available and spend them"""
+        # A poll dearer than the whole burst is charged the burst, or it would never go
+        cost = min(cost, self.burst)
+        self._refill()
+        while self.tokens < cost:
+            await asyncio.sleep((cost - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= cost
+
+
+class _Task:
+    __slots__ = ('key', 'field', 'due', 'version', 'stable', 'errors', 'signature', 'running')
+
+    def __init__(self, key: str, field: str, due: float):
+        self.key = key
+        self.field = field
+        self.due = due
+        self.version = 0
+        self.stable = 0
+        self.errors = 0
+        self.signature = None
+        self.running = False
+
+
+class _Device:
+    __slots__ = ('key', 'device', 'priority', 'tasks')
+
+    def __init__(self, key: str, device: Dict[str, Any], priority: float):
+        self.key = key
+        self.device = device
+        self.priority = priority
+        self.tasks: Dict[str, _Task] = {}
+
+
+class Scheduler:
+    """
+    Keeps every device and field on its own adaptive schedule
+
+    Iterate over the scheduler to run it, every completed poll is yielded as
+    a ``Poll``. Not thread-safe: add and remove devices from the event loop
+    that iterates.
+    """
+
+    def __init__(
+        self,
+        rate: float = 20,
+        concurrency: int = 50,
+        intervals: Optional[Mapping[str, float]] = None,
+        fields: Sequence[str] = FIELDS,
+        timeout: Optional[float] = 5,
+        deadline: Optional[float] = 30,
+        fast: float = 0.25,
+        max_stretch: float = 4.0,
+        stretch_after: int = 10,
+        max_backoff: float = 16.0,
+        coalesce: float = 1.0,
+        health: Optional[HealthTracker] = None,
+        cache: Optional[FieldCache] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ):
+        """
+        :param rate: (optional) Request budget per second, see COSTS
+        :param concurrency: (optional) Devices polled at once
+        :param intervals: (optional) Base seconds between polls per field,
+            merged over DEFAULT_INTERVALS
+        :param fields: (optional) Subset of snapshot.FIELDS to schedule
+        :param timeout: (optional) Timeout for each request
+        :param deadline: (optional) Total time budget per poll, None to disable
+        :param fast: (optional) Fraction of the base interval after a change
+        :param max_stretch: (optional) Largest multiple of the base interval for
+            a field that keeps the same state
+        :param stretch_after: (optional) Unchanged polls per extra base interval
+            once the field is back on its base cadence
+        :param max_backoff: (optional) Largest multiple of the base interval
+            after consecutive errors
+        :param coalesce: (optional) Fields of a device due within this many
+            seconds are polled together in one snapshot
+        :param health: (optional) HealthTracker shared by the clients
+        :param cache: (optional) FieldCache serving storage and recording range
+        :param http_client: (optional) Shared httpx.AsyncClient. It is not closed
+        """
+        self.intervals = {**DEFAULT_INTERVALS, **(intervals or {})}
+        self.fields = tuple(fields)
+        unknown = set(self.fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown snapshot fields: {', '.join(sorted(unknown))}")
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.deadline = deadline
+        self.fast = fast
+        # Unchanged polls after a change until the field is back on its base interval
+        self._settled = max(0, math.ceil(math.log2(1 / fast)))
+        self.max_stretch = max_stretch
+        self.stretch_after = stretch_after
+        self.max_backoff = max_backoff
+        self.coalesce = coalesce
+        self.health = health
+        self.cache = cache
+        self._http_client = http_client
+        self._owns_http_client = http_client is None
+        self._devices: Dict[str, _Device] = {}
+        self._heap: List[Tuple[float, int, int, _Task]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats = {'polls': 0, 'requests': 0, 'errors': 0, 'changes': 0, 'lag': 0.0}
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def add_device(self, device: Dict[str, Any], priority: float = 1, key: Optional[str] = None,
+                   spread: bool = True) -> str:
+        """Schedule a device, its first polls spread over each field's interval
+
+        :param device: Device dict (ip, port, username, password)
+        :param priority: (optional) Divides every interval of the device
+        :param key: (optional) Device key, defaults to ``ip:port``
+        :param spread: (optional) False makes every field due at once
+        :return the device key used in polls
+        """
+        if priority <= 0:
+            raise ValueError("priority must be positive")
+        key = key or f"{device['ip']}:{device['port']}"
+        if key in self._devices:
+            raise ValueError(f"Device {key} is already scheduled")
+        entry = self._devices[key] = _Device(key, device, priority)
+        now = time.monotonic()
+        for field in self.fields:
+            due = now + random.uniform(0, self._base(entry, field)) if spread else now
+            task = entry.tasks[field] = _Task(key, field, due)
+            self._push(task)
+        return key
+
+    def remove_device(self, key: str) -> None:
+        """Stop polling a device, a poll in flight still completes"""
+        entry = self._devices.pop(key, None)
+        if entry is not None:
+            for task in entry.tasks.values():
+                task.version += 1
+
+    def next_due(self, key: str) -> Dict[str, float]:
+        """Seconds until each field of a device is due, negative when overdue"""
+        now = time.monotonic()
+        return {field: task.due - now for field, task in self._devices[key].tasks.items()}
+
+    def _base(self, entry: _Device, field: str) -> float:
+        return self.intervals[field] / entry.priority
+
+    def _push(self, task: _Task) -> None:
+        task.version += 1
+        heapq.heappush(self._heap, (task.due, next(self._seq), task.version, task))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def interval(self, task: _Task, base: float) -> float:
+        """Seconds until the next poll of a field given its change and error history
+
+        Right after a change the interval is ``fast`` times the base and doubles
+        with every unchanged poll, then grows by one base interval every
+        ``stretch_after`` polls up to ``max_stretch``. The first error counts as
+        a change, so it is confirmed quickly, the ones after it back off.
+        """
+        if task.errors > 1:
+            return base * min(self.max_backoff, 2.0 ** (task.errors - 1))
+        if task.stable < self._settled:
+            return base * self.fast * 2 ** task.stable
+        return base * min(self.max_stretch, 1 + (task.stable - self._settled) // self.stretch_after)
+
+    def _update(self, entry: _Device, snapshot: HealthSnapshot, fields: Sequence[str]) -> Tuple[str, ...]:
+        now = time.monotonic()
+        scheduled = entry.key in self._devices
+        changed = []
+        flipped = False
+        for field in fields:
+            task = entry.tasks[field]
+            result = getattr(snapshot, field)
+            signature = SIGNATURES[field](result.value) if result.ok else _ERROR
+            task.errors = 0 if result.ok else task.errors + 1
+            if task.signature is None:
+                # First poll, already on the base cadence
+                task.stable = self._settled
+                changed.append(field)
+            elif signature != task.signature:
+                task.stable = 0
+                changed.append(field)
+                flipped = flipped or field == 'status'
+            else:
+                task.stable += 1
+            task.signature = signature
+            task.due = now + self.interval(task, self._base(entry, field))
+            task.running = False
+            if scheduled:
+                self._push(task)
+
+        if flipped and scheduled:
+            # Online or offline, everything else about the device is likely stale too
+            for field, task in entry.tasks.items():
+                if field not in fields and not task.running and task.due > now:
+                    task.due = now
+                    self._push(task)
+        return tuple(changed)
+
+    def _take_due(self) -> List[Tuple[_Device, List[_Task]]]:
+        """Pop every field due now, grouped by device, highest priority first"""
+        horizon = time.monotonic() + self.coalesce
+        groups: Dict[str, List[_Task]] = {}
+        while self._heap and self._heap[0][0] <= horizon:
+            _, _, version, task = heapq.heappop(self._heap)
+            if version != task.version or task.running or task.key not in self._devices:
+                continue
+            task.running = True
+            groups.setdefault(task.key, []).append(task)
+        batch = [(self._devices[key], tasks) for key, tasks in groups.items()]
+        batch.sort(key=lambda item: -item[0].priority)
+        return batch
+
+    async def _poll(self, entry: _Device, fields: Sequence[str], http_client: httpx.AsyncClient) -> HealthSnapshot:
+        device = entry.device
+        async with AsyncClient(
+            f"http://{device['ip']}:{device['port']}", device['username'], device['password'],
+            timeout=self.timeout, http_client=http_client, health=self.health,
+        ) as cam:
+            return await asyncio.wait_for(cam.health_snapshot(fields, self.cache), self.deadline)
+
+    async def _run_one(self, entry: _Device, tasks: List[_Task], http_client: httpx.AsyncClient,
+                       semaphore: asyncio.Semaphore, results: asyncio.Queue) -> None:
+        names = {task.field for task in tasks}
+        fields = tuple(field for field in self.fields if field in names)
+        lag = max(0.0, time.monotonic() - min(task.due for task in tasks))
+        started = time.perf_counter()
+        try:
+            snapshot = await self._poll(entry, fields, http_client)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.running = False
+            raise
+        except Exception as e:
+            error = f"Deadline of {self.deadline}s exceeded" if isinstance(e, asyncio.TimeoutError) else _error(e)
+            failed = FieldResult(None, time.perf_counter() - started, error)
+            snapshot = _result(entry.key, {field: failed for field in fields}, started)
+        finally:
+            semaphore.release()
+        changed = self._update(entry, snapshot, fields)
+        self.stats['polls'] += 1
+        self.stats['errors'] += any(getattr(snapshot, field).error for field in fields)
+        self.stats['changes'] += len(changed)
+        self.stats['lag'] = max(self.stats['lag'] * 0.99, lag)
+        await results.put(Poll(entry.key, entry.device, snapshot, changed, lag))
+
+    async def _dispatch(self, http_client: httpx.AsyncClient, results: asyncio.Queue, running: set) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            self._wakeup.clear()
+            batch = self._take_due()
+            for entry, tasks in batch:
+                await self.bucket.take(sum(COSTS[task.field] for task in tasks))
+                self.stats['requests'] += sum(COSTS[task.field] for task in tasks)
+                await semaphore.acquire()
+                future = asyncio.ensure_future(self._run_one(entry, tasks, http_client, semaphore, results))
+                running.add(future)
+                future.add_done_callback(running.discard)
+            if batch:
+                continue
+            delay = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __aiter__(self):
+        self._wakeup = asyncio.Event()
+        http_client = self._http_client or httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            timeout=self.timeout,
+        )
+        results: asyncio.Queue = asyncio.Queue()
+        running: set = set()
+        dispatcher = asyncio.ensure_future(self._dispatch(http_client, results, running))
+        try:
+            while True:
+                getter = asyncio.ensure_future(results.get())
+                await asyncio.wait((getter, dispatcher), return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    dispatcher.result()
+                yield getter.result()
+        finally:
+            dispatcher.cancel()
+            for future in list(running):
+                future.cancel()
+            await asyncio.gather(dispatcher, *running, return_exceptions=True)
+            self._wakeup = None
+            if self._owns_http_client:
+                await http_client.aclose()
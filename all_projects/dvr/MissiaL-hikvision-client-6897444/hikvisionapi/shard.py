@@ -0,0 +1,323 @@
+# coding=utf-8
+"""
+Sharded fleet sweeps over several processes
+
+Once the I/O is asynchronous, parsing the XML answers of thousands of DVRs
+keeps one core busy. ``ShardedSweep`` splits the device list over N worker
+processes, each running ``poll_fleet`` on its own event loop, and streams
+the results back over pipes as compact binary records instead of pickled
+nested dicts. Devices are assigned by a hash of ``host:port``, so a device
+stays on the same shard from run to run and per-shard state files
+(``health_state``, ``field_cache``) stay warm.
+
+Usage::
+
+    python -m hikvisionapi.poller devices.csv --shards 4 > results.ndjson
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import struct
+import sys
+import time
+import zlib
+from multiprocessing.connection import Connection, wait
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .authcache import host_key
+from .snapshot import empty_result
+
+# Records a worker writes in one pipe message
+BATCH_SIZE = 64
+BATCH_LATENCY = 0.05
+
+_RESULT = b'R'
+_STATS = b'S'
+_FAILED = b'F'
+
+# Every string of a result in a fixed order, so only the values go over the pipe
+_STRINGS: Tuple[Tuple[str, ...], ...] = (
+    ('ip',), ('status',), ('error',), ('precheck',),
+    ('deviceInfo', 'dvrTime'), ('deviceInfo', 'loginTime'), ('deviceInfo', 'currentDateTime'),
+    ('storageInfo', 'storageType'), ('storageInfo', 'storageStatus'),
+    ('storageInfo', 'storageCapacity'), ('storageInfo', 'storageFree'),
+    ('recordingInfo', 'recordingFrom'), ('recordingInfo', 'recordingTo'),
+)
+_TOP_LEVEL = frozenset(('ip', 'port', 'status', 'error', 'precheck', 'deviceInfo', 'cameraInfo',
+                        'storageInfo', 'recordingInfo'))
+_NONE = 0xFFFF
+_CAMERA = struct.Struct('<HB')
+_COUNTS = struct.Struct('<HHH')
+_CAMERA_CODES = {'Working': 1, 'Not Working': 2}
+_CAMERA_STATUSES = {code: status for status, code in _CAMERA_CODES.items()}
+_SHARD_STATS = struct.Struct('<HIIdQ')
+
+
+class ShardStats(NamedTuple):
+    shard: int
+    devices: int
+    errors: int
+    elapsed: float
+    bytes: int
+
+    @property
+    def rate(self) -> float:
+        """Devices per second"""
+        return self.devices / self.elapsed if self.elapsed else 0.0
+
+
+def _lookup(result: Dict[str, Any], path: Tuple[str, ...]) -> Any:
+    for key in path:
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+
+def _compact_cameras(info: Any) -> Optional[List[Tuple[int, int]]]:
+    """(number, status code) pairs, or None when the camera list does not fit them"""
+    if not isinstance(info, dict) or not isinstance(info.get('totalCameras'), int) \
+            or not 0 <= info['totalCameras'] < _NONE:
+        return None
+    cameras = []
+    for camera in info.get('cameraStatus') or ():
+        number = str(camera.get('number'))
+        code = _CAMERA_CODES.get(camera.get('status'))
+        if code is None or not number.isdigit() or str(int(number)) != number or int(number) >= _NONE:
+            return None
+        cameras.append((int(number), code))
+    return cameras if len(cameras) < _NONE else None
+
+
+def encode_result(result: Dict[str, Any]) -> bytes:
+    """Pack a ``get_hikvision_data`` shaped result into bytes
+
+    Strings are length-prefixed in a fixed field order and cameras take three
+    bytes each. Anything outside the known shape travels as a JSON tail, so
+    nothing is lost.
+    """
+    parts = []
+    for path in _STRINGS:
+        value = _lookup(result, path)
+        if value is None:
+            parts.append(struct.pack('<H', _NONE))
+        else:
+            data = str(value).encode('utf-8')[:_NONE - 1]
+            parts.append(struct.pack('<H', len(data)))
+            parts.append(data)
+    extras = {key: value for key, value in result.items() if key not in _TOP_LEVEL}
+    port = result.get('port')
+    if not isinstance(port, int) or not 0 <= port < _NONE:
+        # Ports read from CSV are strings, keep them as they are
+        extras['port'] = port
+        port = _NONE
+    cameras = _compact_cameras(result.get('cameraInfo'))
+    if cameras is None:
+        extras['cameraInfo'] = result.get('cameraInfo')
+        parts.append(_COUNTS.pack(port, 0, _NONE))
+    else:
+        parts.append(_COUNTS.pack(port, result['cameraInfo']['totalCameras'], len(cameras)))
+        parts.extend(_CAMERA.pack(number, code) for number, code in cameras)
+    if extras:
+        parts.append(json.dumps(extras).encode('utf-8'))
+    return b''.join(parts)
+
+
+def decode_result(data: bytes) -> Dict[str, Any]:
+    """Unpack encode_result() output into the result dict"""
+    view = memoryview(data)
+    offset = 0
+    result: Dict[str, Any] = {}
+    for path in _STRINGS:
+        (length,) = struct.unpack_from('<H', view, offset)
+        offset += 2
+        value = None
+        if length != _NONE:
+            value = bytes(view[offset:offset + length]).decode('utf-8')
+            offset += length
+        if len(path) == 1:
+            if value is not None or path[0] in ('ip', 'status'):
+                result[path[0]] = value
+        else:
+            result.setdefault(path[0], {})[path[1]] = value
+    port, total, count = _COUNTS.unpack_from(view, offset)
+    offset += _COUNTS.size
+    if port != _NONE:
+        result['port'] = port
+    if count != _NONE:
+        cameras = []
+        for _ in range(count):
+            number, code = _CAMERA.unpack_from(view, offset)
+            offset += _CAMERA.size
+            cameras.append({'number': str(number), 'status': _CAMERA_STATUSES[code]})
+        result['cameraInfo'] = {'totalCameras': total, 'cameraStatus': cameras}
+    if offset < len(view):
+        result.update(json.loads(bytes(view[offset:]).decode('utf-8')))
+    return result
+
+
+def shard_of(device: Dict[str, Any], shards: int) -> int:
+    """Stable shard number of a device"""
+    return zlib.crc32(host_key(f"{device['ip']}:{device['port']}").encode()) % shards
+
+
+def _state_path(path: Optional[str], shard: int) -> Optional[str]:
+    return f"{path}.shard{shard}" if path else None
+
+
+async def _shard(shard: int, devices: List[Dict[str, Any]], options: Dict[str, Any], conn: Connection) -> None:
+    # Imported in the worker: poller imports this module for --shards
+    from .authcache import default_auth_cache
+    from .fieldcache import FieldCache
+    from .health import HealthTracker
+    from .metastore import MetaStore
+    from .poller import poll_fleet
+
+    health_state = _state_path(options.pop('health_state', None), shard)
+    field_cache = _state_path(options.pop('field_cache', None), shard)
+    # SQLite takes writes from every shard, the metadata file is shared
+    metadata = options.pop('metadata', None)
+    if metadata:
+        default_auth_cache.attach(MetaStore(metadata))
+    started = time.perf_counter()
+    errors = sent = 0
+    batch: List[bytes] = []
+    flushed = time.monotonic()
+
+    def flush() -> None:
+        nonlocal sent, flushed
+        if batch:
+            message = _RESULT + b''.join(struct.pack('<I', len(record)) + record for record in batch)
+            conn.send_bytes(message)
+            sent += len(message)
+            batch.clear()
+        flushed = time.monotonic()
+
+    health = HealthTracker(path=health_state) if health_state else None
+    cache = FieldCache(path=field_cache) if field_cache else None
+    async for result in poll_fleet(devices, health=health, cache=cache, **options):
+        if result.get('status') != 'ONLINE':
+            errors += 1
+        batch.append(encode_result(result))
+        if len(batch) >= BATCH_SIZE or time.monotonic() - flushed >= BATCH_LATENCY:
+            flush()
+    flush()
+    # Workers exit without running atexit handlers
+    for state in (health, cache, default_auth_cache):
+        if state is not None:
+            state.flush()
+    conn.send_bytes(_STATS + _SHARD_STATS.pack(shard, len(devices), errors, time.perf_counter() - started, sent))
+
+
+def _worker(shard: int, devices: List[Dict[str, Any]], options: Dict[str, Any], conn: Connection) -> None:
+    try:
+        asyncio.run(_shard(shard, devices, options, conn))
+    except BaseException as e:
+        conn.send_bytes(_FAILED + f"{type(e).__name__}: {e}".encode('utf-8'))
+        raise
+    finally:
+        conn.close()
+
+
+def _decode_batch(data: bytes) -> Iterator[Dict[str, Any]]:
+    view = memoryview(data)
+    offset = 1
+    while offset < len(view):
+        (length,) = struct.unpack_from('<I', view, offset)
+        offset += 4
+        yield decode_result(view[offset:offset + length])
+        offset += length
+
+
+def _lost(devices: List[Dict[str, Any]], done: set, error: str) -> Iterator[Dict[str, Any]]:
+    """ERROR results for the devices of a crashed shard that got none"""
+    for device in devices:
+        if (str(device['ip']), str(device['port'])) not in done:
+            result = empty_result('ERROR', error)
+            result['ip'] = device['ip']
+            result['port'] = device['port']
+            yield result
+
+
+class ShardedSweep:
+    """
+    Poll a fleet with one process per shard
+
+    Basic Usage::
+
+    sweep = ShardedSweep(devices, shards=4, concurrency=200, deadline=10)
+    for result in sweep:
+        print(result['ip'], result['status'])
+    for stats in sweep.stats:
+        print(stats.shard, stats.devices, round(stats.rate, 1))
+    """
+
+    def __init__(self, devices: Sequence[Dict[str, Any]], shards: Optional[int] = None,
+                 mp_context: Optional[str] = 'spawn', **options):
+        """
+        :param devices: Device dicts (ip, port, username, password)
+        :param shards: (optional) Worker processes, defaults to the CPU count
+        :param mp_context: (optional) multiprocessing start method. 'spawn' is
+            safe next to threads, 'fork' starts faster
+        :param options: poll_fleet keyword arguments. ``health_state`` and
+            ``field_cache`` are file paths, suffixed with ``.shard<N>``.
+            ``metadata`` is a metastore.MetaStore file shared by every shard
+        """
+        self.shards = max(1, shards or os.cpu_count() or 1)
+        self.devices = devices
+        self.options = options
+        self.context = multiprocessing.get_context(mp_context)
+        self.stats: List[ShardStats] = []
+        self.failures: Dict[int, str] = {}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        groups: List[List[Dict[str, Any]]] = [[] for _ in range(self.shards)]
+        for device in self.devices:
+            groups[shard_of(device, self.shards)].append(device)
+        processes = []
+        readers = {}
+        # Devices each shard returned a result for, to report the rest if it crashes
+        done: Dict[int, set] = {shard: set() for shard in range(self.shards)}
+        try:
+            for shard, group in enumerate(groups):
+                if not group:
+                    continue
+                reader, writer = self.context.Pipe(duplex=False)
+                process = self.context.Process(
+                    target=_worker, args=(shard, group, dict(self.options), writer),
+                    name=f"hikvision-shard-{shard}", daemon=True,
+                )
+                process.start()
+                writer.close()
+                processes.append(process)
+                readers[reader] = shard
+            while readers:
+                for reader in wait(list(readers)):
+                    try:
+                        message = reader.recv_bytes()
+                    except EOFError:
+                        shard = readers.pop(reader)
+                        if not any(s.shard == shard for s in self.stats) and shard not in self.failures:
+                            self.failures[shard] = 'Worker exited without results'
+                        if shard in self.failures:
+                            error = f"Shard {shard} failed: {self.failures[shard]}"
+                            yield from _lost(groups[shard], done[shard], error)
+                        continue
+                    kind = message[:1]
+                    if kind == _RESULT:
+                        for result in _decode_batch(message):
+                            done[readers[reader]].add((str(result['ip']), str(result['port'])))
+                            yield result
+                    elif kind == _STATS:
+                        self.stats.append(ShardStats(*_SHARD_STATS.unpack(message[1:])))
+                    elif kind == _FAILED:
+                        self.failures[readers[reader]] = message[1:].decode('utf-8', 'replace')
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+        for shard, error in sorted(self.failures.items()):
+            print(f"Shard {shard} failed: {error}", file=sys.stderr)
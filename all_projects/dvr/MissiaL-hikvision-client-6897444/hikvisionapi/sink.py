@@ -0,0 +1,419 @@
+# coding=utf-8
+"""
+Batched PostgreSQL sink for poll results
+
+Results are buffered and written by one background thread on one long-lived
+connection, either appended with ``COPY ... FROM STDIN`` or upserted with
+multi-row ``INSERT ... ON CONFLICT`` statements. A batch is flushed when it
+reaches ``batch_size`` rows or when its oldest row is ``max_latency`` seconds
+old. Connection errors are retried with backoff; batches that still cannot
+be written are spooled to disk and replayed once the database is back. When
+neither works, ``put()`` blocks once ``max_pending`` rows are waiting, so
+the pollers slow down instead of the process running out of memory.
+
+The default table mirrors ``dvr_activity`` of the PHP activity logger.
+Needs psycopg2 unless ``connect`` returns another DB-API connection using
+the ``%s`` paramstyle. Cursors without psycopg2's ``copy_expert``, such as
+psycopg 3, append with paged multi-row ``INSERT`` statements instead of COPY.
+
+Usage::
+
+    python -m hikvisionapi.poller devices.csv | python -m hikvisionapi.sink --dsn "host=db dbname=esurv"
+"""
+
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    import psycopg2
+except ImportError:  # pragma: no cover
+    psycopg2 = None
+
+COPY = 'copy'
+UPSERT = 'upsert'
+
+CAMERA_COLUMNS = 8
+
+COLUMNS = (
+    'ip_address', 'status', 'dvr_time', 'login_time', 'system_time',
+    'total_cameras', 'storage_type', 'storage_status', 'storage_capacity', 'storage_free',
+    'recording_from', 'recording_to',
+) + tuple(f"cam{number}_status" for number in range(1, CAMERA_COLUMNS + 1))
+
+Row = Tuple[Any, ...]
+
+
+def _time_or_none(value: Optional[str]) -> Optional[str]:
+    return None if value in (None, '', 'N/A') else value
+
+
+def result_row(result: Dict[str, Any]) -> Row:
+    """Map a ``get_hikvision_data`` shaped result to a ``dvr_activity`` row"""
+    device = result.get('deviceInfo') or {}
+    cameras = result.get('cameraInfo') or {}
+    storage = result.get('storageInfo') or {}
+    recording = result.get('recordingInfo') or {}
+    camera_status = ['N/A'] * CAMERA_COLUMNS
+    for camera in cameras.get('cameraStatus') or ():
+        try:
+            number = int(camera['number'])
+        except (KeyError, TypeError, ValueError):
+            continue  # No column to put a channel without a number in
+        if 1 <= number <= CAMERA_COLUMNS:
+            camera_status[number - 1] = camera['status']
+    return (
+        result['ip'],
+        result.get('status'),
+        _time_or_none(device.get('dvrTime')),
+        _time_or_none(device.get('loginTime')),
+        _time_or_none(device.get('currentDateTime')),
+        cameras.get('totalCameras', 0),
+        storage.get('storageType'),
+        storage.get('storageStatus'),
+        storage.get('storageCapacity'),
+        storage.get('storageFree'),
+        _time_or_none(recording.get('recordingFrom')),
+        _time_or_none(recording.get('recordingTo')),
+    ) + tuple(camera_status)
+
+
+def _copy_value(value: Any) -> str:
+    """Encode one value in the COPY text format"""
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_text(rows: Sequence[Row]) -> str:
+    return ''.join('\t'.join(_copy_value(value) for value in row) + '\n' for row in rows)
+
+
+def _transient_errors() -> Tuple[type, ...]:
+    if psycopg2 is None:
+        return (OSError,)
+    return (OSError, psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class ResultSink:
+    """
+    Buffering writer of poll results
+
+    Basic Usage::
+
+    with ResultSink('host=192.168.100.23 dbname=esurv user=postgres', spool_dir='/var/spool/dvr') as sink:
+        async for result in poll_fleet(devices):
+            await sink.aput(result)
+    """
+
+    def __init__(
+        self,
+        connect: Union[str, Callable[[], Any]],
+        table: str = 'dvr_activity',
+        mode: str = COPY,
+        columns: Sequence[str] = COLUMNS,
+        row: Callable[[Dict[str, Any]], Row] = result_row,
+        key: Sequence[str] = ('ip_address',),
+        batch_size: int = 500,
+        max_latency: float = 1.0,
+        max_pending: int = 20000,
+        page_size: int = 1000,
+        retries: int = 3,
+        retry_delay: float = 0.5,
+        spool_dir: Optional[str] = None,
+    ):
+        """
+        :param connect: libpq DSN, or a callable returning a DB-API connection
+        :param table: (optional) Target table
+        :param mode: (optional) 'copy' appends every result, 'upsert' keeps the
+            latest row per ``key``
+        :param columns: (optional) Target columns, in the order ``row`` returns them
+        :param row: (optional) Maps a result dict to a row tuple
+        :param key: (optional) Conflict columns of the upsert mode
+        :param batch_size: (optional) Rows that trigger a flush
+        :param max_latency: (optional) Seconds a row may wait before it is flushed
+        :param max_pending: (optional) Buffered rows at which put() blocks
+        :param page_size: (optional) Rows per INSERT statement in upsert mode
+        :param retries: (optional) Attempts to write a batch before it is spooled
+        :param retry_delay: (optional) First backoff delay in seconds, doubled per retry
+        :param spool_dir: (optional) Directory for batches the database did not take.
+            Without it failed batches stay buffered and are retried
+        """
+        if mode not in (COPY, UPSERT):
+            raise ValueError(f"mode must be '{COPY}' or '{UPSERT}'")
+        if isinstance(connect, str):
+            dsn = connect
+
+            def connect():
+                if psycopg2 is None:
+                    raise ImportError("The PostgreSQL sink requires psycopg2: pip install hikvisionapi[postgres]")
+                return psycopg2.connect(dsn)
+
+        self._connect = connect
+        self.table = table
+        self.mode = mode
+        self.columns = tuple(columns)
+        self.row = row
+        self.key = tuple(key)
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.max_pending = max_pending
+        self.page_size = page_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.spool_dir = spool_dir
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+        self.stats = {'written': 0, 'batches': 0, 'retries': 0, 'spooled': 0, 'replayed': 0, 'rejected': 0}
+        self._transient = _transient_errors()
+        self._connection = None
+        self._buffer: List[Row] = []
+        self._oldest = 0.0
+        self._flush_requested = False
+        self._closing = False
+        self._idle = True
+        self._spool_seq = 0
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='hikvision-sink', daemon=True)
+        self._thread.start()
+
+    # Producer side
+
+    def put(self, result: Dict[str, Any], timeout: Optional[float] = None) -> None:
+        """Buffer one result, blocking while ``max_pending`` rows are waiting
+
+        :raises TimeoutError: when ``timeout`` passes while the buffer is full
+        """
+        row = self.row(result)
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self._buffer) < self.max_pending or self._closing, timeout):
+                raise TimeoutError(f"{len(self._buffer)} rows waiting for the database")
+            if self._closing:
+                raise RuntimeError("The sink is closed")
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+
+    async def aput(self, result: Dict[str, Any]) -> None:
+        """put() for event loops, waits in a thread only when the buffer is full"""
+        if len(self._buffer) < self.max_pending:
+            self.put(result)
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self.put, result)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything buffered so far, returns False on timeout"""
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._buffer and self._idle, timeout)
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush, stop the writer thread and close the connection"""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def __enter__(self) -> "ResultSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    # Writer thread
+
+    def _due(self) -> bool:
+        if not self._buffer:
+            return False
+        return (self._closing or self._flush_requested or len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._oldest >= self.max_latency)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._due() and not (self._closing and not self._buffer):
+                    wait = self.max_latency - (time.monotonic() - self._oldest) if self._buffer else None
+                    self._condition.wait(wait)
+                if not self._buffer:
+                    break
+                batch = self._buffer[:self.batch_size]
+                self._idle = False
+            written = self._write_batch(batch)
+            with self._condition:
+                if written:
+                    del self._buffer[:len(batch)]
+                    self._oldest = time.monotonic()
+                    if not self._buffer:
+                        self._flush_requested = False
+                self._idle = True
+                self._condition.notify_all()
+            if written:
+                self._replay_spool()
+            elif self._closing:
+                # Database down and nowhere to spool: give up on the remaining rows
+                break
+        self._disconnect()
+
+    def _write_batch(self, batch: List[Row]) -> bool:
+        """Write or spool a batch, False when it has to stay buffered"""
+        try:
+            self._write_with_retries(batch)
+            return True
+        except self._transient as e:
+            if self.spool_dir:
+                self._spool(batch)
+                return True
+            print(f"Sink: {len(batch)} rows kept in memory, database unavailable: {e}", file=sys.stderr)
+            time.sleep(self.retry_delay)
+            return False
+        except Exception as e:
+            # The database refused the data itself, retrying will not help
+            self.stats['rejected'] += len(batch)
+            self._spool(batch, 'rejected')
+            print(f"Sink: {len(batch)} rows rejected: {e}", file=sys.stderr)
+            return True
+
+    def _write_with_retries(self, batch: List[Row]) -> None:
+        delay = self.retry_delay
+        for attempt in range(self.retries):
+            try:
+                self._write(batch)
+                return
+            except self._transient:
+                self._disconnect()
+                if attempt == self.retries - 1:
+                    raise
+                self.stats['retries'] += 1
+                time.sleep(delay)
+                delay *= 2
+
+    def _write(self, batch: List[Row]) -> None:
+        if self._connection is None:
+            self._connection = self._connect()
+        connection = self._connection
+        try:
+            cursor = connection.cursor()
+            try:
+                if self.mode == UPSERT:
+                    self._upsert(cursor, batch)
+                elif hasattr(cursor, 'copy_expert'):
+                    cursor.copy_expert(
+                        f"COPY {self.table} ({', '.join(self.columns)}) FROM STDIN", io.StringIO(copy_text(batch))
+                    )
+                else:
+                    self._insert(cursor, batch)
+            finally:
+                cursor.close()
+            connection.commit()
+        except self._transient:
+            raise
+        except Exception:
+            connection.rollback()
+            raise
+        self.stats['written'] += len(batch)
+        self.stats['batches'] += 1
+
+    def _upsert(self, cursor, batch: List[Row]) -> None:
+        # One statement may not update the same row twice, keep the latest
+        positions = [self.columns.index(column) for column in self.key]
+        latest = {tuple(row[p] for p in positions): row for row in batch}
+        updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in self.columns if column not in self.key)
+        self._insert(cursor, list(latest.values()), f" ON CONFLICT ({', '.join(self.key)}) DO UPDATE SET {updates}")
+
+    def _insert(self, cursor, rows: List[Row], suffix: str = '') -> None:
+        """Insert ``rows`` with one multi-row statement per ``page_size`` rows"""
+        placeholders = '(' + ', '.join(['%s'] * len(self.columns)) + ')'
+        for start in range(0, len(rows), self.page_size):
+            page = rows[start:start + self.page_size]
+            cursor.execute(
+                f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES "
+                f"{', '.join([placeholders] * len(page))}{suffix}",
+                [value for row in page for value in row],
+            )
+
+    def _disconnect(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    # Spool
+
+    def _spool(self, batch: List[Row], kind: str = 'batch') -> None:
+        if not self.spool_dir:
+            return
+        self._spool_seq += 1
+        name = f"{kind}-{time.time():.6f}-{os.getpid()}-{self._spool_seq}.ndjson"
+        path = os.path.join(self.spool_dir, name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as fd:
+            for row in batch:
+                fd.write(json.dumps(row) + '\n')
+        os.replace(path + '.tmp', path)
+        if kind == 'batch':
+            self.stats['spooled'] += len(batch)
+
+    def spooled_files(self) -> List[str]:
+        if not self.spool_dir:
+            return []
+        return sorted(glob.glob(os.path.join(self.spool_dir, 'batch-*.ndjson')),
+                      key=lambda path: float(os.path.basename(path).split('-')[1]))
+
+    def _replay_spool(self) -> None:
+        """Write spooled batches back, oldest first, until one fails"""
+        for path in self.spooled_files():
+            with open(path, 'r', encoding='utf-8') as fd:
+                batch = [tuple(json.loads(line)) for line in fd if line.strip()]
+            try:
+                self._write(batch)
+            except self._transient:
+                self._disconnect()
+                return
+            except Exception as e:
+                self.stats['rejected'] += len(batch)
+                os.replace(path, path.replace('batch-', 'rejected-', 1))
+                print(f"Sink: spooled batch {path} rejected: {e}", file=sys.stderr)
+                continue
+            os.unlink(path)
+            self.stats['replayed'] += len(batch)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m hikvisionapi.sink',
+        description='Write NDJSON poll results from stdin to PostgreSQL in batches',
+    )
+    parser.add_argument('--dsn', required=True, help='libpq connection string')
+    parser.add_argument('--table', default='dvr_activity')
+    parser.add_argument('--mode', choices=(COPY, UPSERT), default=COPY)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-latency', type=float, default=1.0)
+    parser.add_argument('--spool-dir', default=None, help='Directory for batches the database did not take')
+    args = parser.parse_args(argv)
+
+    with ResultSink(args.dsn, table=args.table, mode=args.mode, batch_size=args.batch_size,
+                    max_latency=args.max_latency, spool_dir=args.spool_dir) as sink:
+        for line in sys.stdin:
+            if line.strip():
+                sink.put(json.loads(line))
+    print(', '.join(f"{name}: {count}" for name, count in sink.stats.items()), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
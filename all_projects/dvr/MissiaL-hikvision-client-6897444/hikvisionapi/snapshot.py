@@ -0,0 +1,459 @@
+# coding=utf-8
+"""
+Health snapshot of a device
+
+Collects status, time, channels, HDDs and the recording range in one call.
+``AsyncClient.health_snapshot`` runs the requests concurrently on the
+client's pool, ``Client.health_snapshot`` runs them back to back on its
+keep-alive session. Every field carries its own timing and error, so one
+failing endpoint does not discard the others.
+
+Each field is written once as a generator that yields request specs and
+receives the response text, and is driven by either client. A failed
+request is thrown into the generator, so a field can fall back when an
+endpoint is not supported.
+"""
+
+import asyncio
+import functools
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Generator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .channels import (
+    INPUTS_PATH, PROXY_STATUS_PATH, ChannelStatus, merge_channels, parse_inputs, parse_proxy_status, unsupported,
+)
+from .metrics import endpoint
+from .parsers import extract, parse_xml
+
+FIELDS = ('status', 'time', 'channels', 'storage', 'recording')
+
+# Error of a field that was not requested
+SKIPPED = 'skipped'
+
+# Searches for the newest recording look back this far, widening step by step
+RECORDING_LOOKBACK = (timedelta(hours=2), timedelta(days=1), timedelta(days=7), timedelta(days=31))
+SEARCH_PAGE_SIZE = 50
+
+_SEARCH_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<CMSearchDescription>'
+    '<searchID>{search_id}</searchID>'
+    '<trackList><trackID>{track}</trackID></trackList>'
+    '<timeSpanList><timeSpan><startTime>{start}</startTime><endTime>{end}</endTime></timeSpan></timeSpanList>'
+    '<maxResults>{max_results}</maxResults>'
+    '<searchResultPostion>{position}</searchResultPostion>'
+    '<metadataList><metadataDescriptor>//recordType.meta.std-cgi.com</metadataDescriptor></metadataList>'
+    '</CMSearchDescription>'
+)
+
+
+class RequestSpec(NamedTuple):
+    method: str
+    path: str
+    body: Optional[str] = None
+
+
+Steps = Generator[RequestSpec, str, Any]
+
+
+class FieldResult(NamedTuple):
+    value: Any
+    elapsed: float
+    error: Optional[str] = None
+    # True when the value came from a FieldCache without asking the device
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class HddInfo(NamedTuple):
+    id: str
+    name: Optional[str]
+    type: Optional[str]
+    status: Optional[str]
+    capacity_mb: Optional[int]
+    free_mb: Optional[int]
+
+
+def _now() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def empty_result(status: str = 'ONLINE', error: Optional[str] = None) -> Dict[str, Any]:
+    """Build a result dict in the ``get_hikvision_data`` shape with placeholder values"""
+    result = {
+        'status': status,
+        'deviceInfo': {
+            'dvrTime': '',
+            'loginTime': _now(),
+            'currentDateTime': _now()
+        },
+        'cameraInfo': {
+            'totalCameras': 0,
+            'cameraStatus': []
+        },
+        'storageInfo': {
+            'storageType': 'N/A',
+            'storageStatus': 'N/A',
+            'storageCapacity': 'N/A',
+            'storageFree': 'N/A'
+        },
+        'recordingInfo': {
+            'recordingFrom': '',
+            'recordingTo': ''
+        }
+    }
+    if error is not None:
+        result['error'] = error
+    return result
+
+
+def _int(value: str) -> int:
+    return int(float(value))
+
+
+def _gigabytes(megabytes: int) -> str:
+    return f"{round(megabytes / 1024, 2)} GB"
+
+
+def status_steps() -> Steps:
+    text = yield RequestSpec('get', 'System/status')
+    if '<status>' not in text and 'DeviceStatus' not in text:
+        raise ValueError("Invalid status response")
+    return parse_xml(text)
+
+
+def time_steps() -> Steps:
+    text = yield RequestSpec('get', 'System/time')
+    return extract(text, 'localTime')['localTime'] or ''
+
+
+def channels_steps() -> Steps:
+    """Local inputs and, on NVRs, IP channels as channels.ChannelStatus records"""
+    try:
+        text = yield RequestSpec('get', INPUTS_PATH)
+        channels = parse_inputs(text)
+    except Exception as e:
+        # Pure NVRs may have no local inputs at all
+        if not unsupported(e):
+            raise
+        channels = []
+    try:
+        text = yield RequestSpec('get', PROXY_STATUS_PATH)
+    except Exception as e:
+        if not unsupported(e):
+            raise
+        return channels
+    return merge_channels(channels, parse_proxy_status(text))
+
+
+def parse_storage(text: str) -> List[HddInfo]:
+    records = extract(
+        text, 'hdd/id/hddName/hddType/status/capacity/freeSpace',
+        converters={'capacity': _int, 'freeSpace': _int},
+    )
+    return [
+        HddInfo(r['id'], r['hddName'], r['hddType'], r['status'], r['capacity'], r['freeSpace'])
+        for r in records['hdd/id/hddName/hddType/status/capacity/freeSpace']
+    ]
+
+
+def storage_steps() -> Steps:
+    text = yield RequestSpec('get', 'ContentMgmt/Storage')
+    return parse_storage(text)
+
+
+def _search_spec(track: int, start: str, end: str, position: int, max_results: int) -> RequestSpec:
+    body = _SEARCH_TEMPLATE.format(
+        search_id=f"{track}-{time.monotonic_ns()}",
+        track=track,
+        start=start,
+        end=end,
+        max_results=max_results,
+        position=position,
+    )
+    return RequestSpec('post', 'ContentMgmt/search', body)
+
+
+def _matches(text: str) -> Tuple[List[Dict[str, Any]], bool]:
+    found = extract(text, 'responseStatusStrg', 'timeSpan/startTime/endTime')
+    return found['timeSpan/startTime/endTime'], (found['responseStatusStrg'] or '').upper() == 'MORE'
+
+
+def recording_start_steps(track: int = 101) -> Steps:
+    """Oldest recording of a track: the first match of an unbounded search"""
+    text = yield _search_spec(track, '1970-01-01T00:00:00Z', '2037-12-31T23:59:59Z', 0, 1)
+    spans, _ = _matches(text)
+    return spans[0]['startTime'] if spans else ''
+
+
+def recording_end_steps(track: int = 101, now: Optional[datetime] = None, since: Optional[str] = None) -> Steps:
+    """Newest recording of a track
+
+    Matches come back oldest first, so short windows ending in the future
+    are searched and paged through, widening until something is found.
+
+    :param now: (optional) Search reference time, naive values are taken as UTC
+    :param since: (optional) A previously seen newest recording, searched
+        from first as recording only moves forward
+    """
+    # Search times carry the Z suffix, so the windows are computed in UTC
+    now = now or datetime.now(timezone.utc)
+    if now.tzinfo is not None:
+        now = now.astimezone(timezone.utc)
+    starts = [(now - lookback).strftime('%Y-%m-%dT%H:%M:%SZ') for lookback in RECORDING_LOOKBACK]
+    if since:
+        starts.insert(0, since)
+    for start in starts:
+        position = 0
+        latest = ''
+        while True:
+            text = yield _search_spec(track, start, '2037-12-31T23:59:59Z', position, SEARCH_PAGE_SIZE)
+            spans, more = _matches(text)
+            if spans:
+                latest = spans[-1]['endTime'] or latest
+            position += len(spans)
+            if not more or not spans:
+                break
+        if latest:
+            return latest
+    return ''
+
+
+def cached_steps(cache, host: str, name: str, steps: Callable[[], Steps]) -> Steps:
+    """Serve ``name`` from a FieldCache, running ``steps`` only when it expired"""
+    if cache is None or not cache.caches(name):
+        return (yield from steps())
+    value = cache.get(host, name)
+    if value is None:
+        value = yield from steps()
+        cache.set(host, name, value)
+    return value
+
+
+def recording_steps(track: int = 101, cache=None, host: Optional[str] = None) -> Steps:
+    """Oldest and newest recording, each half cached with its own TTL"""
+    first = yield from cached_steps(cache, host, 'recording_start', lambda: recording_start_steps(track))
+    if not first:
+        return ('', '')
+    since = cache.stale(host, 'recording_end') if cache is not None else None
+    last = yield from cached_steps(cache, host, 'recording_end', lambda: recording_end_steps(track, since=since))
+    return (first, last)
+
+
+STEPS: Dict[str, Callable[[], Steps]] = {
+    'status': status_steps,
+    'time': time_steps,
+    'channels': channels_steps,
+    'storage': storage_steps,
+    'recording': recording_steps,
+}
+
+
+class HealthSnapshot(NamedTuple):
+    host: str
+    status: FieldResult
+    time: FieldResult
+    channels: FieldResult
+    storage: FieldResult
+    recording: FieldResult
+    elapsed: float
+
+    @property
+    def online(self) -> bool:
+        return self.status.ok
+
+    def errors(self) -> Dict[str, str]:
+        return {name: getattr(self, name).error for name in FIELDS if getattr(self, name).error}
+
+    def timings(self) -> Dict[str, float]:
+        return {name: getattr(self, name).elapsed for name in FIELDS}
+
+    def as_legacy_dict(self) -> Dict[str, Any]:
+        """Convert to the ``get_hikvision_data`` result shape
+
+        Without a status check the device counts as online unless every
+        requested field failed.
+        """
+        if self.status.error == SKIPPED:
+            requested = [getattr(self, name) for name in FIELDS[1:] if getattr(self, name).error != SKIPPED]
+            if requested and not any(field.ok for field in requested):
+                return empty_result('ERROR', requested[0].error)
+        elif not self.status.ok:
+            return empty_result('ERROR', self.status.error)
+
+        result = empty_result()
+        if self.time.ok and self.time.value is not None:
+            result['deviceInfo']['dvrTime'] = self.time.value
+
+        if self.channels.ok and self.channels.value is not None:
+            result['cameraInfo']['totalCameras'] = len(self.channels.value)
+            result['cameraInfo']['cameraStatus'] = [
+                {'number': channel.id, 'status': 'Working' if channel.working else 'Not Working'}
+                for channel in self.channels.value
+            ]
+
+        if self.storage.ok and self.storage.value:
+            hdds = self.storage.value
+            result['storageInfo'] = {
+                'storageType': hdds[0].type or '',
+                'storageStatus': 'Working' if all((h.status or '').lower() == 'ok' for h in hdds) else 'Not Working',
+                'storageCapacity': _gigabytes(sum(h.capacity_mb or 0 for h in hdds)),
+                'storageFree': _gigabytes(sum(h.free_mb or 0 for h in hdds)),
+            }
+        elif self.storage.ok:
+            result['storageInfo']['storageStatus'] = 'Not Working'
+
+        if self.recording.ok and self.recording.value is not None:
+            result['recordingInfo'] = {
+                'recordingFrom': self.recording.value[0],
+                'recordingTo': self.recording.value[1],
+            }
+        return result
+
+
+def _error(exc: BaseException) -> str:
+    return str(exc) or type(exc).__name__
+
+
+def _result(host: str, fields: Dict[str, FieldResult], started: float) -> HealthSnapshot:
+    skipped = FieldResult(None, 0.0, SKIPPED)
+    return HealthSnapshot(
+        host=host,
+        elapsed=time.perf_counter() - started,
+        **{name: fields.get(name, skipped) for name in FIELDS}
+    )
+
+
+def _steps(name: str, host: str, cache) -> Steps:
+    if name == 'recording':
+        return recording_steps(cache=cache, host=host)
+    return cached_steps(cache, host, name, STEPS[name])
+
+
+def _send_timed(client, spec: RequestSpec, steps: Steps, text: str) -> Optional[RequestSpec]:
+    """steps.send reporting the parse time to the client's instruments"""
+    started = time.perf_counter()
+    try:
+        return steps.send(text)
+    finally:
+        client.instruments.parse(client.host, endpoint(spec.path, client.isapi_prefix), len(text),
+                                 time.perf_counter() - started)
+
+
+def _sender(client, spec: RequestSpec, steps: Steps, text: str) -> Callable[[], Optional[RequestSpec]]:
+    if getattr(client, 'instruments', None) is None:
+        return functools.partial(steps.send, text)
+    return functools.partial(_send_timed, client, spec, steps, text)
+
+
+def _drive(client, steps: Steps) -> Tuple[Any, int]:
+    """Run steps with a sync Client, returns the value and the number of requests"""
+    requests = 0
+    try:
+        spec = next(steps)
+    except StopIteration as stop:
+        return stop.value, requests
+    while True:
+        requests += 1
+        try:
+            text = client.call(spec.path, spec.method, 'text', data=spec.body)
+        except Exception as e:
+            # Thrown into the steps, which may fall back or re-raise
+            advance = functools.partial(steps.throw, e)
+        else:
+            advance = _sender(client, spec, steps, text)
+        try:
+            spec = advance()
+        except StopIteration as stop:
+            return stop.value, requests
+
+
+async def _adrive(client, steps: Steps) -> Tuple[Any, int]:
+    requests = 0
+    try:
+        spec = next(steps)
+    except StopIteration as stop:
+        return stop.value, requests
+    while True:
+        requests += 1
+        kwargs = {'content': spec.body} if spec.body is not None else {}
+        try:
+            text = await client.call(spec.path, spec.method, 'text', **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            advance = functools.partial(steps.throw, e)
+        else:
+            advance = _sender(client, spec, steps, text)
+        try:
+            spec = advance()
+        except StopIteration as stop:
+            return stop.value, requests
+
+
+def channel_status(client) -> List[ChannelStatus]:
+    """Typed status of every channel with a sync Client"""
+    return _drive(client, channels_steps())[0]
+
+
+async def async_channel_status(client) -> List[ChannelStatus]:
+    """Typed status of every channel with an AsyncClient"""
+    return (await _adrive(client, channels_steps()))[0]
+
+
+def _check_fields(fields: Sequence[str]) -> None:
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown snapshot fields: {', '.join(sorted(unknown))}")
+
+
+def health_snapshot(client, fields: Sequence[str] = FIELDS, cache=None) -> HealthSnapshot:
+    """Collect a snapshot with a sync Client, one request after another
+
+    :param cache: (optional) fieldcache.FieldCache serving slow-changing fields
+    """
+    _check_fields(fields)
+    started = time.perf_counter()
+    results = {}
+    for name in fields:
+        field_started = time.perf_counter()
+        try:
+            value, requests = _drive(client, _steps(name, client.host, cache))
+            results[name] = FieldResult(value, time.perf_counter() - field_started, cached=not requests)
+        except Exception as e:
+            results[name] = FieldResult(None, time.perf_counter() - field_started, _error(e))
+    return _result(client.host, results, started)
+
+
+async def async_health_snapshot(client, fields: Sequence[str] = FIELDS, cache=None) -> HealthSnapshot:
+    """Collect a snapshot with an AsyncClient, every field concurrently
+
+    :param cache: (optional) fieldcache.FieldCache serving slow-changing fields
+    """
+    _check_fields(fields)
+    started = time.perf_counter()
+
+    async def collect(name: str) -> FieldResult:
+        field_started = time.perf_counter()
+        try:
+            value, requests = await _adrive(client, _steps(name, client.host, cache))
+            return FieldResult(value, time.perf_counter() - field_started, cached=not requests)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return FieldResult(None, time.perf_counter() - field_started, _error(e))
+
+    # Probe auth once up front so the concurrent requests do not all race to do it
+    if not client._auth_method:
+        try:
+            await client._detect_auth_method()
+        except Exception as e:
+            failed = FieldResult(None, time.perf_counter() - started, _error(e))
+            return _result(client.host, {name: failed for name in fields}, started)
+
+    values = await asyncio.gather(*(collect(name) for name in fields))
+    return _result(client.host, dict(zip(fields, values)), started)
@@ -0,0 +1,291 @@
+# coding=utf-8
+"""
+Compact fleet state with change detection
+
+A sweep of the fleet produces one big nested result dict per DVR, most of
+which is the same as in the previous sweep. ``FleetState`` keeps the last
+known state of every device in a ``__slots__`` record with the camera states
+packed into a ``bytearray``, keyed by a small integer id, and turns every new
+poll result into the list of things that actually changed: a device going
+offline, a camera losing video, the clock drifting past a threshold, an HDD
+error. Writers and dashboards can then work with deltas instead of full
+snapshots of every camera.
+
+Basic Usage::
+
+    state = FleetState(drift_threshold=120)
+    async for result in poll_fleet(devices):
+        for change in state.apply(result):
+            print(change.key, change.kind, change.channel, change.old, change.new)
+"""
+
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .authcache import host_key
+from .snapshot import HealthSnapshot
+
+# Change kinds
+STATUS = 'status'
+CAMERA = 'camera'
+DRIFT = 'drift'
+STORAGE = 'storage'
+
+# Camera states packed into DeviceState.cameras, one byte per channel
+UNKNOWN = 0
+WORKING = 1
+NOT_WORKING = 2
+CAMERA_STATES = {UNKNOWN: None, WORKING: 'Working', NOT_WORKING: 'Not Working'}
+
+
+class Change(NamedTuple):
+    device: int
+    key: str
+    kind: str
+    channel: Optional[int]
+    old: Any
+    new: Any
+    at: float
+
+
+class DeviceState:
+    """Last known state of one DVR"""
+
+    __slots__ = ('id', 'key', 'status', 'error', 'drift', 'drifted', 'storage', 'recording_to',
+                 'channels', 'cameras', 'updated')
+
+    def __init__(self, device_id: int, key: str):
+        self.id = device_id
+        self.key = key
+        self.status = None
+        self.error = None
+        self.drift = None
+        self.drifted = False
+        self.storage = None
+        self.recording_to = None
+        # Channel numbers in device order and one camera state byte per channel
+        self.channels: Tuple[int, ...] = ()
+        self.cameras = bytearray()
+        self.updated = 0.0
+
+    @property
+    def online(self) -> bool:
+        return self.status == 'ONLINE'
+
+    def camera(self, channel: int) -> Optional[str]:
+        """'Working', 'Not Working' or None for an unknown channel"""
+        try:
+            return CAMERA_STATES[self.cameras[self.channels.index(channel)]]
+        except ValueError:
+            return None
+
+    def down_cameras(self) -> List[int]:
+        return [channel for channel, state in zip(self.channels, self.cameras) if state == NOT_WORKING]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'key': self.key,
+            'status': self.status,
+            'error': self.error,
+            'drift': self.drift,
+            'storage': self.storage,
+            'recordingTo': self.recording_to,
+            'cameras': {channel: CAMERA_STATES[state] for channel, state in zip(self.channels, self.cameras)},
+            'updated': self.updated,
+        }
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def clock_drift(dvr_time: Optional[str], reference: Optional[str] = None) -> Optional[float]:
+    """Seconds the DVR clock is ahead of ``reference`` (local time, defaults to now)
+
+    ``dvr_time`` is the ISAPI ``localTime``, with or without a UTC offset.
+    """
+    device = _parse_time(dvr_time)
+    if device is None:
+        return None
+    now = _parse_time(reference) or datetime.now()
+    if device.tzinfo is not None:
+        now = now.astimezone() if now.tzinfo is None else now
+    elif now.tzinfo is not None:
+        now = now.replace(tzinfo=None)
+    return round((device - now).total_seconds(), 1)
+
+
+def _camera_byte(status: Optional[str]) -> int:
+    if status == 'Working':
+        return WORKING
+    if status == 'Not Working':
+        return NOT_WORKING
+    return UNKNOWN
+
+
+def _numbered(cameras: Iterable[Tuple[Any, int]]) -> Iterator[Tuple[int, int]]:
+    """Cameras whose channel id is an integer, others such as 'D1' have no slot"""
+    for number, status in cameras:
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            continue
+        yield number, status
+
+
+class FleetState:
+    """
+    Last known state of a fleet of DVRs and the deltas between polls
+
+    The first result of a device is reported as changes from None, so a
+    consumer of the deltas also receives the initial state. Not thread-safe:
+    feed it from one thread or one event loop.
+    """
+
+    def __init__(self, drift_threshold: float = 120):
+        """
+        :param drift_threshold: (optional) Clock drift in seconds past which a
+            ``drift`` change is emitted, and again once the clock is back within it
+        """
+        self.drift_threshold = drift_threshold
+        self._ids: Dict[str, int] = {}
+        self._devices: List[Optional[DeviceState]] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[DeviceState]:
+        return (device for device in self._devices if device is not None)
+
+    def id_for(self, key: str) -> int:
+        """Compact id of a device, assigned on first sight"""
+        key = host_key(key)
+        device_id = self._ids.get(key)
+        if device_id is None:
+            device_id = self._ids[key] = len(self._devices)
+            self._devices.append(DeviceState(device_id, sys.intern(key)))
+        return device_id
+
+    def get(self, key_or_id) -> Optional[DeviceState]:
+        if isinstance(key_or_id, int):
+            return self._devices[key_or_id] if 0 <= key_or_id < len(self._devices) else None
+        device_id = self._ids.get(host_key(key_or_id))
+        return None if device_id is None else self._devices[device_id]
+
+    def forget(self, key: str) -> None:
+        """Drop a decommissioned device, its id is not reused"""
+        device_id = self._ids.pop(host_key(key), None)
+        if device_id is not None:
+            self._devices[device_id] = None
+
+    @property
+    def camera_count(self) -> int:
+        return sum(len(device.cameras) for device in self)
+
+    def apply(self, result: Dict[str, Any], key: Optional[str] = None, at: Optional[float] = None) -> List[Change]:
+        """Apply one ``get_hikvision_data`` shaped result and return what changed
+
+        :param result: Poll result, as yielded by poller.poll_fleet
+        :param key: (optional) Device key, defaults to ``ip:port`` of the result
+        """
+        if key is None:
+            key = f"{result['ip']}:{result['port']}"
+        device_info = result.get('deviceInfo') or {}
+        cameras = (result.get('cameraInfo') or {}).get('cameraStatus') or []
+        return self._apply(
+            self._devices[self.id_for(key)],
+            status=result.get('status'),
+            error=result.get('error'),
+            drift=clock_drift(device_info.get('dvrTime'), device_info.get('currentDateTime')),
+            storage=(result.get('storageInfo') or {}).get('storageStatus'),
+            recording_to=(result.get('recordingInfo') or {}).get('recordingTo') or None,
+            cameras=_numbered((camera.get('number'), _camera_byte(camera.get('status'))) for camera in cameras),
+            at=time.time() if at is None else at,
+        )
+
+    def apply_snapshot(self, snapshot: HealthSnapshot, at: Optional[float] = None) -> List[Change]:
+        """Apply a HealthSnapshot without building the legacy result dict"""
+        online = snapshot.status.ok
+        storage = None
+        if online and snapshot.storage.ok:
+            hdds = snapshot.storage.value or ()
+            storage = 'Working' if hdds and all((h.status or '').lower() == 'ok' for h in hdds) else 'Not Working'
+        channels = snapshot.channels.value if online and snapshot.channels.ok else None
+        recording = snapshot.recording.value if online and snapshot.recording.ok else None
+        return self._apply(
+            self._devices[self.id_for(snapshot.host)],
+            status='ONLINE' if online else 'ERROR',
+            error=None if online else snapshot.status.error,
+            drift=clock_drift(snapshot.time.value) if online and snapshot.time.ok else None,
+            storage=storage,
+            recording_to=recording[1] if recording else None,
+            cameras=_numbered((c.id, WORKING if c.working else NOT_WORKING) for c in channels) if channels else (),
+            at=time.time() if at is None else at,
+        )
+
+    def _apply(self, device: DeviceState, status: Optional[str], error: Optional[str], drift: Optional[float],
+               storage: Optional[str], recording_to: Optional[str], cameras: Iterable[Tuple[int, int]],
+               at: float) -> List[Change]:
+        changes = []
+
+        def changed(kind, old, new, channel=None):
+            changes.append(Change(device.id, device.key, kind, channel, old, new, at))
+
+        if status != device.status:
+            changed(STATUS, device.status, status)
+            device.status = status
+        device.error = error
+        device.updated = at
+        if status != 'ONLINE':
+            # Keep the last known cameras and HDDs, the status change says it all
+            return changes
+
+        if drift is not None:
+            drifted = abs(drift) > self.drift_threshold
+            if drifted != device.drifted:
+                changed(DRIFT, device.drift, drift)
+                device.drifted = drifted
+            device.drift = drift
+
+        if storage is not None and storage != 'N/A':
+            if storage != device.storage:
+                changed(STORAGE, device.storage, storage)
+            device.storage = storage
+        if recording_to is not None:
+            device.recording_to = recording_to
+
+        self._apply_cameras(device, cameras, changed)
+        return changes
+
+    @staticmethod
+    def _apply_cameras(device: DeviceState, cameras: Iterable[Tuple[int, int]], changed) -> None:
+        cameras = list(cameras)
+        if not cameras:
+            return
+        channels = tuple(channel for channel, _ in cameras)
+        states = bytearray(state for _, state in cameras)
+        if channels == device.channels:
+            old_states = device.cameras
+            if states == old_states:
+                return
+            for index, (old, new) in enumerate(zip(old_states, states)):
+                if old != new:
+                    changed(CAMERA, CAMERA_STATES[old], CAMERA_STATES[new], channels[index])
+        else:
+            old = dict(zip(device.channels, device.cameras))
+            for channel, state in cameras:
+                previous = old.pop(channel, UNKNOWN)
+                if previous != state:
+                    changed(CAMERA, CAMERA_STATES[previous], CAMERA_STATES[state], channel)
+            for channel, state in old.items():
+                changed(CAMERA, CAMERA_STATES[state], None, channel)
+            device.channels = channels
+        device.cameras = states
@@ -18,5 +18,6 @@ setup(name='hikvisionapi',
       download_url='https://github.com/MissiaL/hikvision-client/tarball/{}'.format(version),
       keywords=['api', 'hikvision', 'hikvision-client'],
       install_requires=['xmltodict', 'requests', 'httpx'],
+      extras_require={'lxml': ['lxml'], 'thumbnails': ['Pillow'], 'postgres': ['psycopg2-binary']},
       python_requires='>3.5',
       )
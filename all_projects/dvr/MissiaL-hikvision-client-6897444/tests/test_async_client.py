@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+
+import hikvisionapi
+
+DEVICE_INFO = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<DeviceInfo version="1.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">'
+    '<deviceName>HIKVISION</deviceName><firmwareVersion>V4.0.1</firmwareVersion>'
+    '</DeviceInfo>'
+)
+
+
+def make_transport(calls):
+    def handler(request):
+        calls.append(request)
+        if request.headers.get('Authorization', '').startswith('Basic'):
+            return httpx.Response(200, text=DEVICE_INFO)
+        return httpx.Response(401)
+    return httpx.MockTransport(handler)
+
+
+def test_requests_share_one_http_client():
+    calls = []
+
+    async def run():
+        http_client = httpx.AsyncClient(transport=make_transport(calls))
+        async with hikvisionapi.AsyncClient('http://10.0.0.1', 'admin', 'admin', http_client=http_client) as cam:
+            first = await cam.System.deviceInfo(method='get')
+            second = await cam.System.deviceInfo(method='get')
+            assert cam.http_client is http_client
+        assert not http_client.is_closed
+        await http_client.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first['DeviceInfo']['firmwareVersion'] == 'V4.0.1'
+    assert first == second
+
+
+def test_owned_http_client_is_closed():
+    async def run():
+        cam = hikvisionapi.AsyncClient(
+            'http://10.0.0.1', 'admin', 'admin',
+            limits=httpx.Limits(max_connections=2),
+        )
+        http_client = cam.http_client
+        assert cam.http_client is http_client
+        await cam.aclose()
+        return http_client
+
+    assert asyncio.run(run()).is_closed
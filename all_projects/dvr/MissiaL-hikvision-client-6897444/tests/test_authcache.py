@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+
+import hikvisionapi
+from hikvisionapi.authcache import AuthCache, host_key
+
+STATUS = '<DeviceStatus><status>ok</status></DeviceStatus>'
+
+
+def test_host_key_normalises_default_ports():
+    assert host_key('http://10.0.0.1') == '10.0.0.1:80'
+    assert host_key('https://10.0.0.1/ISAPI') == '10.0.0.1:443'
+    assert host_key('http://10.0.0.1:8080') == '10.0.0.1:8080'
+
+
+def test_entries_expire_and_are_bound_to_login(monkeypatch):
+    cache = AuthCache(ttl=10)
+    cache.set('http://10.0.0.1', 'admin', 'digest')
+    assert cache.get('http://10.0.0.1:80', 'admin') == 'digest'
+    assert cache.get('http://10.0.0.1', 'operator') is None
+    cache.set('http://10.0.0.1', 'admin', 'digest')
+    now = hikvisionapi.authcache.time.time()
+    monkeypatch.setattr(hikvisionapi.authcache.time, 'time', lambda: now + 11)
+    assert cache.get('http://10.0.0.1', 'admin') is None
+
+
+def test_persisted_cache_starts_warm(tmp_path):
+    path = str(tmp_path / 'auth.json')
+    cache = AuthCache(path=path)
+    cache.set('http://10.0.0.1', 'admin', 'basic')
+    cache.flush()
+    assert AuthCache(path=path).get('http://10.0.0.1', 'admin') == 'basic'
+
+
+def test_auth_object_is_shared_for_nonce_reuse():
+    cache = AuthCache()
+    cache.set('http://10.0.0.1', 'admin', 'digest')
+    first = cache.auth_for('http://10.0.0.1', 'admin', 'pw', 'digest', flavour='httpx')
+    second = cache.auth_for('http://10.0.0.1', 'admin', 'pw', 'digest', flavour='httpx')
+    assert first is second
+    assert cache.auth_for('http://10.0.0.1', 'admin', 'other', 'digest', flavour='httpx') is not first
+
+
+def test_async_client_skips_probe_and_invalidates_on_401():
+    calls = []
+    accept = {'scheme': 'Basic'}
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.headers.get('Authorization', '').startswith(accept['scheme']):
+            return httpx.Response(200, text=STATUS)
+        return httpx.Response(401, headers={'WWW-Authenticate': 'Basic realm="x"'})
+
+    async def run():
+        cache = AuthCache()
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as pool:
+            first = hikvisionapi.AsyncClient('http://10.0.0.1', 'admin', 'pw', http_client=pool, auth_cache=cache)
+            await first.System.deviceInfo(method='get')
+            assert calls == ['/ISAPI/System/status', '/ISAPI/System/deviceInfo']
+            assert cache.get('http://10.0.0.1', 'admin') == 'basic'
+
+            calls.clear()
+            second = hikvisionapi.AsyncClient('http://10.0.0.1', 'admin', 'pw', http_client=pool, auth_cache=cache)
+            await second.System.deviceInfo(method='get')
+            assert calls == ['/ISAPI/System/deviceInfo']
+
+            calls.clear()
+            accept['scheme'] = 'Nothing'
+            try:
+                await second.System.deviceInfo(method='get')
+            except httpx.HTTPStatusError:
+                pass
+            assert cache.get('http://10.0.0.1', 'admin') is None
+
+    asyncio.run(run())
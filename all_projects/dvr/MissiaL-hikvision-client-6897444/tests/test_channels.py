@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+import hikvisionapi
+from hikvisionapi.authcache import AuthCache
+from hikvisionapi.channels import (
+    ANALOG, DISABLED, IP, OFFLINE, ONLINE, VIDEO_LOSS, ChannelStatus, merge_channels, parse_inputs,
+    parse_proxy_status,
+)
+from hikvisionapi.fakedvr import FakeDVR
+from hikvisionapi.sink import result_row
+from hikvisionapi.state import FleetState
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'isapi')
+
+
+def test_parse_inputs_reads_direct_children_only():
+    with open(os.path.join(FIXTURES, 'channels.xml'), 'rb') as fd:
+        channels = parse_inputs(fd.read())
+    assert [c.id for c in channels[:3]] == ['1', '2', '3']
+    assert channels[0].name == 'Camera 01'
+    assert channels[0].state == ONLINE and channels[0].kind == ANALOG
+
+    # A nested <enabled> used to be paired with the wrong <id> by a regex
+    xml = (
+        '<VideoInputChannelList>'
+        '<VideoInputChannel><id>1</id><Extension><enabled>false</enabled></Extension>'
+        '<videoInputEnabled>true</videoInputEnabled><resDesc>NO VIDEO</resDesc></VideoInputChannel>'
+        '<VideoInputChannel><id>2</id><enabled>false</enabled></VideoInputChannel>'
+        '</VideoInputChannelList>'
+    )
+    assert [(c.id, c.state) for c in parse_inputs(xml)] == [('1', VIDEO_LOSS), ('2', DISABLED)]
+
+
+def test_nvr_ip_channels():
+    with FakeDVR(channels=2, no_video=(2,), ip_channels=3, offline=(2,)).run_in_thread() as dvr:
+        client = hikvisionapi.Client(dvr.url, 'admin', 'admin', auth_cache=AuthCache())
+        channels = client.channel_status()
+
+    assert [(c.kind, c.id, c.state) for c in channels] == [
+        (ANALOG, '1', ONLINE), (ANALOG, '2', VIDEO_LOSS),
+        (IP, '3', ONLINE), (IP, '4', OFFLINE), (IP, '5', ONLINE),
+    ]
+    assert channels[3].address == '192.168.254.2'
+    assert channels[3].detail == 'NETWORK_UNREACHABLE'
+
+    # A record without a source descriptor must not shift the later addresses
+    xml = (
+        '<InputProxyChannelStatusList>'
+        '<InputProxyChannelStatus><id>1</id><online>false</online></InputProxyChannelStatus>'
+        '<InputProxyChannelStatus><id>2</id><sourceInputPortDescriptor><ipAddress>192.168.254.2</ipAddress>'
+        '</sourceInputPortDescriptor><online>true</online></InputProxyChannelStatus>'
+        '</InputProxyChannelStatusList>'
+    )
+    assert [(c.id, c.address) for c in parse_proxy_status(xml)] == [('1', None), ('2', '192.168.254.2')]
+
+
+def test_dvr_without_ip_channels_in_snapshot():
+    async def run():
+        async with FakeDVR(channels=4, no_video=(4,)) as dvr:
+            async with hikvisionapi.AsyncClient(dvr.url, 'admin', 'admin', auth_cache=AuthCache()) as cam:
+                return await cam.health_snapshot(fields=('status', 'channels'))
+
+    snapshot = asyncio.run(run())
+    assert snapshot.channels.ok
+    assert [c.state for c in snapshot.channels.value] == [ONLINE, ONLINE, ONLINE, VIDEO_LOSS]
+    assert snapshot.as_legacy_dict()['cameraInfo']['cameraStatus'][3] == {'number': '4', 'status': 'Not Working'}
+
+
+def test_hybrid_recorder_channels_get_distinct_numbers():
+    with FakeDVR(channels=4, no_video=(2,), ip_channels=2, offline=(1,)).run_in_thread() as dvr:
+        client = hikvisionapi.Client(dvr.url, 'admin', 'admin', auth_cache=AuthCache())
+        snapshot = client.health_snapshot(fields=('status', 'channels'))
+
+    result = snapshot.as_legacy_dict()
+    result.update(ip='127.0.0.1', port=dvr.port)
+    numbers = [camera['number'] for camera in result['cameraInfo']['cameraStatus']]
+    assert numbers == ['1', '2', '3', '4', '5', '6']
+    row = result_row(result)
+    assert row[-8:] == ('Working', 'Not Working', 'Working', 'Working', 'Not Working', 'Working', 'N/A', 'N/A')
+    state = FleetState()
+    state.apply(result)
+    assert state.get(f"127.0.0.1:{dvr.port}").channels == (1, 2, 3, 4, 5, 6)
+
+    # Firmwares that restart IP numbering at 1 are moved past the analog inputs
+    analog = [ChannelStatus('1', None, ANALOG, ONLINE), ChannelStatus('2', None, ANALOG, ONLINE)]
+    ip = [ChannelStatus('1', None, IP, OFFLINE), ChannelStatus('2', None, IP, ONLINE)]
+    assert [c.id for c in merge_channels(analog, ip)] == ['1', '2', '3', '4']
+    assert [c.id for c in merge_channels(analog, [ChannelStatus('33', None, IP, ONLINE)])] == ['1', '2', '33']
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from hikvisionapi.authcache import AuthCache
+from hikvisionapi.daemon import INVALID_PARAMS, METHOD_NOT_FOUND, SERVER_ERROR, Daemon, DaemonClient, DaemonError
+from hikvisionapi.fakedvr import FakeDVR
+from hikvisionapi.snapshot import FIELDS
+
+
+def test_daemon_answers_over_unix_socket_with_warm_clients(monkeypatch):
+    monkeypatch.setattr('hikvisionapi.hikvisionapi.default_auth_cache', AuthCache())
+
+    def calls(path, device):
+        with DaemonClient(path) as client:
+            first = client.poll(device)
+            second = client.call('snapshot', device=device, fields=['status', 'storage'])
+            changes = client.call('changes', device=device)
+            stats = client.call('stats')
+            try:
+                client.call('reboot')
+            except DaemonError as e:
+                error = e.code
+            client.call('shutdown')
+        return first, second, changes, stats, error
+
+    async def run():
+        async with FakeDVR(no_video=(3,)) as dvr:
+            device = {'ip': dvr.host, 'port': dvr.port, 'username': 'admin', 'password': 'pw'}
+            path = os.path.join(tempfile.mkdtemp(), 'daemon.sock')
+            daemon = Daemon(idle_ttl=60)
+            server = asyncio.ensure_future(daemon.serve_unix(path))
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            result = await asyncio.get_running_loop().run_in_executor(None, calls, path, device)
+            await server
+            return result + (dvr.connections,)
+
+    first, second, changes, stats, error, connections = asyncio.run(run())
+    assert first['status'] == 'ONLINE'
+    assert first['cameraInfo']['cameraStatus'][2] == {'number': '3', 'status': 'Not Working'}
+    assert first['storageInfo']['storageStatus'] == 'Working'
+    assert second['fields']['storage']['value'][0]['type'] == 'SATA'
+    assert second['fields']['time']['error'] == 'skipped'
+    # Nothing changed since the first poll
+    assert changes == []
+    assert stats['devices'] == 1
+    assert stats['cameras'] == 16
+    assert error == METHOD_NOT_FOUND
+    # The second call reused the keep-alive connections opened by the first
+    assert connections <= len(FIELDS)
+
+
+def test_daemon_rejects_incomplete_devices():
+    async def run():
+        daemon = Daemon()
+        response = await daemon.handle({'jsonrpc': '2.0', 'id': 7, 'method': 'poll', 'params': {'device': {'ip': 'x'}}})
+        notification = await daemon.handle({'jsonrpc': '2.0', 'method': 'ping'})
+        extra = await daemon.handle({'jsonrpc': '2.0', 'id': 8, 'method': 'ping', 'params': [1]})
+        failed_notification = await daemon.handle({'jsonrpc': '2.0', 'method': 'ping', 'params': [1]})
+        device = {'ip': '10.0.0.1', 'port': 80, 'username': 'admin', 'password': 'pw'}
+        forgotten = await daemon.forget(device)
+        assert not daemon._devices
+        daemon._client(device)
+        forgotten = forgotten, await daemon.forget(device), daemon._devices
+
+        async def broken():
+            raise TypeError('bug in the method')
+
+        daemon.methods['ping'] = broken
+        failed = await daemon.handle({'jsonrpc': '2.0', 'id': 9, 'method': 'ping'})
+        await daemon.aclose()
+        return response, notification, extra, failed, failed_notification, forgotten
+
+    response, notification, extra, failed, failed_notification, forgotten = asyncio.run(run())
+    assert response['id'] == 7
+    assert 'port' in response['error']['message']
+    assert notification is None
+    # Only a signature mismatch is the caller's fault
+    assert extra['error']['code'] == INVALID_PARAMS
+    assert failed['error'] == {'code': SERVER_ERROR, 'message': 'bug in the method'}
+    # Notifications are never answered, not even when they fail
+    assert failed_notification is None
+    # Forgetting an unknown device does not create a client for it
+    assert forgotten == (False, True, {})
+
+
+def test_stdio_daemon_exits_on_shutdown_while_stdin_stays_open():
+    process = subprocess.Popen([sys.executable, '-m', 'hikvisionapi.daemon', '--stdio'],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        process.stdin.write(b'{"jsonrpc": "2.0", "id": 1, "method": "shutdown"}\n')
+        process.stdin.flush()
+        assert json.loads(process.stdout.readline())['result'] is True
+        assert process.wait(timeout=10) == 0
+    finally:
+        process.kill()
+        process.stdin.close()
+        process.stdout.close()
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import io
+import os
+import types
+
+import pytest
+
+import hikvisionapi
+from hikvisionapi.authcache import AuthCache
+from hikvisionapi.download import fetch_snapshots, picture_path, recording_request
+from hikvisionapi.fakedvr import FakeDVR
+
+
+def test_sync_download_resumes_a_partial_file(tmp_path):
+    with FakeDVR(auth='digest', recording_size=300000).run_in_thread() as dvr:
+        client = hikvisionapi.Client(dvr.url, 'admin', 'admin', auth_cache=AuthCache())
+        body = recording_request('rtsp://10.0.0.1/Streaming/tracks/101?starttime=20240101T000000Z')
+        full = io.BytesIO()
+        client.download('ContentMgmt/download', full, data=body)
+        expected = full.getvalue()
+
+        target = tmp_path / 'clip.mp4'
+        (tmp_path / 'clip.mp4.part').write_bytes(expected[:1000])
+        result = client.download('ContentMgmt/download', str(target), data=body)
+
+        (tmp_path / 'again.mp4.part').write_bytes(expected)
+        complete = client.download('ContentMgmt/download', str(tmp_path / 'again.mp4'), data=body)
+
+    assert len(expected) == 300000
+    assert target.read_bytes() == expected
+    assert not (tmp_path / 'clip.mp4.part').exists()
+    assert (result.resumed_from, result.received, result.size) == (1000, 299000, 300000)
+    assert result.checksum == hashlib.sha256(expected).hexdigest()
+    assert complete.received == 0
+    assert complete.checksum == result.checksum
+
+
+def test_async_download_into_a_preallocated_buffer():
+    async def run():
+        async with FakeDVR(picture_size=5000) as dvr:
+            async with hikvisionapi.AsyncClient(dvr.url, 'admin', 'admin', auth_cache=AuthCache()) as cam:
+                buffer = bytearray(8192)
+                result = await cam.download(picture_path(2), buffer, checksum='md5')
+                with pytest.raises(BufferError):
+                    await cam.download(picture_path(2), bytearray(100))
+                return buffer, result
+
+    buffer, result = asyncio.run(run())
+    assert result.size == 5000
+    assert result.content_type == 'image/jpeg'
+    assert buffer[:2] == b'\xff\xd8' and buffer[4998:5000] == b'\xff\xd9'
+    assert result.checksum == hashlib.md5(bytes(buffer[:5000])).hexdigest()
+
+
+def test_fetch_snapshots_across_devices(tmp_path):
+    async def run():
+        async with FakeDVR(channels=4) as first, FakeDVR(channels=4) as second:
+            clients = [hikvisionapi.AsyncClient(dvr.url, 'admin', 'admin', auth_cache=AuthCache())
+                       for dvr in (first, second)]
+            targets = [(client, channel) for client in clients for channel in (1, 2, 3, 4, 9)]
+            in_memory = [r async for r in fetch_snapshots(targets, per_device=2)]
+            on_disk = [r async for r in fetch_snapshots(targets[:2], directory=str(tmp_path))]
+            for client in clients:
+                await client.aclose()
+            return in_memory, on_disk
+
+    in_memory, on_disk = asyncio.run(run())
+    ok = [r for r in in_memory if r.error is None]
+    assert len(ok) == 8
+    # Both fake devices answer on 127.0.0.1, so the pictures only differ per channel
+    assert len({r.data for r in ok}) == 4
+    assert sorted(r.channel for r in in_memory if r.error) == [9, 9]
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(r.result.path) for r in on_disk)
+
+
+def test_stopping_early_waits_for_cancelled_snapshots(monkeypatch):
+    closed = []
+
+    async def fake_download(client, path, dest, checksum=None, resume=False):
+        try:
+            await asyncio.sleep(0 if client.host == 'fast' else 10)
+        finally:
+            await asyncio.sleep(0)  # Closing the response needs the loop
+            closed.append(client.host)
+
+    monkeypatch.setattr('hikvisionapi.download.async_download', fake_download)
+    targets = [(types.SimpleNamespace(host=host), 1) for host in ('fast', 'slow1', 'slow2')]
+
+    async def first():
+        results = fetch_snapshots(targets)
+        async for result in results:
+            await results.aclose()
+            return result, sorted(closed)
+
+    result, closed_by_then = asyncio.run(first())
+    assert result.client.host == 'fast'
+    assert closed_by_then == ['fast', 'slow1', 'slow2']
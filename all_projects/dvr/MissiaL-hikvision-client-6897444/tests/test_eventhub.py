@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+
+from hikvisionapi.eventhub import EventHub
+
+
+def alert(channel, event_type='VMD'):
+    body = (
+        '<EventNotificationAlert version="2.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">'
+        f'<channelID>{channel}</channelID><dateTime>2020-01-01T00:00:00+00:00</dateTime>'
+        f'<eventType>{event_type}</eventType><eventState>active</eventState>'
+        '</EventNotificationAlert>'
+    ).encode()
+    return b'--boundary\r\nContent-Type: application/xml\r\nContent-Length: %d\r\n\r\n%s\r\n' % (len(body), body)
+
+
+def make_transport(failures):
+    def handler(request):
+        host = request.url.host
+        if request.url.path.endswith('System/status'):
+            return httpx.Response(200, text='<DeviceStatus/>')
+        if failures.get(host, 0) > 0:
+            failures[host] -= 1
+            return httpx.Response(503)
+        content = alert(1) + alert(2, 'videoloss') + alert(3)
+        return httpx.Response(200, headers={'Content-Type': 'multipart/mixed; boundary=boundary'}, content=content)
+    return httpx.MockTransport(handler)
+
+
+def test_hub_multiplexes_devices_and_reconnects():
+    failures = {'10.0.0.2': 2}
+
+    async def run():
+        pool = httpx.AsyncClient(transport=make_transport(failures))
+        hub = EventHub(maxsize=4, event_types={'VMD'}, backoff_base=0.001, http_client=pool)
+        first = hub.add_device('http://10.0.0.1', 'admin', 'pw')
+        second = hub.add_device('http://10.0.0.2', 'admin', 'pw')
+        received = {first: [], second: []}
+        async with hub:
+            async for item in hub:
+                assert hub.qsize() <= 4
+                received[item.device].append(item)
+                if all(len(items) >= 4 for items in received.values()):
+                    break
+        await pool.aclose()
+        return hub, first, second, received
+
+    hub, first, second, received = asyncio.run(run())
+    for key in (first, second):
+        assert [item.seq for item in received[key]][:4] == [1, 2, 3, 4]
+        assert {item.event['EventNotificationAlert']['eventType'] for item in received[key]} == {'VMD'}
+        assert received[key][0].latency > 0
+    assert hub.stats[second].reconnects >= 2
+    assert hub.stats[second].last_error
@@ -0,0 +1,43 @@
+import asyncio
+
+import httpx
+import pytest
+
+import hikvisionapi
+from hikvisionapi.authcache import AuthCache
+from hikvisionapi.fakedvr import FakeDVR
+
+
+@pytest.mark.parametrize('auth', [None, 'basic', 'digest'])
+def test_clients_authenticate_against_each_mode(auth):
+    async def run(dvr):
+        cam = hikvisionapi.AsyncClient(dvr.url, 'admin', 'secret', auth_cache=AuthCache())
+        async with cam:
+            return await cam.System.deviceInfo(method='get')
+
+    with FakeDVR(auth=auth, password='secret').run_in_thread() as dvr:
+        client = hikvisionapi.Client(dvr.url, 'admin', 'secret', auth_cache=AuthCache())
+        assert client.System.status(method='get')['DeviceStatus']['status'] == 'ok'
+        assert asyncio.run(run(dvr))['DeviceInfo']['model'] == 'DS-7216HQHI-K1'
+
+        if auth is not None:
+            with pytest.raises(Exception):
+                hikvisionapi.Client(dvr.url, 'admin', 'wrong', auth_cache=AuthCache())
+
+
+def test_virtual_hosts_errors_and_latency():
+    async def run():
+        async with FakeDVR(host='0.0.0.0', error_rate=0.5, latency=0.01, jitter=0.005, seed=1) as dvr:
+            urls = dvr.virtual_hosts(20)
+            async with httpx.AsyncClient() as pool:
+                responses = await asyncio.gather(*(pool.get(url + '/ISAPI/System/deviceInfo') for url in urls))
+            return dvr, responses
+
+    dvr, responses = asyncio.run(run())
+    assert len(dvr.devices) == 20
+    assert all(device.requests == 1 for device in dvr.devices.values())
+    statuses = [response.status_code for response in responses]
+    assert set(statuses) == {200, 503}
+    assert statuses.count(503) == dvr.errors
+    serials = {r.text for r in responses if r.status_code == 200}
+    assert len(serials) == statuses.count(200)
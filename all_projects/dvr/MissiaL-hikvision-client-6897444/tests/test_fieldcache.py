@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import hikvisionapi
+from hikvisionapi.authcache import AuthCache
+from hikvisionapi.fakedvr import FakeDVR
+from hikvisionapi.fieldcache import FieldCache
+from hikvisionapi.snapshot import HddInfo, recording_end_steps
+
+
+def test_cached_fields_skip_the_device(tmp_path):
+    path = str(tmp_path / 'fields.json')
+    cache = FieldCache(ttls={'recording_end': 0.2}, path=path)
+
+    async def run():
+        async with FakeDVR() as dvr:
+            async with hikvisionapi.AsyncClient(dvr.url, 'admin', 'admin', auth_cache=AuthCache()) as cam:
+                first = await cam.health_snapshot(cache=cache)
+                before = dvr.requests
+                second = await cam.health_snapshot(cache=cache)
+                cached_requests = dvr.requests - before
+                await asyncio.sleep(0.25)
+                before = dvr.requests
+                third = await cam.health_snapshot(fields=('recording',), cache=cache)
+                return first, second, third, cached_requests, dvr.requests - before
+
+    first, second, third, cached_requests, expired_requests = asyncio.run(run())
+    assert not first.storage.cached and not first.recording.cached
+    assert second.storage.cached and second.recording.cached
+    assert not second.status.cached and not second.channels.cached
+    assert second.storage.value == first.storage.value
+    # status, time and the two channel endpoints
+    assert cached_requests == 4
+    # Only the newest recording expired: one search, starting at the previous end
+    assert expired_requests == 1 and not third.recording.cached
+    assert third.recording.value == first.recording.value
+
+    cache.flush()
+    reloaded = FieldCache(path=path)
+    hdds = reloaded.get(first.host, 'storage')
+    assert isinstance(hdds[0], HddInfo) and hdds == first.storage.value
+    assert reloaded.get(first.host, 'recording_start') == first.recording.value[0]
+
+
+def test_recording_end_search_starts_at_the_previous_end():
+    steps = recording_end_steps(since='2024-02-01T01:30:00Z')
+    assert '<startTime>2024-02-01T01:30:00Z</startTime>' in next(steps).body
+
+
+def test_recording_end_windows_are_utc():
+    now = datetime(2024, 2, 1, 5, 30, tzinfo=timezone(timedelta(hours=5, minutes=30)))
+    steps = recording_end_steps(now=now)
+    # Two hours back from 00:00 UTC
+    assert '<startTime>2024-01-31T22:00:00Z</startTime>' in next(steps).body
+
+
+def test_invalidate():
+    cache = FieldCache()
+    cache.set('http://10.0.0.1', 'storage', [])
+    cache.set('10.0.0.1:80', 'status', 'ignored, no TTL')
+    assert cache.get('10.0.0.1', 'storage') == []
+    assert cache.get('10.0.0.1', 'status') is None
+    cache.invalidate('10.0.0.1:80')
+    assert cache.get('10.0.0.1:80', 'storage') is None
+    assert cache.stale('10.0.0.1:80', 'storage') is None
@@ -0,0 +1,50 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+
+import hikvisionapi
+from hikvisionapi.authcache import AuthCache
+from hikvisionapi.fakedvr import FakeDVR
+from hikvisionapi.grid import GridCapture, make_thumbnail
+
+
+def fake_encoder(data, size, quality):
+    return b'%dx%d:' % size + hashlib.md5(data).hexdigest().encode()
+
+
+def cached_files(directory):
+    return sorted(name for _, _, names in os.walk(directory) for name in names)
+
+
+def test_capture_reuses_cached_thumbnails(tmp_path):
+    async def run(grid):
+        async with FakeDVR(channels=3, picture_size=2000) as dvr:
+            async with hikvisionapi.AsyncClient(dvr.url, 'admin', 'admin', auth_cache=AuthCache()) as cam:
+                # Channel 1 twice: the second request shares the encode of the first
+                targets = [(cam, 1), (cam, 1), (cam, 2), (cam, 3), (cam, 7)]
+                first = [thumb async for thumb in grid.capture(targets)]
+                second = [thumb async for thumb in grid.capture(targets)]
+                return first, second
+
+    with GridCapture(str(tmp_path), size=(64, 36), encoder=fake_encoder, workers=2) as grid:
+        first, second = asyncio.run(run(grid))
+
+    assert sorted(t.channel for t in first if t.error) == [7]
+    assert sum(not t.cached for t in first if not t.error) == 3
+    assert all(t.cached for t in second if not t.error)
+    assert len(cached_files(tmp_path)) == 3
+    thumb = next(t for t in second if t.channel == 2)
+    assert thumb.path.endswith(f"{thumb.key}_64x36.jpg")
+    assert open(thumb.path, 'rb').read().startswith(b'64x36:')
+    assert len(grid.latest) == 3
+
+
+def test_make_thumbnail_has_a_fixed_size():
+    Image = pytest.importorskip('PIL.Image')
+    source = io.BytesIO()
+    Image.new('RGB', (704, 576), 'red').save(source, 'JPEG')
+    thumbnail = Image.open(io.BytesIO(make_thumbnail(source.getvalue(), (320, 180))))
+    assert thumbnail.size == (320, 180)
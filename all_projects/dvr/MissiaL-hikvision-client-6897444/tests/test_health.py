@@ -0,0 +1,121 @@
+import asyncio
+import os
+import tempfile
+
+import httpx
+import pytest
+import requests
+
+import hikvisionapi
+from hikvisionapi.authcache import AuthCache
+from hikvisionapi.health import CircuitOpenError, HealthTracker
+
+
+def test_connect_timeout_follows_rtt_percentile():
+    tracker = HealthTracker(min_samples=3, multiplier=4, min_timeout=0.5)
+    assert tracker.timeout_for('http://10.0.0.1', 3) == 3
+    for rtt in (0.01, 0.02, 0.03):
+        tracker.record_success('http://10.0.0.1', rtt)
+    assert tracker.timeout_for('http://10.0.0.1', 3) == 0.5
+    for rtt in (0.4, 0.5, 0.6, 0.7):
+        tracker.record_success('http://10.0.0.1:80', rtt)
+    assert tracker.timeout_for('10.0.0.1', 3) == pytest.approx(2.4)
+    assert tracker.timeout_for('10.0.0.1', 1) == 1
+
+
+def test_circuit_opens_probes_once_and_backs_off(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('hikvisionapi.health.time.time', lambda: now[0])
+    tracker = HealthTracker(failure_threshold=2, probe_interval=10, probe_max=30)
+    host = 'http://10.0.0.2'
+
+    tracker.record_failure(host)
+    tracker.check(host)
+    tracker.record_failure(host)
+    with pytest.raises(CircuitOpenError):
+        tracker.check(host)
+
+    now[0] += 10
+    tracker.check(host)  # the probe
+    with pytest.raises(CircuitOpenError):
+        tracker.check(host)
+    tracker.record_failure(host)
+    assert tracker.stats(host)['state'] == 'open'
+
+    now[0] += 10
+    with pytest.raises(CircuitOpenError):
+        tracker.check(host)
+    now[0] += 10
+    tracker.check(host)
+    tracker.record_success(host, 0.05)
+    tracker.check(host)
+    assert tracker.stats(host) == {'state': 'closed', 'samples': 1, 'failures': 0, 'p50': 0.05, 'p95': 0.05}
+
+
+def test_state_is_persisted():
+    path = os.path.join(tempfile.mkdtemp(), 'health.json')
+    tracker = HealthTracker(failure_threshold=1, path=path)
+    tracker.record_success('http://10.0.0.3', 0.1)
+    tracker.record_failure('http://10.0.0.4')
+    tracker.flush()
+    restored = HealthTracker(failure_threshold=1, path=path)
+    assert restored.is_open('http://10.0.0.4')
+    assert restored.stats('http://10.0.0.3')['samples'] == 1
+
+
+def test_async_client_fails_fast_on_a_dead_device():
+    attempts = []
+
+    def refuse(request):
+        attempts.append(request.url.path)
+        raise httpx.ConnectError('Connection refused', request=request)
+
+    async def run():
+        tracker = HealthTracker(failure_threshold=3)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(refuse)) as pool:
+            cam = hikvisionapi.AsyncClient('http://10.0.0.5', 'admin', 'pw', http_client=pool,
+                                           auth_cache=AuthCache(), health=tracker)
+            errors = []
+            for _ in range(5):
+                try:
+                    await cam.System.status(method='get')
+                except Exception as e:
+                    errors.append(type(e))
+            return errors
+
+    errors = asyncio.run(run())
+    assert errors == [httpx.ConnectError] * 3 + [CircuitOpenError] * 2
+    assert len(attempts) == 3
+
+
+def test_only_connect_failures_count():
+    def slow(request):
+        raise httpx.ReadTimeout('Read timed out', request=request)
+
+    async def run():
+        tracker = HealthTracker(failure_threshold=1)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(slow)) as pool:
+            cam = hikvisionapi.AsyncClient('http://10.0.0.6', 'admin', 'pw', http_client=pool,
+                                           auth_cache=AuthCache(), health=tracker)
+            untracked = hikvisionapi.AsyncClient('http://10.0.0.6', 'admin', 'pw', http_client=pool,
+                                                 auth_cache=AuthCache())
+            errors = []
+            for _ in range(3):
+                try:
+                    await cam.System.status(method='get')
+                except Exception as e:
+                    errors.append(type(e))
+            return tracker, untracked, errors
+
+    tracker, untracked, errors = asyncio.run(run())
+    # A slow device answered, so its circuit stays closed
+    assert errors == [httpx.ReadTimeout] * 3
+    assert not tracker.is_open('http://10.0.0.6')
+    assert untracked.health is None
+
+    # A refused connection does count, the sync client classifies it too
+    tracker = HealthTracker(failure_threshold=1)
+    with pytest.raises(requests.ConnectionError):
+        hikvisionapi.Client('http://127.0.0.1:1', 'admin', 'pw', auth_cache=AuthCache(), health=tracker)
+    with pytest.raises(CircuitOpenError):
+        hikvisionapi.Client('http://127.0.0.1:1', 'admin', 'pw', auth_cache=AuthCache(), health=tracker)
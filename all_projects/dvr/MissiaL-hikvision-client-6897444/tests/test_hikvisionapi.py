@@ -3,6 +3,7 @@ import os
 import vcr
 
 import hikvisionapi
+from hikvisionapi.fakedvr import FakeDVR
 
 THIS_FILE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -24,11 +25,51 @@ def test_auth_firmware_v5_5():
     device_info = client.System.deviceinfo(method='get')
     assert device_info['DeviceInfo']['firmwareVersion'] == 'V5.5.0'
 
-# VCRpy does not work with in stream mode
-# @my_vcr.use_cassette()
-# def test_stream_request():
-    # client = hikvisionapi.Client('http://192.168.1.116', 'admin', 'password')
-    # client.count_events = 1
-    # response = client.Event.notification.alertStream(method='get')
+# VCRpy does not work with in stream mode, so the stream is served by the fake device
+def test_stream_request():
+    with FakeDVR(auth='digest', login='admin', password='password', event_interval=0.01).run_in_thread() as dvr:
+        client = hikvisionapi.Client(dvr.url, 'admin', 'password')
+        client.count_events = 2
+        response = client.Event.notification.alertStream(method='get', type='stream')
+    assert [event['EventNotificationAlert']['eventType'] for event in response] == ['VMD', 'videoloss']
 
+def test_dynamic_methods_and_urls_are_built_once():
+    with FakeDVR(channels=2).run_in_thread() as dvr:
+        client = hikvisionapi.Client(dvr.url, 'admin', 'admin', auth_cache=hikvisionapi.AuthCache())
+        channels = client.System.Video.inputs.channels
+        assert client.System.Video.inputs.channels is channels
+        assert channels[1] is channels[1]
+        assert channels[1].path == 'System/Video/inputs/channels/1'
+        # Indexed children stay bounded however many ids are looked up
+        tracks = client.ContentMgmt.record.tracks
+        for track in range(hikvisionapi.hikvisionapi.MAX_CACHED_URLS + 10):
+            assert tracks[track].path == f'ContentMgmt/record/tracks/{track}'
+        assert len(tracks._items) == hikvisionapi.hikvisionapi.MAX_CACHED_URLS
 
+        by_chain = client.System.Video.inputs.channels(method='get')
+        by_call = client.call('System/Video/inputs/channels')
+        assert by_chain == by_call
+        assert client.call('System/time', present='text').startswith('<?xml')
+        assert client._url('System/time') is client._url('System/time')
+        assert client._url('System/time') == f"{dvr.url}/ISAPI/System/time"
+
+
+def test_client_is_shared_safely_by_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    with FakeDVR(auth='digest', event_interval=0.01).run_in_thread() as dvr:
+        client = hikvisionapi.Client(dvr.url, 'admin', 'admin', auth_cache=hikvisionapi.AuthCache(), pool_size=2)
+
+        def poll(_):
+            return [client.call('System/status')['DeviceStatus']['status'] for _ in range(20)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = [status for statuses in executor.map(poll, range(8)) for status in statuses]
+        events = client.Event.notification.alertStream(method='get', type='stream', count_events=2)
+        with client:
+            assert len(client._sessions) == 9
+            assert client.req.get_adapter(dvr.url)._pool_maxsize == 2
+
+    assert results == ['ok'] * 160
+    assert len(events) == 2 and client.count_events == 1
+    assert client._sessions == []
@@ -0,0 +1,68 @@
+import asyncio
+
+import hikvisionapi
+from hikvisionapi import AuthCache
+from hikvisionapi.authcache import DIGEST
+from hikvisionapi.fakedvr import FakeDVR
+from hikvisionapi.metastore import DEVICE_INFO, MetaStore
+
+
+def device_info(firmware):
+    return {'DeviceInfo': {'model': 'DS-7216HQHI-K1', 'firmwareVersion': firmware, 'firmwareReleasedDate': 'build 200'}}
+
+
+def test_store_survives_reopen_and_expires(tmp_path):
+    path = str(tmp_path / 'metadata.db')
+    store = MetaStore(path, ttls={'short': -1})
+    store.set('http://10.0.0.1', 'System/Video/inputs/channels', {'channels': 16})
+    store.set('10.0.0.1:80', 'short', 'gone')
+    store.close()
+
+    store = MetaStore(path)
+    assert store.get('10.0.0.1', 'System/Video/inputs/channels') == {'channels': 16}
+    assert store.get('10.0.0.1', 'short') is None
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_firmware_change_drops_the_device():
+    store = MetaStore()
+    assert store.set_device_info('10.0.0.1:80', device_info('V4.21.005')) is False
+    store.set('10.0.0.1:80', 'System/Video/inputs/channels', {'channels': 16})
+    store.set('10.0.0.2:80', 'System/Video/inputs/channels', {'channels': 8})
+
+    assert store.set_device_info('10.0.0.1:80', device_info('V4.21.005')) is False
+    assert store.get('10.0.0.1:80', 'System/Video/inputs/channels') == {'channels': 16}
+
+    assert store.set_device_info('10.0.0.1:80', device_info('V4.30.000')) is True
+    assert store.get('10.0.0.1:80', 'System/Video/inputs/channels') is None
+    assert store.get('10.0.0.1:80', DEVICE_INFO) == device_info('V4.30.000')
+    assert store.get('10.0.0.2:80', 'System/Video/inputs/channels') == {'channels': 8}
+    assert store.firmware('10.0.0.1:80') == 'V4.30.000 build 200'
+
+
+def test_restarted_process_starts_warm(tmp_path):
+    path = str(tmp_path / 'metadata.db')
+    with FakeDVR(auth='digest').run_in_thread() as dvr:
+        store = MetaStore(path)
+        cache = AuthCache(store=store)
+        with hikvisionapi.Client(dvr.url, 'admin', 'admin', auth_cache=cache, metadata=store) as client:
+            info = client.device_info()
+            assert info['DeviceInfo']['firmwareVersion'] == 'V4.21.005'
+        cache.flush()
+        store.close()
+        sent = dvr.requests
+
+        # As a new process would: new store, new auth cache, new clients
+        store = MetaStore(path)
+        cache = AuthCache(store=store)
+        assert cache.get(dvr.url, 'admin') == DIGEST
+        with hikvisionapi.Client(dvr.url, 'admin', 'admin', auth_cache=cache, metadata=store) as client:
+            assert client.device_info() == info
+
+        async def run():
+            async with hikvisionapi.AsyncClient(dvr.url, 'admin', 'admin', auth_cache=cache,
+                                                metadata=store) as client:
+                return await client.device_info()
+
+        assert asyncio.run(run()) == info
+        assert dvr.requests == sent
@@ -0,0 +1,75 @@
+import asyncio
+
+import hikvisionapi
+from hikvisionapi import metrics
+from hikvisionapi.authcache import AuthCache
+from hikvisionapi.fakedvr import FakeDVR
+from hikvisionapi.metrics import MetricsCollector, endpoint
+
+
+def test_endpoint_labels():
+    assert endpoint('http://10.0.0.1/ISAPI/Streaming/channels/101/picture?snapShotImageType=JPEG') == \
+        'Streaming/channels/{id}/picture'
+    assert endpoint('System/status') == 'System/status'
+    assert endpoint('http://10.0.0.1/custom/System/time', 'custom') == 'System/time'
+
+
+def test_sync_client_reports_requests_auth_and_parse():
+    collector = MetricsCollector()
+    with FakeDVR(auth='digest').run_in_thread() as dvr:
+        client = hikvisionapi.Client(dvr.url, 'admin', 'admin', auth_cache=AuthCache(), instruments=collector)
+        for _ in range(3):
+            client.System.status(method='get')
+
+    summary = collector.as_dict()
+    status = summary['requests']['System/status GET']
+    # Basic probe (401), digest probe, then three requests on the kept-alive connection
+    assert status['latency']['count'] == 5
+    assert status['errors'] == {'401': 1}
+    assert status['bytes'] > 0
+    assert status['reuse_ratio'] >= 0.6
+    assert summary['auth']['digest']['count'] == 1
+    assert summary['parse']['System/status']['count'] == 3
+    assert summary['in_flight'] == 0
+
+    text = collector.prometheus()
+    assert 'hikvision_request_duration_seconds_bucket{endpoint="System/status",method="GET",le="+Inf"} 5' in text
+    assert 'hikvision_request_errors_total{endpoint="System/status",method="GET",error="401"} 1' in text
+    assert '# TYPE hikvision_parse_duration_seconds histogram' in text
+
+
+def test_async_snapshot_splits_connect_and_first_byte():
+    collector = MetricsCollector()
+
+    async def run(url):
+        async with hikvisionapi.AsyncClient(url, 'admin', 'admin', auth_cache=AuthCache(),
+                                            instruments=collector) as cam:
+            await cam.health_snapshot(('status', 'channels'))
+            await cam.health_snapshot(('status', 'channels'))
+
+    with FakeDVR(channels=4).run_in_thread() as dvr:
+        asyncio.run(run(dvr.url))
+
+    summary = collector.as_dict()['requests']
+    inputs = summary['System/Video/inputs/channels GET']
+    assert inputs['latency']['count'] == 2
+    assert inputs['first_byte']['count'] == 2
+    # The DVR has no IP channels and answers the InputProxy status with 404
+    assert summary['ContentMgmt/InputProxy/channels/status GET']['errors'] == {'404': 2}
+    connects = sum(stats['connect']['count'] for stats in summary.values())
+    reused = [stats['reuse_ratio'] for stats in summary.values()]
+    assert 1 <= connects <= hikvisionapi.hikvisionapi.DEFAULT_LIMITS.max_connections
+    assert all(ratio is not None for ratio in reused)
+    assert collector.as_dict()['parse']['System/Video/inputs/channels']['count'] == 2
+
+
+def test_instruments_are_off_by_default():
+    with FakeDVR().run_in_thread() as dvr:
+        assert hikvisionapi.Client(dvr.url, 'admin', 'admin', auth_cache=AuthCache()).instruments is None
+        collector = metrics.enable()
+        try:
+            client = hikvisionapi.Client(dvr.url, 'admin', 'admin', auth_cache=AuthCache())
+            assert client.instruments is collector
+        finally:
+            metrics.disable()
+    assert collector.as_dict()['auth']['basic']['count'] == 1
@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import pytest
+
+import hikvisionapi
+from hikvisionapi.authcache import AuthCache
+from hikvisionapi.multipart import MultipartParser, boundary_from_content_type, decode_part
+
+ALERT = (
+    b'<EventNotificationAlert version="2.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">'
+    b'<channelID>1</channelID><eventType>videoloss</eventType><eventState>inactive</eventState>'
+    b'</EventNotificationAlert>'
+)
+JPEG = b'\xff\xd8\xff\xe0' + bytes(range(256)) * 4 + b'\r\n--not-the-boundary\xff\xd9'
+
+
+def part(body, content_type, length=True):
+    headers = b'Content-Type: ' + content_type + b'\r\n'
+    if length:
+        headers += b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+    return b'--boundary\r\n' + headers + b'\r\n' + body + b'\r\n'
+
+
+STREAM = (
+    part(ALERT, b'application/xml; charset="UTF-8"')
+    + part(b'{"eventType": "VMD"}', b'application/json', length=False)
+    + part(JPEG, b'image/jpeg')
+    + part(ALERT, b'application/xml', length=False)
+)
+
+
+def test_boundary_from_content_type():
+    assert boundary_from_content_type('multipart/mixed; boundary=abc') == b'abc'
+    assert boundary_from_content_type('multipart/x-mixed-replace; boundary="--xyz"') == b'xyz'
+    assert boundary_from_content_type(None) == b'boundary'
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_parts_are_split_at_any_chunk_size(chunk_size):
+    parser = MultipartParser(b'boundary')
+    parts = []
+    for offset in range(0, len(STREAM), chunk_size):
+        parts.extend(parser.feed(STREAM[offset:offset + chunk_size]))
+    # The last part has no length, so it completes once the next boundary arrives
+    parts.extend(parser.feed(b'--boundary\r\n'))
+
+    assert [p.content_type for p in parts] == ['application/xml', 'application/json', 'image/jpeg', 'application/xml']
+    assert parts[0].body == ALERT
+    assert parts[2].body == JPEG
+    assert parts[3].body == ALERT
+    assert decode_part(parts[0])['EventNotificationAlert']['eventType'] == 'videoloss'
+    assert decode_part(parts[1]) == {'eventType': 'VMD'}
+    assert decode_part(parts[2]) == JPEG
+    assert decode_part(parts[0], present='text') == ALERT.decode()
+
+
+def test_buffer_stays_bounded_and_oversized_parts_are_skipped():
+    parser = MultipartParser(b'boundary', max_part_size=1024)
+    big = part(b'x' * 10000, b'image/jpeg', length=False)
+    for offset in range(0, len(big), 100):
+        assert parser.feed(big[offset:offset + 100]) == []
+        assert parser.buffered <= 1024 + 100
+    parts = parser.feed(part(ALERT, b'application/xml'))
+    assert parser.skipped_parts == 1
+    assert [p.body for p in parts] == [ALERT]
+
+
+def test_async_stream_request_yields_parsed_events():
+    def handler(request):
+        return httpx.Response(
+            200,
+            headers={'Content-Type': 'multipart/mixed; boundary=boundary'},
+            content=STREAM + b'--boundary--\r\n',
+        )
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as pool:
+            cam = hikvisionapi.AsyncClient('http://10.0.0.1', 'admin', 'pw', http_client=pool, auth_cache=AuthCache())
+            return [e async for e in cam.Event.notification.alertStream(method='get', type='stream')]
+
+    events = asyncio.run(run())
+    assert len(events) == 4
+    assert events[0]['EventNotificationAlert']['channelID'] == '1'
+    assert events[1] == {'eventType': 'VMD'}
+    assert events[2] == JPEG
@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+import xmltodict
+
+from hikvisionapi import parsers
+from hikvisionapi.hikvisionapi import response_parser
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'isapi')
+ENGINES = ['xmltodict', 'etree'] + (['lxml'] if parsers.lxml_etree is not None else [])
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as fd:
+        return fd.read()
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('name', ['deviceInfo.xml', 'channels.xml', 'storage.xml'])
+def test_engines_match_legacy_round_trip(engine, name):
+    data = load(name)
+    assert parsers.parse_xml(data, engine) == json.loads(json.dumps(xmltodict.parse(data)))
+
+
+def test_etree_engine_handles_attributes_text_and_empty_elements():
+    data = '<a xmlns="urn:x"><b id="1">text</b><b/><c></c></a>'
+    assert parsers.parse_xml(data, 'etree') == xmltodict.parse(data, dict_constructor=dict)
+
+
+def test_response_parser_parses_event_lists():
+    events = ['<Event><id>1</id></Event>', '<Event><id>2</id></Event>']
+    assert response_parser(events) == [{'Event': {'id': '1'}}, {'Event': {'id': '2'}}]
+    assert response_parser(events, present='text') == ''.join(events)
+
+
+@pytest.mark.parametrize('engine', [None] + (['lxml'] if parsers.lxml_etree is not None else []))
+def test_extract_scalars_and_records(engine):
+    data = load('channels.xml')
+    result = parsers.extract(
+        data, 'name', 'VideoInputChannel/id/videoInputEnabled',
+        converters={'id': int, 'videoInputEnabled': parsers.to_bool},
+        engine=engine,
+    )
+    assert result['name'] == 'Camera 01'
+    channels = result['VideoInputChannel/id/videoInputEnabled']
+    assert len(channels) == 16
+    assert channels[0] == {'id': 1, 'videoInputEnabled': True}
+
+
+
+@pytest.mark.parametrize('engine', [None] + (['lxml'] if parsers.lxml_etree is not None else []))
+def test_extract_dotted_fields_stay_in_their_record(engine):
+    xml = (
+        '<List>'
+        '<Status><id>1</id><source><ip>10.0.0.1</ip></source><ip>wrong level</ip></Status>'
+        '<Status><id>2</id></Status>'
+        '<Status><id>3</id><source><ip>10.0.0.3</ip></source></Status>'
+        '</List>'
+    )
+    assert parsers.extract(xml, 'Status/id/source.ip', engine=engine)['Status/id/source.ip'] == [
+        {'id': '1', 'source.ip': '10.0.0.1'},
+        {'id': '2', 'source.ip': None},
+        {'id': '3', 'source.ip': '10.0.0.3'},
+    ]
+
+
+def test_extract_missing_fields_are_none():
+    result = parsers.extract(load('deviceInfo.xml'), 'firmwareVersion', 'localTime')
+    assert result == {'firmwareVersion': 'V4.21.005', 'localTime': None}
+
+
+def test_extract_stops_after_last_scalar():
+    # The document is truncated after the requested field, so only an early stop succeeds
+    assert parsers.extract('<Time><localTime>2024-01-01T10:00:00</localTime><timeZone>', 'localTime') == {
+        'localTime': '2024-01-01T10:00:00'
+    }
+
+
+def test_set_default_engine_rejects_unknown_engines():
+    with pytest.raises(ValueError):
+        parsers.set_default_engine('sax')
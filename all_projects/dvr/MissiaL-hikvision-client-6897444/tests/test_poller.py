@@ -0,0 +1,103 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from hikvisionapi import poller
+
+
+def test_load_devices_csv(tmp_path):
+    path = tmp_path / 'devices.csv'
+    path.write_text('ip,port,username,password\n10.0.0.1,80,admin,secret\n10.0.0.2,8080,admin,secret\n')
+    devices = poller.load_devices(str(path))
+    assert [d['ip'] for d in devices] == ['10.0.0.1', '10.0.0.2']
+    assert devices[1]['port'] == '8080'
+
+
+def test_load_devices_guesses_format_from_stdin(monkeypatch):
+    lines = '{"ip": "10.0.0.1", "port": 80, "username": "admin", "password": "x"}\n'
+    monkeypatch.setattr('sys.stdin', io.StringIO(lines))
+    assert poller.load_devices('-')[0]['port'] == 80
+
+    data = json.dumps([{'ip': '10.0.0.2', 'port': 80, 'username': 'admin', 'password': 'x'}])
+    monkeypatch.setattr('sys.stdin', io.StringIO(data))
+    assert poller.load_devices('-')[0]['ip'] == '10.0.0.2'
+
+
+def test_load_devices_rejects_incomplete_rows(tmp_path):
+    path = tmp_path / 'devices.json'
+    path.write_text(json.dumps([{'ip': '10.0.0.1', 'port': 80}]))
+    with pytest.raises(ValueError):
+        poller.load_devices(str(path))
+
+
+def test_poll_fleet_limits_concurrency_and_applies_deadline(monkeypatch):
+    active = []
+    peak = []
+
+    async def fake_poll_device(device, timeout, http_client, fields=None, health=None, cache=None):
+        active.append(device)
+        peak.append(len(active))
+        try:
+            await asyncio.sleep(10 if device['ip'] == 'slow' else 0.01)
+        finally:
+            active.remove(device)
+        return poller.empty_result()
+
+    monkeypatch.setattr(poller, 'poll_device', fake_poll_device)
+    devices = [{'ip': str(i), 'port': 80} for i in range(10)] + [{'ip': 'slow', 'port': 80}]
+
+    async def collect():
+        return [r async for r in poller.poll_fleet(devices, concurrency=3, deadline=0.2)]
+
+    results = asyncio.run(collect())
+    assert len(results) == 11
+    assert max(peak) <= 3
+    by_ip = {r['ip']: r for r in results}
+    assert by_ip['slow']['status'] == 'ERROR'
+    assert by_ip['0']['status'] == 'ONLINE'
+    assert set(by_ip['0']) >= {'deviceInfo', 'cameraInfo', 'storageInfo', 'recordingInfo'}
+
+
+
+def test_stopping_early_waits_for_cancelled_polls(monkeypatch):
+    unwound = []
+
+    async def fake_poll_device(device, timeout, http_client, fields=None, health=None, cache=None):
+        try:
+            await asyncio.sleep(0 if device['ip'] == 'fast' else 10)
+        finally:
+            # Cleanup that needs the loop, as closing a response does
+            await asyncio.sleep(0)
+            unwound.append(http_client.is_closed)
+        return poller.empty_result()
+
+    monkeypatch.setattr(poller, 'poll_device', fake_poll_device)
+    devices = [{'ip': 'fast', 'port': 80}] + [{'ip': f'slow{i}', 'port': 80} for i in range(3)]
+
+    async def first():
+        results = poller.poll_fleet(devices, deadline=None)
+        async for result in results:
+            await results.aclose()
+            return result
+
+    assert asyncio.run(first())['ip'] == 'fast'
+    # Every poll finished its cleanup before the shared http client closed
+    assert unwound == [False] * 4
+
+def test_threaded_sweep_yields_every_device():
+    from hikvisionapi.fakedvr import FakeDVR
+
+    with FakeDVR(channels=4).run_in_thread() as first, FakeDVR(channels=2).run_in_thread() as second:
+        devices = [
+            {'ip': '127.0.0.1', 'port': port, 'username': 'admin', 'password': 'admin'}
+            for port in (first.port, second.port, 1)
+        ]
+        results = {r['port']: r for r in poller.sweep(devices, max_workers=3, timeout=2,
+                                                        fields=('status', 'channels'))}
+
+    assert results[first.port]['status'] == 'ONLINE'
+    assert results[first.port]['cameraInfo']['totalCameras'] == 4
+    assert results[second.port]['cameraInfo']['totalCameras'] == 2
+    assert results[1]['status'] == 'ERROR'
@@ -0,0 +1,88 @@
+import asyncio
+import socket
+
+from hikvisionapi import poller, precheck
+from hikvisionapi.fakedvr import FakeDVR
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_check_classifies_hosts():
+    async def silent(reader, writer):
+        await reader.read()
+        writer.close()
+
+    async def run():
+        async with FakeDVR(auth='digest') as dvr, FakeDVR() as open_dvr:
+            server = await asyncio.start_server(silent, '127.0.0.1', 0)
+            silent_port = server.sockets[0].getsockname()[1]
+            results = await asyncio.gather(
+                precheck.check('127.0.0.1', dvr.port),
+                precheck.check('127.0.0.1', dvr.port, isapi=True),
+                precheck.check('127.0.0.1', open_dvr.port, isapi=True, prefix='CGI'),
+                precheck.check('127.0.0.1', closed_port()),
+                precheck.check('127.0.0.1', silent_port, timeout=0.2, isapi=True),
+            )
+            server.close()
+            return results
+
+    states = [(r.state, r.status) for r in asyncio.run(run())]
+    assert states == [
+        ('open', 'ONLINE'),
+        ('isapi', 'ONLINE'),
+        ('not_isapi', 'ERROR'),
+        ('refused', 'ERROR'),
+        ('timeout', 'NO NETWORK'),
+    ]
+
+
+def test_poll_fleet_skips_unreachable_devices(monkeypatch):
+    polled = []
+
+    async def fake_poll_device(device, timeout, http_client, fields=None, health=None, cache=None):
+        polled.append(device['ip'])
+        return poller.empty_result()
+
+    monkeypatch.setattr(poller, 'poll_device', fake_poll_device)
+
+    async def run():
+        async with FakeDVR() as dvr:
+            devices = [
+                {'ip': '127.0.0.1', 'port': dvr.port, 'username': 'admin', 'password': 'admin'},
+                {'ip': '127.0.0.1', 'port': closed_port(), 'username': 'admin', 'password': 'admin'},
+            ]
+            return [r async for r in poller.poll_fleet(devices, precheck=0.5, precheck_isapi=True)]
+
+    results = {r['port']: r for r in asyncio.run(run())}
+    assert len(polled) == 1
+    statuses = sorted((r['status'], r.get('precheck')) for r in results.values())
+    assert statuses == [('ERROR', 'refused'), ('ONLINE', None)]
+
+
+def test_stopping_early_waits_for_cancelled_checks(monkeypatch):
+    closed = []
+
+    async def fake_check(ip, port, timeout, isapi):
+        try:
+            await asyncio.sleep(0 if ip == 'fast' else 10)
+        finally:
+            await asyncio.sleep(0)  # Closing a socket needs the loop
+            closed.append(ip)
+        return precheck.Reachability(ip, port, precheck.OPEN, 0.001)
+
+    monkeypatch.setattr(precheck, 'check', fake_check)
+    devices = [{'ip': 'fast', 'port': 80}] + [{'ip': f'slow{i}', 'port': 80} for i in range(3)]
+
+    async def first():
+        checks = precheck.check_many(devices)
+        async for device, _ in checks:
+            await checks.aclose()
+            return device, sorted(closed)
+
+    device, closed_by_then = asyncio.run(first())
+    assert device['ip'] == 'fast'
+    assert closed_by_then == ['fast', 'slow0', 'slow1', 'slow2']
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+from hikvisionapi.fakedvr import FakeDVR
+from hikvisionapi.health import HealthTracker
+from hikvisionapi.scheduler import Scheduler, TokenBucket
+from hikvisionapi.snapshot import FieldResult, _result
+
+
+def snapshot(status_error=None, channels=None):
+    fields = {'status': FieldResult({}, 0.01, status_error)}
+    if channels is not None:
+        fields['channels'] = FieldResult(channels, 0.01)
+    return _result('10.0.0.1:80', fields, time.perf_counter())
+
+
+def test_intervals_adapt_to_changes_errors_and_priority():
+    scheduler = Scheduler(intervals={'status': 100, 'channels': 400}, fields=('status', 'channels'))
+    key = scheduler.add_device({'ip': '10.0.0.1', 'port': 80}, priority=2)
+    entry = scheduler._devices[key]
+    status = entry.tasks['status']
+
+    def poll(**kwargs):
+        fields = ('status', 'channels') if 'channels' in kwargs else ('status',)
+        changed = scheduler._update(entry, snapshot(**kwargs), fields)
+        return changed, round(status.due - time.monotonic())
+
+    # First poll is on the base cadence, halved by the priority
+    assert poll() == (('status',), 50)
+    # Stable devices stretch after stretch_after unchanged polls
+    for _ in range(10):
+        poll()
+    assert poll()[1] == 100
+
+    # Going offline is rechecked fast and pulls the channels forward
+    channels_due = entry.tasks['channels'].due
+    assert poll(status_error='Connection refused') == (('status',), 12)
+    assert entry.tasks['channels'].due < channels_due
+    # Staying offline backs off
+    assert poll(status_error='Connection refused')[1] == 100
+    assert poll(status_error='Connection refused')[1] == 200
+    # Back online is a change again
+    assert poll() == (('status',), 12)
+    assert poll()[1] == 25
+
+
+def test_scheduler_polls_cheap_fields_more_often():
+    polls = []
+
+    async def run(url, port):
+        scheduler = Scheduler(rate=100, intervals={'status': 0.1, 'channels': 60}, fields=('status', 'channels'),
+                              coalesce=0, health=HealthTracker())
+        scheduler.add_device({'ip': '127.0.0.1', 'port': port, 'username': 'admin', 'password': 'admin'},
+                             spread=False)
+        scheduler.add_device({'ip': '127.0.0.1', 'port': 1, 'username': 'admin', 'password': 'admin'},
+                             spread=False)
+        started = time.monotonic()
+        async for poll in scheduler:
+            polls.append(poll)
+            if time.monotonic() - started > 0.8:
+                break
+        return scheduler
+
+    with FakeDVR(channels=4, no_video=(2,)).run_in_thread() as dvr:
+        scheduler = asyncio.run(run(dvr.url, dvr.port))
+
+    live = [poll for poll in polls if poll.device['port'] != 1]
+    dead = [poll for poll in polls if poll.device['port'] == 1]
+    # The first poll carries both fields, later ones only the cheap status check
+    assert live[0].snapshot.channels.ok and len(live[0].snapshot.channels.value) == 4
+    assert set(live[0].changed) == {'status', 'channels'}
+    assert len(live) >= 4
+    assert all(poll.snapshot.channels.error == 'skipped' for poll in live[1:])
+    assert all(poll.changed == () for poll in live[2:])
+    # The dead device backs off instead of being polled at the status cadence
+    assert 1 <= len(dead) < len(live)
+    assert not dead[0].snapshot.online
+    assert scheduler.stats['polls'] == len(polls)
+
+
+def test_token_bucket_paces_requests():
+    async def run():
+        bucket = TokenBucket(rate=50, burst=5)
+        started = time.monotonic()
+        for _ in range(15):
+            await bucket.take(1)
+        return time.monotonic() - started
+
+    # Five from the burst, ten more at 50 per second
+    assert 0.15 <= asyncio.run(run()) < 0.5
+
@@ -0,0 +1,56 @@
+from hikvisionapi.fakedvr import FakeDVR
+from hikvisionapi.shard import ShardedSweep, decode_result, encode_result, shard_of
+from hikvisionapi.snapshot import empty_result
+
+
+def test_encode_round_trip_keeps_every_key():
+    result = empty_result()
+    result.update(ip='10.0.0.1', port=80)
+    result['cameraInfo'] = {'totalCameras': 2, 'cameraStatus': [
+        {'number': '1', 'status': 'Working'}, {'number': '2', 'status': 'Not Working'},
+    ]}
+    data = encode_result(result)
+    assert decode_result(data) == result
+    assert len(data) < len(repr(result)) / 3
+
+    # CSV ports, odd channel ids and extra keys fall back to the JSON tail
+    odd = empty_result('NO NETWORK', 'Connection refused')
+    odd.update(ip='dvr.example', port='8000', precheck='refused', shard=3)
+    odd['cameraInfo']['cameraStatus'] = [{'number': 'D01', 'status': 'Working'}]
+    assert decode_result(encode_result(odd)) == odd
+
+
+def test_sharded_sweep_polls_every_device_once(tmp_path):
+    with FakeDVR(channels=4, no_video=(2,)).run_in_thread() as first, \
+            FakeDVR(channels=2).run_in_thread() as second:
+        devices = [
+            {'ip': '127.0.0.1', 'port': dvr.port, 'username': 'admin', 'password': 'admin'}
+            for dvr in (first, second)
+        ] + [{'ip': '127.0.0.1', 'port': 1, 'username': 'admin', 'password': 'admin'}]
+        sweep = ShardedSweep(devices, shards=2, timeout=2, deadline=5, fields=('status', 'channels'),
+                             health_state=str(tmp_path / 'health.json'))
+        results = {result['port']: result for result in sweep}
+
+    assert set(results) == {first.port, second.port, 1}
+    assert results[first.port]['cameraInfo']['cameraStatus'][1] == {'number': '2', 'status': 'Not Working'}
+    assert results[second.port]['cameraInfo']['totalCameras'] == 2
+    assert results[1]['status'] == 'ERROR'
+    assert sweep.failures == {}
+    assert sum(stats.devices for stats in sweep.stats) == 3
+    assert sum(stats.errors for stats in sweep.stats) == 1
+    assert {stats.shard for stats in sweep.stats} == {shard_of(device, 2) for device in devices}
+    for stats in sweep.stats:
+        assert (tmp_path / f"health.json.shard{stats.shard}").exists()
+
+
+def test_crashed_shard_still_reports_its_devices():
+    devices = [{'ip': f'10.0.0.{number}', 'port': 80, 'username': 'admin', 'password': 'admin'}
+               for number in range(1, 5)]
+    # An option poll_fleet does not take makes every worker fail
+    sweep = ShardedSweep(devices, shards=2, no_such_option=True)
+    results = list(sweep)
+
+    assert sorted(result['ip'] for result in results) == [device['ip'] for device in devices]
+    assert all(result['status'] == 'ERROR' for result in results)
+    assert all(result['error'].startswith('Shard ') and 'no_such_option' in result['error'] for result in results)
+    assert set(sweep.failures) == {shard_of(device, 2) for device in devices}
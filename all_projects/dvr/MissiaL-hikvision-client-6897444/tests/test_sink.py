@@ -0,0 +1,138 @@
+import os
+
+import pytest
+
+from hikvisionapi.sink import COLUMNS, UPSERT, ResultSink, copy_text, result_row
+from hikvisionapi.snapshot import empty_result
+
+
+class FakeDatabase:
+    """DB-API stand-in recording COPY payloads and INSERT statements"""
+
+    def __init__(self):
+        self.up = True
+        self.rows = []
+        self.statements = []
+
+    def connect(self):
+        if not self.up:
+            raise OSError("connection refused")
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.pending = []
+
+    def cursor(self):
+        return self
+
+    def copy_expert(self, sql, fd):
+        if not self.db.up:
+            raise OSError("server closed the connection")
+        self.db.statements.append(sql)
+        self.pending.extend(line.split('\t') for line in fd.getvalue().splitlines())
+
+    def execute(self, sql, params):
+        self.db.statements.append(sql)
+        width = len(COLUMNS)
+        self.pending.extend(params[i:i + width] for i in range(0, len(params), width))
+
+    def commit(self):
+        self.db.rows.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+def result(ip, status='ONLINE'):
+    value = empty_result(status)
+    value['ip'] = ip
+    value['port'] = 80
+    value['cameraInfo']['cameraStatus'] = [{'number': '2', 'status': 'Not Working'}]
+    return value
+
+
+def test_result_row_matches_the_activity_table():
+    row = result_row(result('10.0.0.1'))
+    assert len(row) == len(COLUMNS)
+    assert row[:2] == ('10.0.0.1', 'ONLINE')
+    assert row[COLUMNS.index('dvr_time')] is None
+    assert row[COLUMNS.index('cam2_status')] == 'Not Working'
+    # A channel without a usable number is left out, not raised from put()
+    bad = result('10.0.0.2')
+    bad['cameraInfo']['cameraStatus'] += [{'number': 'D1', 'status': 'Working'}, {'status': 'Working'}]
+    assert result_row(bad) == result_row(result('10.0.0.2'))
+    assert copy_text([('a\tb', None, 3)]) == 'a\\tb\t\\N\t3\n'
+
+
+def test_copy_batches():
+    db = FakeDatabase()
+    with ResultSink(db.connect, batch_size=2, max_latency=60) as sink:
+        for number in range(5):
+            sink.put(result(f"10.0.0.{number}"))
+        assert sink.flush(timeout=5)
+    assert [row[0] for row in db.rows] == [f"10.0.0.{number}" for number in range(5)]
+    assert db.statements[0].startswith('COPY dvr_activity (ip_address, status,')
+    assert sink.stats['batches'] == 3
+
+
+def test_copy_falls_back_to_insert_without_copy_expert():
+    class InsertOnlyConnection(FakeConnection):
+        copy_expert = property()  # hasattr() is False, like a psycopg 3 cursor
+
+    db = FakeDatabase()
+    with ResultSink(lambda: InsertOnlyConnection(db), max_latency=60, page_size=2) as sink:
+        for number in range(3):
+            sink.put(result(f"10.0.0.{number}"))
+    assert [row[0] for row in db.rows] == [f"10.0.0.{number}" for number in range(3)]
+    assert len(db.statements) == 2
+    assert db.statements[0].startswith('INSERT INTO dvr_activity (ip_address, status,')
+    assert 'ON CONFLICT' not in db.statements[0]
+
+
+def test_upsert_keeps_the_latest_row_per_device():
+    db = FakeDatabase()
+    with ResultSink(db.connect, mode=UPSERT, batch_size=10, max_latency=60) as sink:
+        sink.put(result('10.0.0.1', 'ONLINE'))
+        sink.put(result('10.0.0.2'))
+        sink.put(result('10.0.0.1', 'NO NETWORK'))
+    assert 'ON CONFLICT (ip_address) DO UPDATE SET status = EXCLUDED.status' in db.statements[0]
+    assert sorted((row[0], row[1]) for row in db.rows) == [('10.0.0.1', 'NO NETWORK'), ('10.0.0.2', 'ONLINE')]
+
+
+def test_outage_is_spooled_and_replayed(tmp_path):
+    db = FakeDatabase()
+    db.up = False
+    with ResultSink(db.connect, batch_size=2, max_latency=60, retries=2, retry_delay=0.01,
+                    spool_dir=str(tmp_path)) as sink:
+        sink.put(result('10.0.0.1'))
+        sink.put(result('10.0.0.2'))
+        assert sink.flush(timeout=5)
+        assert len(sink.spooled_files()) == 1
+        db.up = True
+        sink.put(result('10.0.0.3'))
+        assert sink.flush(timeout=5)
+    assert sorted(row[0] for row in db.rows) == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    assert sink.stats['retries'] == 1
+    assert (sink.stats['spooled'], sink.stats['replayed']) == (2, 2)
+    assert os.listdir(tmp_path) == []
+
+
+def test_full_buffer_blocks_producers():
+    db = FakeDatabase()
+    db.up = False
+    sink = ResultSink(db.connect, batch_size=1, max_pending=2, retries=1, retry_delay=0.01)
+    sink.put(result('10.0.0.1'))
+    sink.put(result('10.0.0.2'))
+    with pytest.raises(TimeoutError):
+        sink.put(result('10.0.0.3'), timeout=0.1)
+    db.up = True
+    assert sink.flush(timeout=5)
+    sink.close()
+    assert len(db.rows) == 2
@@ -0,0 +1,116 @@
+import asyncio
+import os
+
+import httpx
+
+import hikvisionapi
+from hikvisionapi.authcache import AuthCache
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'isapi')
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as fd:
+        return fd.read()
+
+
+def search_result(spans, more=False):
+    items = ''.join(
+        f'<searchMatchItem><trackID>101</trackID><timeSpan><startTime>{start}</startTime>'
+        f'<endTime>{end}</endTime></timeSpan></searchMatchItem>'
+        for start, end in spans
+    )
+    return (
+        '<CMSearchResult version="2.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">'
+        f'<responseStatus>true</responseStatus><responseStatusStrg>{"MORE" if more else "OK"}</responseStatusStrg>'
+        f'<numOfMatches>{len(spans)}</numOfMatches><matchList>{items}</matchList></CMSearchResult>'
+    )
+
+
+def handler(request):
+    path = request.url.path
+    if path.endswith('System/status'):
+        return httpx.Response(200, text='<DeviceStatus><status>ok</status></DeviceStatus>')
+    if path.endswith('System/time'):
+        return httpx.Response(500)
+    if path.endswith('System/Video/inputs/channels'):
+        return httpx.Response(200, content=load('channels.xml'))
+    if path.endswith('ContentMgmt/Storage'):
+        return httpx.Response(200, content=load('storage.xml'))
+    if path.endswith('ContentMgmt/search'):
+        body = request.content.decode()
+        if '<maxResults>1</maxResults>' in body:
+            return httpx.Response(200, text=search_result([('2024-01-01T00:00:00Z', '2024-01-01T01:00:00Z')]))
+        if '<searchResultPostion>0</searchResultPostion>' in body:
+            return httpx.Response(200, text=search_result([('2024-02-01T00:00:00Z', '2024-02-01T01:00:00Z')], more=True))
+        return httpx.Response(200, text=search_result([('2024-02-01T01:00:00Z', '2024-02-01T01:30:00Z')]))
+    return httpx.Response(404)
+
+
+def test_snapshot_collects_fields_and_keeps_partial_failures():
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as pool:
+            cam = hikvisionapi.AsyncClient('http://10.0.0.1', 'admin', 'pw', http_client=pool, auth_cache=AuthCache())
+            return await cam.health_snapshot()
+
+    snapshot = asyncio.run(run())
+    assert snapshot.online
+    assert set(snapshot.errors()) == {'time'}
+    assert len(snapshot.channels.value) == 16
+    assert [c.id for c in snapshot.channels.value if not c.working] == ['5', '11', '16']
+    assert [h.capacity_mb for h in snapshot.storage.value] == [1907729, 3815447]
+    assert snapshot.recording.value == ('2024-01-01T00:00:00Z', '2024-02-01T01:30:00Z')
+    assert all(elapsed >= 0 for elapsed in snapshot.timings().values())
+
+    legacy = snapshot.as_legacy_dict()
+    assert legacy['status'] == 'ONLINE'
+    assert legacy['deviceInfo']['dvrTime'] == ''
+    assert legacy['cameraInfo']['totalCameras'] == 16
+    assert legacy['cameraInfo']['cameraStatus'][4] == {'number': '5', 'status': 'Not Working'}
+    assert legacy['storageInfo'] == {
+        'storageType': 'SATA',
+        'storageStatus': 'Working',
+        'storageCapacity': '5589.04 GB',
+        'storageFree': '1.0 GB',
+    }
+    assert legacy['recordingInfo'] == {'recordingFrom': '2024-01-01T00:00:00Z', 'recordingTo': '2024-02-01T01:30:00Z'}
+
+
+def test_snapshot_reports_an_unreachable_device_as_error():
+    def refuse(request):
+        raise httpx.ConnectError('Connection refused', request=request)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(refuse)) as pool:
+            cam = hikvisionapi.AsyncClient('http://10.0.0.1', 'admin', 'pw', http_client=pool, auth_cache=AuthCache())
+            return await cam.health_snapshot(('status', 'channels'))
+
+    snapshot = asyncio.run(run())
+    assert not snapshot.online
+    assert snapshot.storage.error == 'skipped'
+    legacy = snapshot.as_legacy_dict()
+    assert legacy['status'] == 'ERROR'
+    assert legacy['error'] == 'Connection refused'
+
+
+def test_fields_without_status_are_judged_by_the_other_fields():
+    from hikvisionapi.fakedvr import FakeDVR
+
+    def refuse(request):
+        raise httpx.ConnectError('Connection refused', request=request)
+
+    async def run(url):
+        async with httpx.AsyncClient(transport=httpx.MockTransport(refuse)) as pool:
+            dead = hikvisionapi.AsyncClient('http://10.0.0.1', 'admin', 'pw', http_client=pool, auth_cache=AuthCache())
+            down = await dead.health_snapshot(('time', 'channels'))
+        async with hikvisionapi.AsyncClient(url, 'admin', 'admin', auth_cache=AuthCache()) as cam:
+            return down, await cam.health_snapshot(('time', 'channels'))
+
+    with FakeDVR(channels=2).run_in_thread() as dvr:
+        down, up = asyncio.run(run(dvr.url))
+    assert up.status.error == 'skipped'
+    legacy = up.as_legacy_dict()
+    assert legacy['status'] == 'ONLINE'
+    assert legacy['cameraInfo']['totalCameras'] == 2
+    assert down.as_legacy_dict()['status'] == 'ERROR'
+    assert down.as_legacy_dict()['error'] == 'Connection refused'
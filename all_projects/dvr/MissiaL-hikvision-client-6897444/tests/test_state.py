@@ -0,0 +1,85 @@
+import copy
+import time
+
+from hikvisionapi.channels import ChannelStatus
+from hikvisionapi.snapshot import FieldResult, _result, empty_result
+from hikvisionapi.state import CAMERA, DRIFT, STATUS, STORAGE, FleetState, clock_drift
+
+
+def result(cameras=('Working', 'Working'), dvr_time='2024-05-01T10:00:30', storage='Working'):
+    value = empty_result()
+    value.update(ip='10.0.0.5', port=80)
+    value['deviceInfo'].update(dvrTime=dvr_time, currentDateTime='2024-05-01 10:00:00')
+    value['cameraInfo'] = {
+        'totalCameras': len(cameras),
+        'cameraStatus': [{'number': str(n), 'status': s} for n, s in enumerate(cameras, 1)],
+    }
+    value['storageInfo']['storageStatus'] = storage
+    return value
+
+
+def kinds(changes):
+    return [(change.kind, change.channel, change.old, change.new) for change in changes]
+
+
+def test_first_result_reports_the_initial_state():
+    state = FleetState()
+    changes = state.apply(result(cameras=('Working', 'Not Working')), at=1.0)
+    assert kinds(changes) == [
+        (STATUS, None, None, 'ONLINE'),
+        (STORAGE, None, None, 'Working'),
+        (CAMERA, 1, None, 'Working'),
+        (CAMERA, 2, None, 'Not Working'),
+    ]
+    device = state.get('10.0.0.5:80')
+    assert device.id == changes[0].device == state.id_for('http://10.0.0.5')
+    assert device.down_cameras() == [2]
+    assert device.drift == 30.0
+    assert state.apply(result(cameras=('Working', 'Not Working'))) == []
+
+
+def test_only_changes_are_emitted():
+    state = FleetState(drift_threshold=120)
+    state.apply(result())
+
+    assert kinds(state.apply(result(cameras=('Working', 'Not Working')))) == [(CAMERA, 2, 'Working', 'Not Working')]
+    assert kinds(state.apply(result(cameras=('Working', 'Not Working'), dvr_time='2024-05-01T10:05:00'))) == [
+        (DRIFT, None, 30.0, 300.0)
+    ]
+    assert kinds(state.apply(result(storage='Not Working', dvr_time='2024-05-01T10:05:00'))) == [
+        (STORAGE, None, 'Working', 'Not Working'),
+        (CAMERA, 2, 'Not Working', 'Working'),
+    ]
+    # Channels added or removed by a firmware or config change
+    assert kinds(state.apply(result(cameras=('Working',), storage='Not Working', dvr_time='2024-05-01T10:05:00'))) \
+        == [(CAMERA, 2, 'Working', None)]
+
+
+def test_offline_device_keeps_its_last_known_cameras():
+    state = FleetState()
+    online = result()
+    state.apply(online)
+    offline = empty_result('NO NETWORK', 'timeout')
+    offline.update(ip='10.0.0.5', port=80)
+    assert kinds(state.apply(offline)) == [(STATUS, None, 'ONLINE', 'NO NETWORK')]
+    assert state.get('10.0.0.5:80').camera(1) == 'Working'
+    assert kinds(state.apply(copy.deepcopy(online))) == [(STATUS, None, 'NO NETWORK', 'ONLINE')]
+    assert state.camera_count == 2
+
+
+def test_unnumbered_channels_are_skipped():
+    state = FleetState()
+    value = result()
+    value['cameraInfo']['cameraStatus'] += [{'number': 'D1', 'status': 'Working'}, {'status': 'Not Working'}]
+    assert [change.channel for change in state.apply(value) if change.kind == CAMERA] == [1, 2]
+
+    channels = [ChannelStatus('1', None, 'analog', 'online'), ChannelStatus('D1', None, 'ip', 'offline')]
+    snapshot = _result('10.0.0.6:80', {'status': FieldResult({}, 0.01), 'channels': FieldResult(channels, 0.01)},
+                       time.perf_counter())
+    assert [(change.channel, change.new) for change in state.apply_snapshot(snapshot) if change.kind == CAMERA] \
+        == [(1, 'Working')]
+
+
+def test_clock_drift_with_utc_offset():
+    assert clock_drift('2024-05-01T10:00:00+00:00', '2024-05-01T09:59:00+00:00') == 60.0
+    assert clock_drift('not a time') is None
@@ -1,11 +1,58 @@
 import inspect
 import json
-from urllib.parse import urljoin
+import os
+import tempfile
+import time
+from urllib.parse import urljoin, urlsplit
 import requests
 from requests.auth import HTTPBasicAuth, HTTPDigestAuth
 import xmltodict
 import sys
 
+# Remember which auth scheme each device accepted, so the next invocation
+# for the same host:port skips the probe requests
+AUTH_CACHE_PATH = os.environ.get(
+    'HIKVISION_AUTH_CACHE', os.path.join(tempfile.gettempdir(), 'hikvision_auth_cache.json'))
+AUTH_CACHE_TTL = int(os.environ.get('HIKVISION_AUTH_CACHE_TTL', 24 * 3600))
+
+def _auth_cache_key(host):
+    parts = urlsplit(host)
+    return f"{parts.hostname}:{parts.port or 80}"
+
+def _load_auth_cache():
+    try:
+        with open(AUTH_CACHE_PATH, 'r', encoding='utf-8') as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+def _store_auth_cache(cache):
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(AUTH_CACHE_PATH), prefix='.hikauth')
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+            json.dump(cache, tmp)
+        os.replace(tmp_path, AUTH_CACHE_PATH)
+    except OSError:
+        pass
+
+def get_cached_auth_type(host, login):
+    entry = _load_auth_cache().get(_auth_cache_key(host))
+    if entry and entry.get('login') == login and entry.get('expires', 0) > time.time():
+        return entry.get('auth_type')
+    return None
+
+def set_cached_auth_type(host, login, auth_type):
+    cache = _load_auth_cache()
+    now = time.time()
+    cache = {key: entry for key, entry in cache.items() if entry.get('expires', 0) > now}
+    cache[_auth_cache_key(host)] = {'login': login, 'auth_type': auth_type, 'expires': now + AUTH_CACHE_TTL}
+    _store_auth_cache(cache)
+
+def forget_cached_auth_type(host):
+    cache = _load_auth_cache()
+    if cache.pop(_auth_cache_key(host), None) is not None:
+        _store_auth_cache(cache)
+
 class DynamicMethod(object):
     def __init__(self, client, path):
         self.client = client
@@ -57,6 +104,15 @@ class Client:
     def _check_session(self):
         full_url = urljoin(self.host, self.isapi_prefix + '/System/status')
         session = requests.session()
+
+        # Reuse the scheme that worked last time without probing
+        cached_auth_type = get_cached_auth_type(self.host, self.login)
+        if cached_auth_type == 'digest':
+            session.auth = HTTPDigestAuth(self.login, self.password)
+            return session
+        if cached_auth_type in ('basic', 'basic_with_header'):
+            session.auth = HTTPBasicAuth(self.login, self.password)
+            return session
         
         # Try different authentication methods
         auth_methods = [
@@ -79,6 +135,7 @@ class Client:
                 
                 if response.status_code == 200:
                     print(f"Successfully connected using {auth_type} authentication", file=sys.stderr)
+                    set_cached_auth_type(self.host, self.login, auth_type)
                     return session
                 
                 last_error = f"HTTP {response.status_code}: {response.text}"
@@ -106,6 +163,11 @@ class Client:
 
     def common_request(self, method, full_url, **data):
         response = self.req.request(method, full_url, timeout=self.timeout, verify=False, **data)
+        if response.status_code == 401:
+            # The cached scheme is stale, probe the device again
+            forget_cached_auth_type(self.host)
+            self.req = self._check_session()
+            response = self.req.request(method, full_url, timeout=self.timeout, verify=False, **data)
         response.raise_for_status()
         return response
 
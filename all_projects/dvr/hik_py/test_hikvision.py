@@ -15,7 +15,7 @@ def get_hikvision_data(ip, port, username, password):
         
         # Basic connectivity test
         try:
-            status = cam.System.status(method='get', present='text')
+            status = cam.System.status(method='get', present='text').text
             if '<status>' not in status:
                 raise Exception("Invalid status response")
         except Exception as e:
@@ -27,11 +27,8 @@ def get_hikvision_data(ip, port, username, password):
         try:
             # Try direct HTTP request to a basic endpoint
             url = f'http://{ip}:{port}/ISAPI/System/time'
-            response = requests.get(url, 
-                auth=requests.auth.HTTPDigestAuth(username, password),
-                verify=False,
-                timeout=5
-            )
+            # Reuse the authenticated session: same connection, no new digest handshake
+            response = cam.req.get(url, verify=False, timeout=5)
             if response.status_code == 200 and '<localTime>' in response.text:
                 import re
                 match = re.search(r'<localTime>(.*?)</localTime>', response.text)
@@ -67,11 +64,8 @@ def get_hikvision_data(ip, port, username, password):
         # Try to get basic camera count
         try:
             url = f'http://{ip}:{port}/ISAPI/System/Video/inputs/channels'
-            response = requests.get(url, 
-                auth=requests.auth.HTTPDigestAuth(username, password),
-                verify=False,
-                timeout=5
-            )
+            # Reuse the authenticated session: same connection, no new digest handshake
+            response = cam.req.get(url, verify=False, timeout=5)
             if response.status_code == 200:
                 # Count camera tags in response
                 camera_count = response.text.count('<VideoInputChannel>')
@@ -0,0 +1,253 @@
+"""
+Bulk product updater for the WooCommerce REST API
+
+Replaces the browser loop in "yn - Copy.py", which searched the admin list,
+opened the editor and clicked Publish once per SKU. This script streams the
+same UTF-16 catalogue CSV in chunks of BATCH_SIZE rows. For every chunk it
+resolves all SKUs with one products?sku=... request and sends the new names
+and descriptions in one products/batch request. A few chunks run at once,
+and transient failures (timeouts, 429, 5xx) are retried with backoff.
+Finished chunks are written to a checkpoint file, so an interrupted run picks
+up where it stopped. A chunk with a failed product, or one whose requests
+gave up, is not finished and is sent again by the next run.
+
+Create a REST key under WooCommerce > Settings > Advanced > REST API (read/write).
+
+Examples:
+  python bulk_update.py products.csv --key ck_... --secret cs_...
+  python bulk_update.py products.csv --url http://127.0.0.1:8099 --key ck --secret cs   (see stub_woocommerce.py)
+  python bulk_update.py products.csv --dry-run
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+# Configuration
+CSV_PATH = r'C:\Users\Aniruddh\Desktop\yn_update_product_info.csv'
+WEBSITE_URL = 'https://yosshitaneha.com'
+API_PATH = '/wp-json/wc/v3/'
+CONSUMER_KEY = os.environ.get('WC_CONSUMER_KEY', '')
+CONSUMER_SECRET = os.environ.get('WC_CONSUMER_SECRET', '')
+
+# Columns in your CSV (0-based index)
+PRODUCT_NAME_COL = 2  # Column C
+SKU_COL = 3           # Column D
+DESCRIPTION_COL = 8   # Column I
+
+BATCH_SIZE = 100  # WooCommerce caps both per_page and products/batch at 100
+CONCURRENCY = 4  # Chunks in flight at once
+RETRIES = 5  # Attempts per request for timeouts, 429 and 5xx
+TIMEOUT = 60  # Seconds per request
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def read_chunks(path, batch_size, encoding='utf-16'):
+    """Yield (index, rows) chunks of {'sku', 'name', 'description'} without loading the whole file"""
+    with open(path, 'r', encoding=encoding, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)  # Skip header row
+        chunk = []
+        index = 0
+        for row in reader:
+            if len(row) <= max(PRODUCT_NAME_COL, SKU_COL, DESCRIPTION_COL):
+                continue  # Skip incomplete rows
+            sku = row[SKU_COL].strip()
+            if not sku:
+                continue  # Skip rows with empty SKU
+            chunk.append({
+                'sku': sku,
+                'name': row[PRODUCT_NAME_COL].strip(),
+                'description': row[DESCRIPTION_COL].strip(),
+            })
+            if len(chunk) == batch_size:
+                yield index, chunk
+                index += 1
+                chunk = []
+        if chunk:
+            yield index, chunk
+
+
+class Checkpoint:
+    """Indexes of finished chunks and errors of failed ones, saved atomically after every chunk"""
+
+    def __init__(self, path, csv_path, batch_size):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {'csv': os.path.abspath(csv_path), 'batch_size': batch_size, 'done': [], 'failed': {}}
+        if path and os.path.exists(path):
+            with open(path) as fd:
+                saved = json.load(fd)
+            if saved.get('csv') != self.state['csv'] or saved.get('batch_size') != batch_size:
+                raise SystemExit(f"{path} belongs to another CSV or batch size, remove it to start over")
+            self.state = saved
+            if not isinstance(saved.get('failed'), dict):
+                saved['failed'] = {}  # Written before failed chunks were retried
+        self.done = set(self.state['done'])
+
+    def finish(self, index, failed):
+        """Record a chunk, it is only done when none of its products failed"""
+        with self.lock:
+            if failed:
+                self.done.discard(index)
+                self.state['failed'][str(index)] = failed
+            else:
+                self.done.add(index)
+                self.state['failed'].pop(str(index), None)
+            self.state['done'] = sorted(self.done)
+            if not self.path:
+                return
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+            with os.fdopen(fd, 'w') as out:
+                json.dump(self.state, out)
+            os.replace(tmp, self.path)
+
+
+class WooCommerce:
+    """Minimal WooCommerce REST client with retries"""
+
+    def __init__(self, url, key, secret, timeout=TIMEOUT, retries=RETRIES):
+        self.base = url.rstrip('/') + API_PATH
+        self.auth = (key, secret)
+        self.timeout = timeout
+        self.retries = retries
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        # requests.Session is not thread-safe, one per worker keeps its connection alive
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+            self.local.session.auth = self.auth
+        return self.local.session
+
+    def request(self, method, path, **kwargs):
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self.session.request(method, self.base + path, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                delay = None
+                reason = str(e) or type(e).__name__
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    response.raise_for_status()
+                    return response.json()
+                delay = response.headers.get('Retry-After')
+                reason = f"HTTP {response.status_code}"
+            # Full jitter, unless the server said how long to wait
+            delay = float(delay) if delay and delay.isdigit() else random.uniform(0, min(30, 2 ** attempt))
+            print(f"{method} {path}: {reason}, retry {attempt}/{self.retries - 1} in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+
+    def resolve(self, skus):
+        """Map SKUs to product ids with one search request"""
+        found = self.request('GET', 'products', params={
+            'sku': ','.join(skus), 'per_page': len(skus), '_fields': 'id,sku',
+        })
+        return {product['sku']: product['id'] for product in found}
+
+    def update(self, updates):
+        return self.request('POST', 'products/batch', json={'update': updates})
+
+
+def process_chunk(api, rows, dry_run=False):
+    """Resolve and update one chunk, return (updated, missing SKUs, failed SKUs)"""
+    # A SKU listed twice takes the last row, like the browser loop did
+    rows = list({row['sku']: row for row in rows}.values())
+    ids = api.resolve([row['sku'] for row in rows])
+    missing = [row['sku'] for row in rows if row['sku'] not in ids]
+    updates = [
+        {'id': ids[row['sku']], 'name': row['name'], 'description': row['description']}
+        for row in rows if row['sku'] in ids
+    ]
+    if dry_run or not updates:
+        return len(updates), missing, []
+    skus = {ids[row['sku']]: row['sku'] for row in rows if row['sku'] in ids}
+    result = api.update(updates)
+    failed = [
+        f"{skus.get(item.get('id'), item.get('id'))}: {item['error'].get('message', item['error'])}"
+        for item in result.get('update', []) if item.get('error')
+    ]
+    return len(updates) - len(failed), missing, failed
+
+
+def run(args):
+    api = WooCommerce(args.url, args.key, args.secret, args.timeout, args.retries)
+    checkpoint = Checkpoint(None if args.dry_run else args.checkpoint, args.csv, args.batch_size)
+    totals = {'updated': 0, 'missing': 0, 'failed': 0}
+    started = time.monotonic()
+
+    def report(future, index, size):
+        try:
+            updated, missing, failed = future.result()
+        except Exception as e:
+            # One chunk giving up must not stop the others, the next run retries it
+            totals['failed'] += size
+            checkpoint.finish(index, [f"chunk {index}: {e}"])
+            print(f"chunk {index}: {size} failed, {e}", file=sys.stderr, flush=True)
+            return
+        totals['updated'] += updated
+        totals['missing'] += len(missing)
+        totals['failed'] += len(failed)
+        for sku in missing:
+            print(f"Product with SKU {sku} not found", file=sys.stderr)
+        for line in failed:
+            print(f"Failed to update product with SKU {line}", file=sys.stderr)
+        checkpoint.finish(index, failed)
+        elapsed = time.monotonic() - started
+        print(f"chunk {index}: {updated} updated, {len(missing)} not found, {len(failed)} failed  "
+              f"(total {totals['updated']} in {elapsed:.0f}s)", flush=True)
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for index, rows in read_chunks(args.csv, args.batch_size, args.encoding):
+            if index in checkpoint.done:
+                continue
+            # Keep only a few chunks queued so the CSV is read as it is sent
+            while len(pending) >= args.concurrency * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    report(future, *pending.pop(future))
+            pending[executor.submit(process_chunk, api, rows, args.dry_run)] = index, len(rows)
+        for future, (index, size) in pending.items():
+            report(future, index, size)
+
+    print(f"Done in {time.monotonic() - started:.0f}s: {totals['updated']} updated, "
+          f"{totals['missing']} not found, {totals['failed']} failed")
+    return 1 if totals['failed'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Update WooCommerce product names and descriptions from a CSV')
+    parser.add_argument('csv', nargs='?', default=CSV_PATH)
+    parser.add_argument('--url', default=WEBSITE_URL, help='Shop URL, without /wp-json')
+    parser.add_argument('--key', default=CONSUMER_KEY, help='REST consumer key (or WC_CONSUMER_KEY)')
+    parser.add_argument('--secret', default=CONSUMER_SECRET, help='REST consumer secret (or WC_CONSUMER_SECRET)')
+    parser.add_argument('--encoding', default='utf-16')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--retries', type=int, default=RETRIES)
+    parser.add_argument('--timeout', type=float, default=TIMEOUT)
+    parser.add_argument('--checkpoint', default=None, help='Defaults to <csv>.checkpoint.json')
+    parser.add_argument('--dry-run', action='store_true', help='Resolve SKUs and report, change nothing')
+    args = parser.parse_args(argv)
+    if not args.key or not args.secret:
+        parser.error('--key and --secret (or WC_CONSUMER_KEY and WC_CONSUMER_SECRET) are required')
+    if not 1 <= args.batch_size <= 100:
+        parser.error('--batch-size must be between 1 and 100')
+    args.checkpoint = args.checkpoint or args.csv + '.checkpoint.json'
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
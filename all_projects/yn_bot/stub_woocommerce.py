@@ -0,0 +1,171 @@
+"""
+Local stand-in for the WooCommerce REST endpoints bulk_update.py uses
+
+Serves GET /wp-json/wc/v3/products?sku=a,b,c and POST
+/wp-json/wc/v3/products/batch from an in-memory catalogue, with optional
+latency and injected 429/503 responses to exercise the retries. On exit it
+prints the number of requests and updated products.
+
+Examples:
+  python stub_woocommerce.py --products 5000 --port 8099
+  python stub_woocommerce.py --skus products.csv --error-rate 0.1 --latency 0.2
+  python stub_woocommerce.py --write-csv sample.csv --products 2000   (a UTF-16 CSV to feed bulk_update.py)
+"""
+import argparse
+import csv
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PATH = '/wp-json/wc/v3/'
+PORT = 8099
+
+
+class Catalogue:
+    def __init__(self, skus, latency=0.0, error_rate=0.0, seed=None):
+        self.lock = threading.Lock()
+        self.products = {number: {'id': number, 'sku': sku, 'name': '', 'description': ''}
+                         for number, sku in enumerate(skus, 1)}
+        self.by_sku = {product['sku']: product for product in self.products.values()}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'searches': 0, 'batches': 0, 'updated': 0, 'injected_errors': 0}
+
+
+class Handler(BaseHTTPRequestHandler):
+    catalogue = None
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def check(self):
+        """Apply latency and injected errors, return the API route or None if already answered"""
+        catalogue = self.catalogue
+        with catalogue.lock:
+            catalogue.stats['requests'] += 1
+            fail = catalogue.random.random() < catalogue.error_rate
+            if fail:
+                catalogue.stats['injected_errors'] += 1
+        if catalogue.latency:
+            time.sleep(catalogue.latency)
+        if self.headers.get('Authorization', '').split(' ')[0] != 'Basic':
+            self.reply(401, {'code': 'woocommerce_rest_cannot_view', 'message': 'Sorry, you cannot list resources.'})
+            return None
+        if fail:
+            if catalogue.random.random() < 0.5:
+                self.reply(429, {'code': 'too_many_requests'}, [('Retry-After', '1')])
+            else:
+                self.reply(503, {'code': 'unavailable'})
+            return None
+        url = urlparse(self.path)
+        if not url.path.startswith(API_PATH):
+            self.reply(404, {'code': 'rest_no_route'})
+            return None
+        return url
+
+    def do_GET(self):
+        url = self.check()
+        if url is None:
+            return
+        if url.path != API_PATH + 'products':
+            return self.reply(404, {'code': 'rest_no_route'})
+        query = parse_qs(url.query)
+        skus = ','.join(query.get('sku', [''])).split(',')
+        per_page = min(int(query.get('per_page', ['10'])[0]), 100)
+        with self.catalogue.lock:
+            self.catalogue.stats['searches'] += 1
+            found = [self.catalogue.by_sku[sku] for sku in skus if sku in self.catalogue.by_sku][:per_page]
+            self.reply(200, [{'id': product['id'], 'sku': product['sku']} for product in found])
+
+    def do_POST(self):
+        url = self.check()
+        if url is None:
+            return
+        if url.path != API_PATH + 'products/batch':
+            return self.reply(404, {'code': 'rest_no_route'})
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        updates = body.get('update', [])
+        if len(updates) > 100:
+            return self.reply(413, {'code': 'woocommerce_rest_request_entity_too_large',
+                                    'message': 'Unable to accept more than 100 items for this request.'})
+        results = []
+        with self.catalogue.lock:
+            self.catalogue.stats['batches'] += 1
+            for update in updates:
+                product = self.catalogue.products.get(update.get('id'))
+                if product is None:
+                    results.append({'id': update.get('id'), 'error': {
+                        'code': 'woocommerce_rest_product_invalid_id', 'message': 'Invalid ID.'}})
+                    continue
+                product.update({name: value for name, value in update.items() if name in ('name', 'description')})
+                self.catalogue.stats['updated'] += 1
+                results.append(dict(product))
+        self.reply(200, {'update': results})
+
+
+def serve(catalogue, port=PORT, host='127.0.0.1'):
+    """Start the stub in a thread and return the server, call server.shutdown() to stop it"""
+    handler = type('BoundHandler', (Handler,), {'catalogue': catalogue})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_csv(path, count):
+    """Write a UTF-16 catalogue CSV with the columns bulk_update.py reads"""
+    with open(path, 'w', encoding='utf-16', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(['ID', 'Type', 'Name', 'SKU', 'Published', 'Featured', 'Visibility', 'Short description',
+                         'Description'])
+        for number in range(1, count + 1):
+            writer.writerow([number, 'simple', f'Saree {number}', f'YN-{number:05d}', 1, 0, 'visible', '',
+                             f'Pure silk saree, design {number}, with "zari" border'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WooCommerce REST stub for bulk_update.py')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--products', type=int, default=1000, help='Catalogue of SKUs YN-00001 ...')
+    parser.add_argument('--skus', help='Take the SKUs from this UTF-16 CSV instead')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered 429 or 503')
+    parser.add_argument('--write-csv', help='Write a sample CSV for --products and exit')
+    args = parser.parse_args()
+
+    if args.write_csv:
+        write_csv(args.write_csv, args.products)
+        return
+    if args.skus:
+        from bulk_update import read_chunks
+        skus = [row['sku'] for _, rows in read_chunks(args.skus, 100) for row in rows]
+    else:
+        skus = [f'YN-{number:05d}' for number in range(1, args.products + 1)]
+    catalogue = Catalogue(skus, args.latency, args.error_rate)
+    server = serve(catalogue, args.port)
+    print(f"Serving {len(skus)} products on http://127.0.0.1:{args.port}{API_PATH}, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    print(json.dumps(catalogue.stats))
+
+
+if __name__ == '__main__':
+    main()
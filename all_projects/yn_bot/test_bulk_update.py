@@ -0,0 +1,60 @@
+"""
+Runs bulk_update.py against stub_woocommerce.py
+
+    python -m pytest test_bulk_update.py
+"""
+import json
+import time
+import types
+
+import bulk_update
+from stub_woocommerce import Catalogue, serve, write_csv
+
+
+def test_update_batches_retries_and_resumes(tmp_path, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(bulk_update, 'time', types.SimpleNamespace(sleep=sleeps.append, monotonic=time.monotonic))
+    csv_path = str(tmp_path / 'products.csv')
+    checkpoint = csv_path + '.checkpoint.json'
+    write_csv(csv_path, 250)
+    catalogue = Catalogue([f'YN-{number:05d}' for number in range(1, 251)], seed=1)
+    server = serve(catalogue, port=0)
+    argv = [csv_path, '--url', f'http://127.0.0.1:{server.server_address[1]}', '--key', 'ck', '--secret', 'cs',
+            '--concurrency', '2', '--retries', '10']
+    try:
+        # The shop is down: every chunk gives up, none stops the others
+        catalogue.error_rate = 1.0
+        assert bulk_update.main(argv[:-1] + ['2']) == 1
+        with open(checkpoint) as fd:
+            assert json.load(fd)['done'] == []
+        assert catalogue.stats['requests'] == 3 * 2
+
+        # Injected 429 and 503 are retried, the 429 after its Retry-After
+        catalogue.error_rate = 0.3
+        deleted = catalogue.products.pop(150)
+        assert bulk_update.main(argv) == 1
+        assert 1.0 in sleeps
+        assert catalogue.stats['searches'] == 3
+        assert catalogue.stats['batches'] == 3
+        assert catalogue.stats['updated'] == 249
+        assert catalogue.products[1]['name'] == 'Saree 1'
+        assert catalogue.products[250]['description'] == 'Pure silk saree, design 250, with "zari" border'
+        with open(checkpoint) as fd:
+            state = json.load(fd)
+        # The chunk with the failed product is not done
+        assert state['done'] == [0, 2]
+        assert list(state['failed']) == ['1']
+        assert state['failed']['1'][0].startswith('YN-00150: Invalid ID')
+
+        # The next run sends only that chunk
+        catalogue.error_rate = 0.0
+        catalogue.products[150] = deleted
+        assert bulk_update.main(argv) == 0
+        assert catalogue.stats['batches'] == 4
+        assert catalogue.products[150]['name'] == 'Saree 150'
+        with open(checkpoint) as fd:
+            state = json.load(fd)
+        assert state['done'] == [0, 1, 2]
+        assert state['failed'] == {}
+    finally:
+        server.shutdown()